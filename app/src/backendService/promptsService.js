@@ -1,5 +1,27 @@
 const BASE_URL = "https://ai-email-enhancer.vercel.app";
 
+// the backend keeps Email Agent chat history per (session_id, email), so each browser gets its own id
+let fallbackSessionId = null;
+const newSessionId = () =>
+  (window.crypto && window.crypto.randomUUID)
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
+export const getSessionId = () => {
+  try {
+    let id = localStorage.getItem('agentSessionId');
+    if (!id) {
+      id = newSessionId();
+      localStorage.setItem('agentSessionId', id);
+    }
+    return id;
+  } catch (e) {
+    // storage blocked: keep one id for this page load
+    fallbackSessionId = fallbackSessionId || newSessionId();
+    return fallbackSessionId;
+  }
+};
+
 export const getPrompts = async () => {
   const res = await fetch(`${BASE_URL}/prompts`);
   return await res.json();
@@ -23,7 +45,7 @@ export const processEmail = async (email) => {
   const res = await fetch(`${BASE_URL}/process-email`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(email)
+    body: JSON.stringify({ session_id: getSessionId(), ...email })
   });
   return await res.json();
 }
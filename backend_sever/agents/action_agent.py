@@ -1,13 +1,13 @@
-import json
 from langchain_core.prompts import PromptTemplate
 import os
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
+from agents.llm_client import get_llm, get_escalation_llm
+from agents.structured_output import JSON_MODE, tolerate_json_failures, JsonObject, complete_structured, acomplete_structured
 
-llm = ChatGroq(
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.1,
-)
+llm = tolerate_json_failures(get_llm("action_item", temperature=0.1).bind(**JSON_MODE), "action_item")
+# re-asks go to the large model when extraction is routed to a smaller one
+reask_llm = tolerate_json_failures(
+    (get_escalation_llm("action_item", temperature=0.1) or get_llm("action_item", temperature=0.1)).bind(**JSON_MODE), "action_item")
 
 load_dotenv()
 
@@ -30,19 +30,30 @@ Subject: {subject}
 Body: {body}
 """)
 
-def run_action_extraction(subject: str, body: str, action_prompt: str):
-    prompt = action_item_prompt_template.format(
+def _format_prompt(subject: str, body: str, action_prompt: str):
+    return action_item_prompt_template.format(
         fields_requested=action_prompt,
         subject=subject,
         body=body
     )
 
-    result = llm.invoke(prompt)
-    text = result.content.strip()
 
-    try:
-        return json.loads(text)
-    except:
-        return []
+def finish_action_extraction(subject: str, body: str, action_prompt: str, text: str):
+    """Validated actions from a raw reply: repaired locally, or re-asked once; None if still unusable."""
+    prompt = _format_prompt(subject, body, action_prompt)
+    return complete_structured(text, JsonObject, "action_item", prompt, reask_llm)
+
+
+async def afinish_action_extraction(subject: str, body: str, action_prompt: str, text: str):
+    prompt = _format_prompt(subject, body, action_prompt)
+    return await acomplete_structured(text, JsonObject, "action_item", prompt, reask_llm)
+
+
+def run_action_extraction(subject: str, body: str, action_prompt: str):
+    result = llm.invoke(_format_prompt(subject, body, action_prompt))
+    return finish_action_extraction(subject, body, action_prompt, result.content)
 
 
+async def arun_action_extraction(subject: str, body: str, action_prompt: str):
+    result = await llm.ainvoke(_format_prompt(subject, body, action_prompt))
+    return await afinish_action_extraction(subject, body, action_prompt, result.content)
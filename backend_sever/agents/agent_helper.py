@@ -1,51 +1,72 @@
 import json
 import os
+import asyncio
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
+from agents.llm_client import get_llm
+from agents.session_store import sessions, DEFAULT_SESSION
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
 load_dotenv()
 
-llm = ChatGroq(
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.1,
-)
-
-MESSAGE_HISTORY = []
-LAST_ID = None
+llm = get_llm("chat", temperature=0.1)
 
-def ask_agent(subject: str, body_text: str, prompt: str, timestamp: str, id: str):
-    global MESSAGE_HISTORY, LAST_ID
+SYSTEM_PROMPT = (
+    "You are an AI assistant that processes emails strictly based on the user instructions. "
+    "Never assume anything outside the email."
+)
 
-    if LAST_ID != id:
-        MESSAGE_HISTORY = [
-            SystemMessage(
-                content="You are an AI assistant that processes emails strictly based on the user instructions. "
-                        "Never assume anything outside the email."
-            )
-        ]
-        LAST_ID = id
 
-    MESSAGE_HISTORY.append(
-        HumanMessage(
-            content=f"""
-INSTRUCTIONS: {prompt}
+def _build_messages(subject: str, body_text: str, prompt: str, timestamp: str, summary: str, turns: list,
+                    thread_summary: str = ""):
+    # the email goes in once per request instead of once per stored turn
+    thread = f"\nEARLIER IN THIS THREAD (summary):\n{thread_summary}\n" if thread_summary else ""
+    messages = [
+        SystemMessage(
+            content=f"""{SYSTEM_PROMPT}
 
 EMAIL DETAILS:
 Subject: {subject}
 Body: {body_text}
 Timestamp: {timestamp}
+{thread}"""
+        )
+    ]
+    if summary:
+        messages.append(SystemMessage(content=f"Summary of the earlier conversation about this email:\n{summary}"))
+    for turn in turns:
+        message_cls = HumanMessage if turn["role"] == "user" else AIMessage
+        messages.append(message_cls(content=turn["content"]))
+
+    messages.append(
+        HumanMessage(
+            content=f"""
+INSTRUCTIONS: {prompt}
 
 Follow instructions EXACTLY.
  Do NOT invent or guess missing information.if it is out of context say user to stict to email content only.
 """
         )
     )
+    return messages
 
-    response = llm.invoke(MESSAGE_HISTORY)
-
-    MESSAGE_HISTORY.append(
-        AIMessage(content=response.content)
-    )
 
+async def aask_agent(subject: str, body_text: str, prompt: str, timestamp: str, id: str, session_id: str = DEFAULT_SESSION,
+                     thread_summary: str = ""):
+    summary, turns = await asyncio.to_thread(sessions.history, session_id, id)
+    messages = _build_messages(subject, body_text, prompt, timestamp, summary, turns, thread_summary)
+    response = await llm.ainvoke(messages)
+    await asyncio.to_thread(sessions.append, session_id, id, prompt, response.content)
     return response.content.strip()
+
+
+async def astream_agent(subject: str, body_text: str, prompt: str, timestamp: str, id: str, session_id: str = DEFAULT_SESSION,
+                        thread_summary: str = ""):
+    """Yields the reply token by token; the full reply joins the history once it is complete."""
+    summary, turns = await asyncio.to_thread(sessions.history, session_id, id)
+    messages = _build_messages(subject, body_text, prompt, timestamp, summary, turns, thread_summary)
+    parts = []
+    async for chunk in llm.astream(messages):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
+    await asyncio.to_thread(sessions.append, session_id, id, prompt, "".join(parts))
@@ -0,0 +1,104 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.prompts import PromptTemplate
+from dotenv import load_dotenv
+from agents.llm_client import get_llm
+from rag.tokens import estimate_tokens
+from agents.categorization_agent import categorization_prompt_template
+from agents.fused_agent import FusedResult, EXPECTED_OUTPUT_TOKENS
+from agents.structured_output import JSON_MODE, tolerate_json_failures, JsonObject, parse_json_output, validate_output
+from agents.model_router import metrics, route_model
+
+load_dotenv()
+
+# prompt + expected completion tokens allowed per batched request
+BATCH_PROMPT_TOKENS = int(os.getenv("BATCH_PROMPT_TOKENS", "6000"))
+BATCH_MAX_EMAILS = int(os.getenv("BATCH_MAX_EMAILS", "20"))
+
+llm = tolerate_json_failures(get_llm("batch", temperature=0.1).bind(**JSON_MODE), "batch")
+
+batch_prompt_template = PromptTemplate.from_template(
+    """You are an AI that categorizes emails and extracts structured information from each of them.
+
+CATEGORY INSTRUCTIONS:
+{categorization_prompt}
+
+EXTRACTION INSTRUCTIONS:
+{fields_requested}
+
+Handle every email below independently. Return ONLY a JSON object with one entry per email id:
+{{"<email id>": {{"category": "<category name only>", "actions": {{<the fields requested above>}}}}, ...}}
+If a requested field is not found in an email, use an empty string for it.
+
+{emails}
+""")
+
+EMAIL_BLOCK = "### Email id: {id}\nSubject: {subject}\nBody: {body}\n"
+
+
+def email_cost(subject: str, body: str) -> int:
+    """Tokens one email adds to a batch: its rendered single-email prompt plus its share of the answer."""
+    rendered = categorization_prompt_template.format(categorization_prompt="", subject=subject, body=body)
+    return estimate_tokens(rendered) + EXPECTED_OUTPUT_TOKENS
+
+
+def _overhead(prompts: dict) -> int:
+    return estimate_tokens(batch_prompt_template.format(
+        categorization_prompt=prompts["categorization"], fields_requested=prompts["action_item"], emails=""
+    ))
+
+
+def plan_batches(items: List[tuple], prompts: dict, budget: int = BATCH_PROMPT_TOKENS,
+                 max_emails: int = BATCH_MAX_EMAILS) -> List[List[tuple]]:
+    """
+    Greedily packs (email_id, subject, body, ...) items so each batch stays within
+    `budget` tokens; K per batch therefore shrinks for long emails and grows for
+    short ones. An email too large for any batch goes on its own.
+    """
+    overhead = _overhead(prompts)
+    batches, current, used = [], [], overhead
+    for item in items:
+        cost = email_cost(item[1], item[2])
+        duplicate = any(item[0] == other[0] for other in current)
+        if current and (used + cost > budget or len(current) >= max_emails or duplicate):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def batch_tokens(batch: List[Tuple[str, str, str]], prompts: dict) -> int:
+    return _overhead(prompts) + sum(email_cost(item[1], item[2]) for item in batch)
+
+
+def parse_batch_result(text: str, email_ids: List[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    """
+    id -> (category, actions) for every entry that validates; the rest are left
+    out and re-run one by one, which stands in for a re-ask here.
+    """
+    data, _, repaired = parse_json_output(text, JsonObject)
+    if data is None:
+        return {}
+    if repaired:
+        metrics.count("batch", route_model("batch"), "repairs")
+    results = {}
+    for email_id in email_ids:
+        entry, _ = validate_output(data.get(email_id), FusedResult)
+        if entry is not None:
+            results[email_id] = (entry["category"], entry["actions"])
+    return results
+
+
+def run_batch_processing(batch: List[Tuple[str, str, str]], prompts: dict):
+    emails = "\n".join(EMAIL_BLOCK.format(id=email_id, subject=subject, body=body) for email_id, subject, body in batch)
+    prompt = batch_prompt_template.format(
+        categorization_prompt=prompts["categorization"],
+        fields_requested=prompts["action_item"],
+        emails=emails,
+    )
+    result = llm.invoke(prompt)
+    return parse_batch_result(result.content.strip(), [email_id for email_id, _, _ in batch])
@@ -1,14 +1,14 @@
 import json
-from langchain_groq import ChatGroq
+from agents.llm_client import get_llm, get_escalation_llm
+from agents.model_router import record_escalation
 from langchain_core.prompts import PromptTemplate
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-llm = ChatGroq(
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.1,
-)
+llm = get_llm("categorization", temperature=0.1)
+# used when the routed (small) model answers with something that is not a label
+escalation_llm = get_escalation_llm("categorization", temperature=0.1)
 
 categorization_prompt_template = PromptTemplate.from_template("""
 {categorization_prompt}
@@ -21,12 +21,35 @@ Return ONLY the category.
 """)
 
 
-def run_categorization(subject: str, body: str, categorization_prompt: str):
-    prompt = categorization_prompt_template.format(
+def is_valid_category(text: str) -> bool:
+    text = (text or "").strip()
+    return bool(text) and "\n" not in text and len(text) <= 60
+
+
+def _format_prompt(subject: str, body: str, categorization_prompt: str):
+    return categorization_prompt_template.format(
         categorization_prompt=categorization_prompt,
         subject=subject,
         body=body
     )
 
-    result = llm.invoke(prompt)
-    return result.content.strip()
\ No newline at end of file
+
+def escalate_categorization(subject: str, body: str, categorization_prompt: str, category: str) -> str:
+    """Returns `category`, or the large model's answer if `category` is not a valid label."""
+    if is_valid_category(category) or escalation_llm is None:
+        return category.strip()
+    record_escalation("categorization")
+    return escalation_llm.invoke(_format_prompt(subject, body, categorization_prompt)).content.strip()
+
+
+async def aescalate_categorization(subject: str, body: str, categorization_prompt: str, category: str) -> str:
+    if is_valid_category(category) or escalation_llm is None:
+        return category.strip()
+    record_escalation("categorization")
+    result = await escalation_llm.ainvoke(_format_prompt(subject, body, categorization_prompt))
+    return result.content.strip()
+
+
+def run_categorization(subject: str, body: str, categorization_prompt: str):
+    result = llm.invoke(_format_prompt(subject, body, categorization_prompt))
+    return escalate_categorization(subject, body, categorization_prompt, result.content)
\ No newline at end of file
@@ -0,0 +1,81 @@
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.prompts import PromptTemplate
+from pydantic import BaseModel, field_validator
+from dotenv import load_dotenv
+from agents.llm_client import get_llm, get_escalation_llm
+from agents.categorization_agent import is_valid_category
+from agents.structured_output import JSON_MODE, tolerate_json_failures, parse_json_output, complete_structured, acomplete_structured
+
+load_dotenv()
+
+llm = tolerate_json_failures(get_llm("fused", temperature=0.1).bind(**JSON_MODE), "fused")
+# re-asks go to the large model when "fused" is routed to a smaller one
+reask_llm = tolerate_json_failures(
+    (get_escalation_llm("fused", temperature=0.1) or get_llm("fused", temperature=0.1)).bind(**JSON_MODE), "fused")
+
+# rough upper bound on completion tokens for the combined JSON
+EXPECTED_OUTPUT_TOKENS = 150
+
+fused_prompt_template = PromptTemplate.from_template(
+    """You are an AI that categorizes an email and extracts structured information from it in one pass.
+
+CATEGORY INSTRUCTIONS:
+{categorization_prompt}
+
+EXTRACTION INSTRUCTIONS:
+{fields_requested}
+
+Return ONLY a JSON object of this shape:
+{{"category": "<category name only>", "actions": {{<the fields requested above>}}}}
+If a requested field is not found in the email, use an empty string for it.
+
+Email:
+Subject: {subject}
+Body: {body}
+""")
+
+fused_runner = fused_prompt_template | llm
+
+
+class FusedResult(BaseModel):
+    category: str
+    actions: Dict[str, Any]
+
+    @field_validator("category")
+    @classmethod
+    def single_label(cls, value: str) -> str:
+        if not is_valid_category(value):
+            raise ValueError("category must be a single short label")
+        return value.strip()
+
+
+def fused_input(subject: str, body: str, prompts: dict):
+    return {
+        "subject": subject,
+        "body": body,
+        "categorization_prompt": prompts["categorization"],
+        "fields_requested": prompts["action_item"],
+    }
+
+
+def _as_tuple(result: Optional[dict]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    return (result["category"], result["actions"]) if result is not None else None
+
+
+def parse_fused_result(text: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(category, actions), or None when the output does not match FusedResult even after repair."""
+    result, _, _ = parse_json_output(text, FusedResult)
+    return _as_tuple(result)
+
+
+def run_fused_processing(subject: str, body: str, prompts: dict):
+    prompt = fused_prompt_template.format(**fused_input(subject, body, prompts))
+    result = llm.invoke(prompt)
+    return _as_tuple(complete_structured(result.content, FusedResult, "fused", prompt, reask_llm))
+
+
+async def arun_fused_processing(subject: str, body: str, prompts: dict):
+    prompt = fused_prompt_template.format(**fused_input(subject, body, prompts))
+    result = await llm.ainvoke(prompt)
+    return _as_tuple(await acomplete_structured(result.content, FusedResult, "fused", prompt, reask_llm))
@@ -0,0 +1,189 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional, Sequence
+
+from dotenv import load_dotenv
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+from langchain_groq import ChatGroq
+
+from rag.config import CACHE_DIR
+from agents.model_router import route_model, escalation_model, RouteMetricsHandler
+
+load_dotenv()
+
+# point at an OpenAI-compatible stand-in (see benchmarks/stub_llm_server.py) for local runs
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "")
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(CACHE_DIR, "llm_cache.sqlite3"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "false").lower() in ("1", "true", "yes")
+
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_cache(enabled: bool = True):
+    """Skip cache lookups for LLM calls made inside this block (results are still stored)."""
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class ResponseStore:
+    """SQLite table of serialized generations keyed by sha256(llm_string + prompt)."""
+
+    def __init__(self, path: str, ttl: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, agent TEXT, value TEXT,"
+            " size INTEGER, created_at REAL, last_access REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache(last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x1f{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            value, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            return value
+
+    def put(self, key: str, agent: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, agent, value, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, agent, value, size, now, now),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        if self.ttl:
+            self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # drop least recently used entries until we are back under the limit
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall():
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, agent: Optional[str] = None):
+        with self.lock:
+            if agent:
+                self.conn.execute("DELETE FROM llm_cache WHERE agent = ?", (agent,))
+            else:
+                self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "ttl_seconds": self.ttl}
+
+
+_store: Optional[ResponseStore] = None
+_store_lock = threading.Lock()
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def _get_store() -> ResponseStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResponseStore(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES)
+        return _store
+
+
+def _count(agent: str, field: str):
+    with _counters_lock:
+        stats = _counters.setdefault(agent, {"hits": 0, "misses": 0, "bypassed": 0})
+        stats[field] += 1
+
+
+class AgentResponseCache(BaseCache):
+    """LangChain cache bound to one agent name so hits/misses are counted per agent."""
+
+    def __init__(self, agent: str):
+        self.agent = agent
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        if LLM_CACHE_DISABLED or _bypass.get():
+            _count(self.agent, "bypassed")
+            return None
+        value = _get_store().get(ResponseStore.make_key(prompt, llm_string))
+        if value is None:
+            _count(self.agent, "misses")
+            return None
+        _count(self.agent, "hits")
+        return loads(value)
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if LLM_CACHE_DISABLED:
+            return
+        _get_store().put(ResponseStore.make_key(prompt, llm_string), self.agent, dumps(list(return_val)))
+
+    def clear(self, **kwargs: Any) -> None:
+        _get_store().clear(self.agent)
+
+
+def get_llm(agent: str, model: Optional[str] = None, temperature: float = 0.1) -> ChatGroq:
+    """Client for one agent, on the model agents/model_router.py routes it to unless `model` is given."""
+    model = model or route_model(agent)
+    options = {"base_url": GROQ_API_BASE} if GROQ_API_BASE else {}
+    return ChatGroq(
+        model_name=model,
+        temperature=temperature,
+        cache=AgentResponseCache(agent),
+        callbacks=[RouteMetricsHandler(agent, model)],
+        **options,
+    )
+
+
+def get_escalation_llm(agent: str, temperature: float = 0.1) -> Optional[ChatGroq]:
+    """Large-model client to retry `agent` with after a validation failure; None if it already runs there."""
+    model = escalation_model(agent)
+    return get_llm(agent, model, temperature) if model else None
+
+
+def get_cache_stats():
+    with _counters_lock:
+        agents = {name: dict(stats) for name, stats in _counters.items()}
+    for stats in agents.values():
+        looked_up = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / looked_up, 3) if looked_up else None
+    return {"enabled": not LLM_CACHE_DISABLED, "agents": agents, "store": _get_store().stats()}
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+
+load_dotenv()
+
+SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "llama-3.1-8b-instant")
+LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "llama-3.3-70b-versatile")
+
+# agent -> "small", "large" or a Groq model id; override one with LLM_ROUTE_<AGENT>
+DEFAULT_ROUTES = {
+    "categorization": "small",
+    "chat_summary": "small",
+    "thread_summary": "small",
+    "action_item": "large",
+    "fused": "large",
+    "batch": "large",
+    "reply_draft": "large",
+    "rag_answer": "large",
+    "chat": "large",
+}
+
+LATENCY_SAMPLES = 500
+
+
+def route_model(agent: str) -> str:
+    route = os.getenv(f"LLM_ROUTE_{agent.upper()}", DEFAULT_ROUTES.get(agent, "large"))
+    return {"small": SMALL_MODEL, "large": LARGE_MODEL}.get(route, route)
+
+
+def escalation_model(agent: str) -> Optional[str]:
+    """The model to retry with when `agent`'s output fails validation, or None if it already is the large one."""
+    model = route_model(agent)
+    return LARGE_MODEL if model != LARGE_MODEL else None
+
+
+class RouteMetrics:
+    """Per (agent, model) call counts, latency and token usage; cache hits are counted but not timed."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(lambda: {
+            "calls": 0, "cached": 0, "errors": 0, "escalations": 0,
+            # structured output: rejected by JSON mode / fixed locally / asked again / unusable after both
+            "json_failures": 0, "repairs": 0, "reasks": 0, "invalid": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "latencies": [],
+        })
+
+    def record(self, agent: str, model: str, latency: float, usage: Optional[Dict[str, int]]):
+        with self.lock:
+            route = self.routes[(agent, model)]
+            if usage is None:
+                route["cached"] += 1
+                return
+            route["calls"] += 1
+            route["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            route["completion_tokens"] += usage.get("completion_tokens", 0)
+            route["latencies"].append(latency)
+            del route["latencies"][:-LATENCY_SAMPLES]
+
+    def count(self, agent: str, model: str, field: str):
+        with self.lock:
+            self.routes[(agent, model)][field] += 1
+
+    def snapshot(self):
+        out = []
+        with self.lock:
+            items = [(key, dict(route, latencies=sorted(route["latencies"]))) for key, route in self.routes.items()]
+        for (agent, model), route in sorted(items):
+            latencies = route.pop("latencies")
+            calls = route["calls"]
+            route.update({
+                "agent": agent,
+                "model": model,
+                "latency_ms_avg": round(1000 * sum(latencies) / len(latencies), 1) if latencies else None,
+                "latency_ms_p95": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else None,
+                "prompt_tokens_avg": round(route["prompt_tokens"] / calls, 1) if calls else None,
+                "completion_tokens_avg": round(route["completion_tokens"] / calls, 1) if calls else None,
+            })
+            out.append(route)
+        return out
+
+
+metrics = RouteMetrics()
+
+
+class RouteMetricsHandler(BaseCallbackHandler):
+    """Times each call of one ChatGroq client and records it under its agent and model."""
+
+    def __init__(self, agent: str, model: str):
+        self.agent = agent
+        self.model = model
+        self.started = {}
+        self.streamed = set()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any):
+        self.started[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs: Any):
+        self.streamed.add(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any):
+        started = self.started.pop(run_id, None)
+        streamed = run_id in self.streamed
+        self.streamed.discard(run_id)
+        if started is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage")
+        if usage is None and streamed:
+            # streamed completions carry no usage block; count the call with zero tokens
+            usage = {}
+        # a cache hit finishes without llm_output
+        metrics.record(self.agent, self.model, time.perf_counter() - started, usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs: Any):
+        self.started.pop(run_id, None)
+        self.streamed.discard(run_id)
+        metrics.count(self.agent, self.model, "errors")
+
+
+def record_escalation(agent: str):
+    metrics.count(agent, route_model(agent), "escalations")
+
+
+def get_route_stats():
+    routes = {agent: route_model(agent) for agent in DEFAULT_ROUTES}
+    return {"small_model": SMALL_MODEL, "large_model": LARGE_MODEL, "routes": routes, "metrics": metrics.snapshot()}
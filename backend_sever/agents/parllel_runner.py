@@ -1,82 +1,391 @@
 import json
+import hashlib
 from langchain_core.runnables import RunnableParallel, RunnableSequence
-from agents.categorization_agent import categorization_prompt_template
-from agents.action_agent import action_item_prompt_template
-from langchain_groq import ChatGroq
-import time
+from agents.categorization_agent import categorization_prompt_template, run_categorization
+from agents.categorization_agent import escalate_categorization, aescalate_categorization
+from agents.action_agent import action_item_prompt_template, run_action_extraction, arun_action_extraction
+from agents.action_agent import finish_action_extraction, afinish_action_extraction
+from agents.structured_output import JSON_MODE, tolerate_json_failures
+from agents.pre_classifier import local_category, record_llm_category
+from agents.fused_agent import fused_prompt_template, fused_input, run_fused_processing, arun_fused_processing
+from agents.fused_agent import EXPECTED_OUTPUT_TOKENS as FUSED_OUTPUT_TOKENS
+from agents.batch_agent import plan_batches, batch_tokens, run_batch_processing
+from agents.llm_client import get_llm, bypass_cache
+from rag.chunking import clean_body
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import os
+import asyncio
 from dotenv import load_dotenv
-from rag.db_client import get_prompts as db_get_prompts, get_emails as db_get_emails, update_email as db_update_email
+from agents.rate_limiter import limiter, call_with_backoff, is_rate_limit_error
+from rag.tokens import estimate_tokens
+from rag.db_client import get_prompts as db_get_prompts, get_emails as db_get_emails, get_emails_by_ids as db_get_emails_by_ids, bulk_update_emails as db_bulk_update_emails
 load_dotenv()
 
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_WRITE_SIZE = int(os.getenv("BATCH_WRITE_SIZE", "100"))
+# "parallel": separate category and action calls; "fused": one JSON call, falling back to parallel
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "parallel")
+# process_all_emails packs several emails into one request (see agents/batch_agent.py)
+BATCH_PROMPTING = os.getenv("BATCH_PROMPTING", "false").lower() in ("1", "true", "yes")
+# rough upper bound on completion tokens for one category / one action JSON
+EXPECTED_OUTPUT_TOKENS = {"category": 20, "actions": 130}
 
-llm = ChatGroq(
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.1,
-)
+
+# separate clients so cache hits/misses are counted per agent; the cache keys
+# match the standalone categorization/action agents
+categorization_llm = get_llm("categorization", temperature=0.1)
+action_llm = tolerate_json_failures(get_llm("action_item", temperature=0.1).bind(**JSON_MODE), "action_item")
 
 
 parallel_runner = RunnableParallel(
-    category = categorization_prompt_template | llm,
-    actions = action_item_prompt_template | llm
+    category = categorization_prompt_template | categorization_llm,
+    actions = action_item_prompt_template | action_llm
 )
-def run_parallel_processing(subject: str, body: str, prompts: dict):
-    input_data = {
+def _parallel_input(subject: str, body: str, prompts: dict):
+    return {
         "subject": subject,
         "body": body,
         "categorization_prompt": prompts["categorization"],
         "fields_requested": prompts["action_item"]
     }
 
+
+def _escalate_parallel_result(result, subject: str, body: str, prompts: dict):
+    # repairs or re-asks whichever half failed validation
+    category = escalate_categorization(subject, body, prompts["categorization"], result["category"].content)
+    action_items = finish_action_extraction(subject, body, prompts["action_item"], result["actions"].content)
+    return category, action_items
+
+
+async def _aescalate_parallel_result(result, subject: str, body: str, prompts: dict):
+    category, action_items = await asyncio.gather(
+        aescalate_categorization(subject, body, prompts["categorization"], result["category"].content),
+        afinish_action_extraction(subject, body, prompts["action_item"], result["actions"].content),
+    )
+    return category, action_items
+
+
+def run_parallel_processing(subject: str, body: str, prompts: dict):
+    input_data = _parallel_input(subject, body, prompts)
+
     full_sequence = RunnableSequence(
         lambda x: input_data,
         parallel_runner
     )
 
     result = full_sequence.invoke(input_data)
+    return _escalate_parallel_result(result, subject, body, prompts)
+
+
+async def arun_parallel_processing(subject: str, body: str, prompts: dict):
+    result = await parallel_runner.ainvoke(_parallel_input(subject, body, prompts))
+    return await _aescalate_parallel_result(result, subject, body, prompts)
 
-    category = result["category"].content.strip()
-    raw_actions = result["actions"].content.strip()
 
+def _categorize_locally(email_id, subject: str, body: str, prompts: dict, agents):
+    """
+    Answers "category" from the pre-classifier when it is confident.
+    Returns (fields, agents still needing the LLM, local guess for agreement stats).
+    """
+    agents = set(agents)
+    if "category" not in agents:
+        return {}, agents, None
+    label, guess = local_category(email_id, subject, body, _short_hash(prompts.get("categorization", "")))
+    if label is None:
+        return {}, agents, guess
+    return {"category": label, "category_source": "local"}, agents - {"category"}, None
+
+
+def _learn_category(email_id, subject: str, body: str, prompts: dict, fields: dict, guess=None):
+    fields["category_source"] = "llm"
+    version = _short_hash(prompts.get("categorization", ""))
+    record_llm_category(email_id, subject, body, fields["category"], version, guess)
+
+
+def _fused_fallback(email_id, error: Exception = None):
+    """Logs why the fused result is not used; rate limit errors are re-raised for the caller to back off."""
+    if error is not None and is_rate_limit_error(error):
+        raise error
+    reason = "output failed validation" if error is None else f"call failed ({str(error)})"
+    where = f" for {email_id}" if email_id else ""
+    print(f"Warning: fused {reason}{where}, falling back to parallel processing")
+
+
+async def arun_email_agents(subject: str, body: str, prompts: dict, mode: str = None, email_id: str = None,
+                            classifier_body: str = None) -> dict:
+    """
+    category, actions and category_source, using the pre-classifier and PROCESSING_MODE.
+    `classifier_body` is the email's own body for the pre-classifier when `body`
+    carries extra context (the thread summary) for the LLM.
+    """
+    classifier_body = body if classifier_body is None else classifier_body
+    fields, agents, guess = await asyncio.to_thread(
+        _categorize_locally, email_id, subject, classifier_body, prompts, ("category", "actions")
+    )
+    if "category" not in agents:
+        fields["actions"] = await arun_action_extraction(subject, body, prompts["action_item"])
+        return fields
+
+    result = None
+    if (mode or PROCESSING_MODE) == "fused":
+        try:
+            result = await arun_fused_processing(subject, body, prompts)
+        except Exception as e:
+            _fused_fallback(email_id, e)
+        else:
+            if result is None:
+                _fused_fallback(email_id)
+    fields["category"], fields["actions"] = result or await arun_parallel_processing(subject, body, prompts)
+    await asyncio.to_thread(_learn_category, email_id, subject, classifier_body, prompts, fields, guess)
+    return fields
+
+
+def _short_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def compute_processing_hashes(email: dict, prompts: dict) -> dict:
+    """Hashes of everything that determines an email's category/actions."""
+    content = "\x1f".join([
+        email.get("subject", "") or "",
+        email.get("body_text", "") or "",
+        email.get("timestamp", "") or "",
+    ])
+    return {
+        "categorization": _short_hash(prompts.get("categorization", "")),
+        "action_item": _short_hash(prompts.get("action_item", "")),
+        "content": _short_hash(content),
+    }
+
+
+def usable_hashes(hashes: dict, fields: dict) -> dict:
+    """processing_hashes to store with `fields`: actions that could not be parsed keep no hash, so they run again."""
+    if "actions" in fields and fields["actions"] is None:
+        return {key: value for key, value in hashes.items() if key != "action_item"}
+    return hashes
+
+
+def stale_agents(email: dict, hashes: dict) -> set:
+    """Which of {"category", "actions"} must be re-run for this email."""
+    stored = email.get("processing_hashes") or {}
+    if stored.get("content") != hashes["content"]:
+        return {"category", "actions"}
+    stale = set()
+    if stored.get("categorization") != hashes["categorization"]:
+        stale.add("category")
+    if stored.get("action_item") != hashes["action_item"]:
+        stale.add("actions")
+    return stale
+
+
+def estimate_email_tokens(subject: str, body: str, prompts: dict, agents=("category", "actions"), fused: bool = False) -> int:
+    if fused:
+        fused_prompt = fused_prompt_template.format(**fused_input(subject, body, prompts))
+        return estimate_tokens(fused_prompt) + FUSED_OUTPUT_TOKENS
+    total = 0
+    if "category" in agents:
+        category_prompt = categorization_prompt_template.format(
+            categorization_prompt=prompts["categorization"], subject=subject, body=body
+        )
+        total += estimate_tokens(category_prompt) + EXPECTED_OUTPUT_TOKENS["category"]
+    if "actions" in agents:
+        action_prompt = action_item_prompt_template.format(
+            fields_requested=prompts["action_item"], subject=subject, body=body
+        )
+        total += estimate_tokens(action_prompt) + EXPECTED_OUTPUT_TOKENS["actions"]
+    return total
+
+
+def process_one_email(email: dict, prompts: dict, agents=("category", "actions"), refresh: bool = False) -> dict:
+    """Runs only the requested agents and returns the fields to store."""
+    with bypass_cache(refresh):
+        return _run_agents(email, prompts, agents)
+
+
+def _email_text(email: dict):
+    # quoted history is classified with the email it came from
+    subject = email.get("subject", "")
+    body = clean_body(email.get("body_text", ""))
+    time_stamp = email.get("timestamp", "")
+    return subject, body + "\n\nTimestamp: " + time_stamp
+
+
+def process_email_batch(emails: list, prompts: dict, refresh: bool = False) -> list:
+    """
+    Categorizes and extracts several emails in one request. Returns
+    [(email, fields or exception)]; emails missing from the model's answer, or
+    whose entry fails validation, are re-run one at a time.
+    """
+    with bypass_cache(refresh):
+        batch = [(email.get("id"), *_email_text(email)) for email in emails]
+        limiter.acquire(batch_tokens(batch, prompts), requests=1)
+        try:
+            results = call_with_backoff(run_batch_processing, batch, prompts)
+        except Exception as e:
+            print(f"Warning: batched request failed, processing {len(batch)} emails individually: {str(e)}")
+            results = {}
+
+        out = []
+        for email in emails:
+            if email.get("id") in results:
+                category, action_items = results[email.get("id")]
+                fields = {"category": category, "actions": action_items}
+                # the batch labels every email anyway, so the pre-classifier only learns here
+                _learn_category(email.get("id"), *_email_text(email), prompts, fields)
+                out.append((email, fields))
+                continue
+            try:
+                out.append((email, _run_agents(email, prompts, ("category", "actions"))))
+            except Exception as e:
+                out.append((email, e))
+        return out
+
+
+def _process_single(email: dict, prompts: dict, agents, refresh: bool) -> list:
     try:
-        action_items = json.loads(raw_actions)
-    except:
-        action_items = []
+        return [(email, process_one_email(email, prompts, agents, refresh))]
+    except Exception as e:
+        return [(email, e)]
 
-    return category, action_items
 
-def process_all_emails():
+def _run_agents(email: dict, prompts: dict, agents) -> dict:
+    subject, body = _email_text(email)
+    fields, agents, guess = _categorize_locally(email.get("id"), subject, body, prompts, agents)
+
+    both = "category" in agents and "actions" in agents
+    result = None
+    if both and PROCESSING_MODE == "fused":
+        limiter.acquire(estimate_email_tokens(subject, body, prompts, fused=True), requests=1)
+        try:
+            result = call_with_backoff(run_fused_processing, subject, body, prompts)
+        except Exception as e:
+            _fused_fallback(email.get("id"), e)
+        else:
+            if result is None:
+                _fused_fallback(email.get("id"))
+
+    if result is not None:
+        fields["category"], fields["actions"] = result
+    elif agents:
+        limiter.acquire(estimate_email_tokens(subject, body, prompts, agents), requests=len(agents))
+        if both:
+            category, action_items = call_with_backoff(run_parallel_processing, subject, body, prompts)
+            fields["category"] = category
+            fields["actions"] = action_items
+        elif "category" in agents:
+            fields["category"] = call_with_backoff(run_categorization, subject, body, prompts["categorization"])
+        elif "actions" in agents:
+            fields["actions"] = call_with_backoff(run_action_extraction, subject, body, prompts["action_item"])
+
+    if "category" in agents:
+        _learn_category(email.get("id"), subject, body, prompts, fields, guess)
+    return fields
+
+
+def process_all_emails(workers: int = None, email_ids: list = None, on_progress=None,
+                       should_cancel=None, write_batch_size: int = None, force: bool = False,
+                       batch_prompting: bool = None):
+    """
+    Only emails whose stored processing_hashes are stale are sent to the LLM,
+    and only through the agent whose prompt changed; pass force=True to
+    re-run both agents on every email, bypassing the LLM response cache.
+
+    With batch_prompting (default BATCH_PROMPTING), emails that need both
+    agents are packed several per request, sized to BATCH_PROMPT_TOKENS.
+
+    on_progress(done_ids, failed) is called after every DB flush, so callers
+    see results as soon as they land in mock_emails. should_cancel() is polled
+    between emails; once it returns True the remaining emails are skipped.
+    """
     prompts = db_get_prompts()
     try:
-        emails = db_get_emails()
+        emails = db_get_emails() if email_ids is None else db_get_emails_by_ids(email_ids)
     except Exception:
         return {"success": False, "message": "Cannot read emails from DB"}
 
-    updated_emails = []
+    work = []
+    skipped_ids = []
     for email in emails:
-        time.sleep(2)
-        email_id = email.get("id")
-        subject = email.get("subject", "")
-        body = email.get("body_text", "")
-        time_stamp = email.get("timestamp", "")
-        body = body + "\n\nTimestamp: " + time_stamp
-        category, action_items = run_parallel_processing(subject, body, prompts)
-        email["category"] = category
-        email["actions"] = action_items
-
-        # persist per-email updates to DB
-        if email_id:
+        hashes = compute_processing_hashes(email, prompts)
+        agents = {"category", "actions"} if force else stale_agents(email, hashes)
+        if agents:
+            work.append((email, agents, hashes))
+        else:
+            skipped_ids.append(email.get("id"))
+    if on_progress and skipped_ids:
+        on_progress(skipped_ids, [])
+
+    batch_size = write_batch_size or BATCH_WRITE_SIZE
+    pending_writes = []
+    pending_failed = []
+    failed = []
+    unwritten = set()
+    cancelled = False
+
+    def flush():
+        if pending_writes:
             try:
-                db_update_email(email_id, {"category": category, "actions": action_items})
-            except Exception:
-                pass
+                db_bulk_update_emails(pending_writes)
+            except Exception as e:
+                print(f"Warning: Failed to write {len(pending_writes)} processed emails: {str(e)}")
+                for email_id, _ in pending_writes:
+                    error = {"id": email_id, "error": f"write failed: {str(e)}"}
+                    failed.append(error)
+                    pending_failed.append(error)
+                    unwritten.add(email_id)
+                pending_writes.clear()
+        if on_progress and (pending_writes or pending_failed):
+            on_progress([email_id for email_id, _ in pending_writes], list(pending_failed))
+        pending_writes.clear()
+        pending_failed.clear()
+
+    hashes_of = {id(email): hashes for email, _, hashes in work}
+    if BATCH_PROMPTING if batch_prompting is None else batch_prompting:
+        both = [email for email, agents, _ in work if agents == {"category", "actions"}]
+        single = [(email, agents) for email, agents, _ in work if agents != {"category", "actions"}]
+        batches = plan_batches([(email.get("id"), *_email_text(email), email) for email in both], prompts)
+        tasks = [(process_email_batch, [item[3] for item in b], prompts, force) for b in batches]
+    else:
+        single = [(email, agents) for email, agents, _ in work]
+        tasks = []
+    tasks += [(_process_single, email, prompts, agents, force) for email, agents in single]
+
+    with ThreadPoolExecutor(max_workers=workers or BATCH_WORKERS) as pool:
+        futures = [pool.submit(*task) for task in tasks]
+        for future in as_completed(futures):
+            if not cancelled and should_cancel and should_cancel():
+                cancelled = True
+                for f in futures:
+                    f.cancel()
+            if future.cancelled():
+                continue
 
-        updated_emails.append(email)
+            for email, fields in future.result():
+                if isinstance(fields, Exception):
+                    error = {"id": email.get("id"), "error": str(fields)}
+                    failed.append(error)
+                    pending_failed.append(error)
+                    continue
+
+                fields["processing_hashes"] = usable_hashes(hashes_of[id(email)], fields)
+                if fields.get("actions", {}) is None:
+                    # the stored actions stay; the missing hash makes the next run retry
+                    del fields["actions"]
+                email.update(fields)
+                email["_done"] = True
+                pending_writes.append((email.get("id"), fields))
+                if len(pending_writes) >= batch_size:
+                    flush()
+    flush()
+
+    updated_emails = [e for e in emails if e.pop("_done", False) and e.get("id") not in unwritten]
 
     return {
         "success": True,
+        "cancelled": cancelled,
         "total_processed": len(updated_emails),
+        "skipped": len(skipped_ids),
+        "failed": failed,
         "data": updated_emails
     }
-
@@ -0,0 +1,181 @@
+import os
+import random
+import threading
+from collections import defaultdict
+from typing import Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from rag.chunking import clean_body
+from rag.embedding import embed_texts
+from rag.db_client import get_labelled_emails
+
+load_dotenv()
+
+PRECLASSIFIER_ENABLED = os.getenv("PRECLASSIFIER_ENABLED", "false").lower() in ("1", "true", "yes")
+PRECLASSIFIER_K = int(os.getenv("PRECLASSIFIER_K", "7"))
+# weighted share of the k neighbours that must agree before the LLM is skipped
+PRECLASSIFIER_THRESHOLD = float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.85"))
+# the nearest neighbour must be at least this similar, so unfamiliar mail goes to the LLM
+PRECLASSIFIER_MIN_SIMILARITY = float(os.getenv("PRECLASSIFIER_MIN_SIMILARITY", "0.6"))
+# LLM-labelled emails required (under the current categorization prompt) before predicting
+PRECLASSIFIER_MIN_EXAMPLES = int(os.getenv("PRECLASSIFIER_MIN_EXAMPLES", "50"))
+# share of confident predictions still sent to the LLM to measure agreement
+PRECLASSIFIER_AUDIT_RATE = float(os.getenv("PRECLASSIFIER_AUDIT_RATE", "0.05"))
+
+MAX_TEXT_CHARS = 2000
+
+
+def classifier_text(subject: str, body: str) -> str:
+    """`body` is the stored body_text; training and prediction both embed its clean_body."""
+    body = clean_body((body or "").split("\n\nTimestamp:")[0])
+    return f"Subject: {subject or ''}\n{body}"[:MAX_TEXT_CHARS]
+
+
+class PreClassifier:
+    """
+    Embedding kNN over emails the LLM has already categorized.
+
+    Examples are tied to the categorization prompt they were labelled under:
+    when the prompt hash changes the model starts again from the emails already
+    re-labelled with the new prompt, and grows as the LLM labels more. Labels
+    the classifier produced itself are never used for training.
+    """
+
+    def __init__(self, k: int = PRECLASSIFIER_K, threshold: float = PRECLASSIFIER_THRESHOLD,
+                 min_similarity: float = PRECLASSIFIER_MIN_SIMILARITY, min_examples: int = PRECLASSIFIER_MIN_EXAMPLES):
+        self.k = k
+        self.threshold = threshold
+        self.min_similarity = min_similarity
+        self.min_examples = min_examples
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.version = None
+        self.row_of = {}
+        self.labels = []
+        self.vectors = None
+        self.stats = defaultdict(int)
+
+    def _ensure_version(self, version: str):
+        if version == self.version:
+            return
+        # one rebuild per prompt change, however many workers notice it at once
+        with self.build_lock:
+            if version == self.version:
+                return
+            emails = get_labelled_emails(version)
+            texts = [classifier_text(e.get("subject"), e.get("body_text")) for e in emails]
+            vectors = self._normalize(embed_texts(texts)) if texts else None
+            with self.lock:
+                self.version = version
+                self.row_of = {e["id"]: i for i, e in enumerate(emails)}
+                self.labels = [e["category"] for e in emails]
+                self.vectors = vectors
+                self.stats["retrains"] += 1
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        mat = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return mat / norms
+
+    def predict(self, subject: str, body: str, version: str) -> Tuple[Optional[str], float]:
+        """(best label, confidence); label is None with too few examples or no similar email."""
+        self._ensure_version(version)
+        with self.lock:
+            if self.vectors is None or len(self.labels) < self.min_examples:
+                return None, 0.0
+            vectors, labels = self.vectors, list(self.labels)
+
+        q = self._normalize(embed_texts([classifier_text(subject, body)]))[0]
+        sims = vectors @ q
+        k = min(self.k, len(labels))
+        top = np.argpartition(-sims, k - 1)[:k]
+        if sims[top].max() < self.min_similarity:
+            return None, 0.0
+
+        votes = defaultdict(float)
+        for row in top:
+            votes[labels[row]] += max(float(sims[row]), 0.0)
+        label, weight = max(votes.items(), key=lambda item: item[1])
+        return label, weight / (sum(votes.values()) or 1.0)
+
+    def observe(self, email_id: str, subject: str, body: str, label: str, version: str):
+        """Adds an LLM label as a training example for `version`."""
+        if not label or not email_id:
+            return
+        vector = self._normalize(embed_texts([classifier_text(subject, body)]))
+        with self.lock:
+            if version != self.version:
+                return
+            row = self.row_of.get(email_id)
+            if row is not None:
+                self.vectors[row] = vector[0]
+                self.labels[row] = label
+            else:
+                self.row_of[email_id] = len(self.labels)
+                self.labels.append(label)
+                self.vectors = vector if self.vectors is None else np.vstack([self.vectors, vector])
+
+    def count(self, field: str):
+        with self.lock:
+            self.stats[field] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            examples = len(self.labels)
+        routed = stats.get("local", 0) + stats.get("llm", 0)
+        audited = stats.get("audit_agree", 0) + stats.get("audit_disagree", 0)
+        fallback = stats.get("fallback_agree", 0) + stats.get("fallback_disagree", 0)
+        return {
+            "enabled": PRECLASSIFIER_ENABLED,
+            "examples": examples,
+            "answered_locally": stats.get("local", 0),
+            "sent_to_llm": stats.get("llm", 0),
+            "hit_rate": round(stats.get("local", 0) / routed, 3) if routed else None,
+            # confident predictions the LLM also labelled (PRECLASSIFIER_AUDIT_RATE)
+            "agreement_rate": round(stats.get("audit_agree", 0) / audited, 3) if audited else None,
+            # low-confidence guesses vs the LLM label they deferred to
+            "low_confidence_agreement_rate": round(stats.get("fallback_agree", 0) / fallback, 3) if fallback else None,
+            "retrains": stats.get("retrains", 0),
+            "errors": stats.get("errors", 0),
+        }
+
+
+pre_classifier = PreClassifier()
+
+
+def local_category(email_id: str, subject: str, body: str, version: str):
+    """
+    Category from the local tier, or None to ask the LLM. The second value is the
+    local guess to pass back to record_llm_category for agreement stats.
+    """
+    if not PRECLASSIFIER_ENABLED:
+        return None, None
+    try:
+        label, confidence = pre_classifier.predict(subject, body, version)
+    except Exception as e:
+        print(f"Warning: pre-classifier failed for {email_id}: {str(e)}")
+        pre_classifier.count("errors")
+        return None, None
+    confident = label is not None and confidence >= pre_classifier.threshold
+    if confident and random.random() >= PRECLASSIFIER_AUDIT_RATE:
+        pre_classifier.count("local")
+        return label, None
+    pre_classifier.count("llm")
+    return None, ("audit" if confident else "fallback", label)
+
+
+def record_llm_category(email_id: str, subject: str, body: str, category: str, version: str, guess=None):
+    if not PRECLASSIFIER_ENABLED:
+        return
+    if guess is not None and guess[1] is not None:
+        pre_classifier.count(f"{guess[0]}_{'agree' if guess[1] == category else 'disagree'}")
+    try:
+        pre_classifier.observe(email_id, subject, body, category, version)
+    except Exception as e:
+        print(f"Warning: pre-classifier could not learn from {email_id}: {str(e)}")
+        pre_classifier.count("errors")
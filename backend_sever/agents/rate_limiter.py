@@ -0,0 +1,99 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Groq quota for the account; defaults match the free tier of llama-3.3-70b
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "12000"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "5"))
+GROQ_BACKOFF_BASE = float(os.getenv("GROQ_BACKOFF_BASE", "1.0"))
+GROQ_BACKOFF_MAX = float(os.getenv("GROQ_BACKOFF_MAX", "30.0"))
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute`, holds at most `per_minute` units."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        self._refill()
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Blocks callers until both the request and token budgets allow the call."""
+
+    def __init__(self, rpm: int = GROQ_RPM, tpm: int = GROQ_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int, requests: int = 1):
+        while True:
+            with self.lock:
+                wait = max(self.requests.wait_time(requests), self.tokens.wait_time(tokens))
+                if wait == 0:
+                    self.requests.take(requests)
+                    self.tokens.take(tokens)
+                    return
+            time.sleep(wait)
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    msg = str(e).lower()
+    return "429" in msg or "rate limit" in msg or "rate_limit" in msg
+
+
+def call_with_backoff(fn, *args, retries: int = GROQ_MAX_RETRIES, **kwargs):
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not is_rate_limit_error(e):
+                raise
+            # full jitter: sleep uniformly in [0, base * 2^attempt]
+            delay = min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * (2 ** attempt))
+            time.sleep(random.uniform(0, delay))
+            attempt += 1
+
+
+async def acall_with_backoff(fn, *args, retries: int = GROQ_MAX_RETRIES, **kwargs):
+    """call_with_backoff for coroutine functions; the wait does not block the event loop."""
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not is_rate_limit_error(e):
+                raise
+            delay = min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * (2 ** attempt))
+            await asyncio.sleep(random.uniform(0, delay))
+            attempt += 1
+
+
+limiter = RateLimiter()
@@ -1,14 +1,16 @@
-import json
 from langchain_core.prompts import PromptTemplate
 import os
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from rag.db_client import get_prompts as db_get_prompts
+from agents.llm_client import get_llm, get_escalation_llm
+from agents.structured_output import JSON_MODE, tolerate_json_failures, ReplyDraft, acomplete_structured
+from rag.db_client import aget_prompts as db_aget_prompts
 
-llm = ChatGroq(
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.1,
-)
+llm = get_llm("reply_draft", temperature=0.1).bind(**JSON_MODE)
+# invoke through json_llm; llm itself is kept for token streaming
+json_llm = tolerate_json_failures(llm, "reply_draft")
+# re-asks go to the large model when drafting is routed to a smaller one
+reask_llm = tolerate_json_failures(
+    (get_escalation_llm("reply_draft", temperature=0.1) or get_llm("reply_draft", temperature=0.1)).bind(**JSON_MODE), "reply_draft")
 
 load_dotenv()
 
@@ -36,19 +38,29 @@ Do not include explanations, comments, or text outside the JSON.
 """)
 
 
-def generate_reply_draft(subject: str, body: str, prompt: str):
-    # refresh prompts from DB
-    prompts = db_get_prompts()
+def _format_reply_prompt(subject: str, body: str, prompt: str, prompts: dict):
     if prompt == "reply_prompt":
         r_p = prompts.get("auto_reply")
     else:
         r_p = prompt
 
-    formatted_prompt = reply_draft_prompt_template.format(
+    return reply_draft_prompt_template.format(
         subject=subject,
         body=body,
         prompt=r_p
     )
 
-    res = llm.invoke(formatted_prompt)
-    return res.content.strip()
+
+async def agenerate_reply_draft(subject: str, body: str, prompt: str):
+    """{"subject", "body"}, or None if the model's JSON is unusable even after one re-ask."""
+    prompts = await db_aget_prompts()
+    reply_prompt = _format_reply_prompt(subject, body, prompt, prompts)
+    res = await json_llm.ainvoke(reply_prompt)
+    return await acomplete_structured(res.content, ReplyDraft, "reply_draft", reply_prompt, reask_llm)
+
+
+async def astream_reply_draft(subject: str, body: str, prompt: str):
+    prompts = await db_aget_prompts()
+    async for chunk in llm.astream(_format_reply_prompt(subject, body, prompt, prompts)):
+        if chunk.content:
+            yield chunk.content
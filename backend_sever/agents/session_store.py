@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+from agents.llm_client import get_llm
+from rag.tokens import estimate_tokens
+from rag.db_client import get_session, append_session_turns, compact_session
+
+load_dotenv()
+
+# conversations kept in memory before the least recently used one is dropped
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+# prompt tokens allowed for earlier turns (summary included); the email itself is not counted
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "2000"))
+# store turns in Mongo so every uvicorn worker sees the same conversation
+SESSION_PERSIST = os.getenv("SESSION_PERSIST", "false").lower() in ("1", "true", "yes")
+# fold turns that fall out of the budget into a running summary instead of dropping them
+SESSION_SUMMARIZE = os.getenv("SESSION_SUMMARIZE", "true").lower() in ("1", "true", "yes")
+
+DEFAULT_SESSION = "default"
+
+_summary_llm = None
+_summary_lock = threading.Lock()
+
+
+def _get_summary_llm():
+    global _summary_llm
+    with _summary_lock:
+        if _summary_llm is None:
+            _summary_llm = get_llm("chat_summary", temperature=0)
+        return _summary_llm
+
+
+def summarize_turns(summary: str, turns: List[Dict[str, str]]) -> str:
+    transcript = "\n".join(f"{t['role'].upper()}: {t['content']}" for t in turns)
+    prompt = f"""
+Condense this conversation about an email into a short summary (at most 120 words).
+Keep the user's instructions, decisions and any facts the assistant stated; drop pleasantries.
+
+EARLIER SUMMARY:
+{summary or "(none)"}
+
+NEW TURNS:
+{transcript}
+
+SUMMARY:
+"""
+    return _get_summary_llm().invoke(prompt).content.strip()
+
+
+def _tokens(turn: Dict[str, str]) -> int:
+    return estimate_tokens(turn["content"])
+
+
+def split_to_budget(summary: str, turns: List[Dict[str, str]], budget: int) -> Tuple[list, list]:
+    """(dropped, kept): the newest user/assistant pairs that fit in `budget` are kept."""
+    used = estimate_tokens(summary) if summary else 0
+    keep_from = len(turns)
+    # walk back a pair at a time so a user turn never loses its answer
+    for start in range(len(turns) - 2, -1, -2):
+        cost = _tokens(turns[start]) + _tokens(turns[start + 1])
+        if used + cost > budget:
+            break
+        used += cost
+        keep_from = start
+    return turns[:keep_from], turns[keep_from:]
+
+
+class SessionStore:
+    """
+    Chat history per (session id, email id): a running summary plus the recent turns,
+    each turn a {"role": "user" | "assistant", "content": ...} dict.
+
+    Sessions live in an in-process LRU, or in the Mongo chat_sessions collection
+    when persist=True. Writes there are atomic $push/compare-and-set updates, so
+    several workers can share a conversation without overwriting each other.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX, token_budget: int = SESSION_TOKEN_BUDGET,
+                 persist: bool = SESSION_PERSIST, summarize: bool = SESSION_SUMMARIZE):
+        self.max_sessions = max_sessions
+        self.token_budget = token_budget
+        self.persist = persist
+        self.summarize = summarize
+        self.sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(session_id: str, email_id: str) -> str:
+        return f"{session_id}\x1f{email_id}"
+
+    def _load(self, key: str) -> dict:
+        if self.persist:
+            doc = get_session(key) or {}
+            return {"summary": doc.get("summary", ""), "turns": doc.get("turns", []), "version": doc.get("version", 0)}
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                return {"summary": "", "turns": [], "version": 0}
+            self.sessions.move_to_end(key)
+            return {"summary": session["summary"], "turns": list(session["turns"]), "version": session["version"]}
+
+    def _compact(self, key: str, version: int, summary: str, turns: list) -> bool:
+        if self.persist:
+            return compact_session(key, version, summary, turns, datetime.utcnow())
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None or session["version"] != version:
+                return False
+            session.update(summary=summary, turns=list(turns), version=version + 1)
+            return True
+
+    def history(self, session_id: str, email_id: str) -> Tuple[str, List[Dict[str, str]]]:
+        """Summary and turns for the next prompt, compacted to the token budget first."""
+        key = self.make_key(session_id, email_id)
+        session = self._load(key)
+        summary, turns = session["summary"], session["turns"]
+        dropped, kept = split_to_budget(summary, turns, self.token_budget)
+        if not dropped:
+            return summary, turns
+
+        if self.summarize:
+            try:
+                summary = summarize_turns(summary, dropped)
+            except Exception as e:
+                print(f"Warning: Failed to summarize chat history: {str(e)}")
+        # if another worker appended meanwhile, use this result once and let the next turn compact
+        self._compact(key, session["version"], summary, kept)
+        return summary, kept
+
+    def append(self, session_id: str, email_id: str, user: str, assistant: str):
+        key = self.make_key(session_id, email_id)
+        turns = [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+        if self.persist:
+            append_session_turns(key, session_id, email_id, turns, datetime.utcnow())
+            return
+        with self.lock:
+            session = self.sessions.setdefault(key, {"summary": "", "turns": [], "version": 0})
+            session["turns"].extend(turns)
+            session["version"] += 1
+            self.sessions.move_to_end(key)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+
+sessions = SessionStore()
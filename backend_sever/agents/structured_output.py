@@ -0,0 +1,162 @@
+"""Shared parsing for agents that must answer with JSON: local repair, schema check, one re-ask"""
+import json
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from agents.model_router import metrics, route_model
+
+# Groq JSON mode: the completion is constrained to a single JSON object
+JSON_MODE = {"response_format": {"type": "json_object"}}
+
+# a JSON object whose keys are chosen by the user's prompt (action items)
+JsonObject = TypeAdapter(Dict[str, Any])
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+
+MAX_ECHO_CHARS = 2000
+
+
+class ReplyDraft(BaseModel):
+    subject: str
+    body: str
+
+
+def _repair(text: str) -> Optional[Any]:
+    """Strips code fences, then decodes the first JSON object or array found in the text."""
+    fenced = _FENCE.search(text)
+    candidates = [fenced.group(1)] if fenced else []
+    candidates.append(text)
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        for match in re.finditer(r"[\{\[]", candidate):
+            try:
+                value, _ = decoder.raw_decode(candidate, match.start())
+                return value
+            except ValueError:
+                continue
+    return None
+
+
+def validate_output(value: Any, schema) -> Tuple[Optional[Any], Optional[str]]:
+    if schema is None:
+        return value, None
+    try:
+        if isinstance(schema, TypeAdapter):
+            return schema.validate_python(value), None
+        return schema.model_validate(value).model_dump(), None
+    except ValidationError as e:
+        return None, str(e).replace("\n", " ")[:300]
+
+
+def parse_json_output(text: str, schema=None) -> Tuple[Optional[Any], Optional[str], bool]:
+    """
+    (value, error, repaired). `schema` is a pydantic model or TypeAdapter; models
+    come back as plain dicts. `repaired` is True when the value only parsed after
+    stripping fences or surrounding prose.
+    """
+    text = (text or "").strip()
+    try:
+        value, repaired = json.loads(text), False
+    except ValueError:
+        value, repaired = _repair(text), True
+        if value is None:
+            return None, "reply is not valid JSON", False
+    value, error = validate_output(value, schema)
+    return value, error, repaired
+
+
+def _count(agent: str, field: str):
+    metrics.count(agent, route_model(agent), field)
+
+
+def failed_generation(error: Exception) -> Optional[str]:
+    """The rejected completion of Groq's JSON mode 400 (json_validate_failed), None for any other error."""
+    body = getattr(error, "body", None)
+    detail = body.get("error") if isinstance(body, dict) else None
+    if getattr(error, "status_code", None) != 400 or not isinstance(detail, dict):
+        return None
+    if detail.get("code") != "json_validate_failed":
+        return None
+    return detail.get("failed_generation") or ""
+
+
+def tolerate_json_failures(llm, agent: str):
+    """
+    `llm` (bound to JSON_MODE) as a runnable that returns the rejected completion
+    instead of raising when Groq cannot produce valid JSON, so the caller's
+    repair and re-ask still run. Other errors, 429s included, are raised as is.
+    """
+    def _reply(error: Exception) -> AIMessage:
+        text = failed_generation(error)
+        if text is None:
+            raise error
+        _count(agent, "json_failures")
+        return AIMessage(content=text)
+
+    def invoke(prompt):
+        try:
+            return llm.invoke(prompt)
+        except Exception as e:
+            return _reply(e)
+
+    async def ainvoke(prompt):
+        try:
+            return await llm.ainvoke(prompt)
+        except Exception as e:
+            return _reply(e)
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"{agent}_json")
+
+
+def _reask_prompt(prompt: str, text: str, error: str) -> str:
+    return f"""{prompt}
+
+Your previous reply could not be used ({error}):
+{text[:MAX_ECHO_CHARS]}
+
+Return ONLY the corrected JSON object, with no code fences or commentary.
+"""
+
+
+def _parse_counted(text: str, schema, agent: str):
+    value, error, repaired = parse_json_output(text, schema)
+    if repaired and value is not None:
+        _count(agent, "repairs")
+    return value, error
+
+
+def complete_structured(text: str, schema, agent: str, prompt: str = None, reask_llm=None) -> Optional[Any]:
+    """
+    Validated value of a model reply. If the reply cannot be repaired locally and
+    `reask_llm` is given, asks once more with the validation error; None if that
+    fails too.
+    """
+    value, error = _parse_counted(text, schema, agent)
+    if value is not None or reask_llm is None:
+        if value is None:
+            _count(agent, "invalid")
+        return value
+    _count(agent, "reasks")
+    retry = reask_llm.invoke(_reask_prompt(prompt, text, error)).content
+    value, _ = _parse_counted(retry, schema, agent)
+    if value is None:
+        _count(agent, "invalid")
+    return value
+
+
+async def acomplete_structured(text: str, schema, agent: str, prompt: str = None, reask_llm=None) -> Optional[Any]:
+    value, error = _parse_counted(text, schema, agent)
+    if value is not None or reask_llm is None:
+        if value is None:
+            _count(agent, "invalid")
+        return value
+    _count(agent, "reasks")
+    retry = (await reask_llm.ainvoke(_reask_prompt(prompt, text, error))).content
+    value, _ = _parse_counted(retry, schema, agent)
+    if value is None:
+        _count(agent, "invalid")
+    return value
@@ -0,0 +1,57 @@
+import os
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+from agents.llm_client import get_llm
+from rag.tokens import estimate_tokens
+from rag.chunking import clean_body
+
+load_dotenv()
+
+# message text folded into the summary per call; longer backlogs take several calls
+THREAD_SUMMARY_INPUT_TOKENS = int(os.getenv("THREAD_SUMMARY_INPUT_TOKENS", "3000"))
+
+llm = get_llm("thread_summary", temperature=0)
+
+
+def _message_text(email: Dict[str, Any]) -> str:
+    # only what the message adds; earlier messages are already in the summary
+    return (f"[{email.get('id')}] {email.get('timestamp', '')} {email.get('sender_name') or email.get('sender_email')}:\n"
+            f"{clean_body(email.get('body_text') or '')}")
+
+
+def _prompt(summary: str, messages: List[str]) -> str:
+    return f"""
+Update the summary of an email thread with its new messages (at most 150 words).
+Keep who asked for what, decisions, dates, amounts and open questions, and the
+message ids they came from in brackets; drop greetings and signatures.
+
+SUMMARY SO FAR:
+{summary or "(none)"}
+
+NEW MESSAGES:
+{chr(10).join(messages)}
+
+UPDATED SUMMARY:
+"""
+
+
+def _groups(emails: List[Dict[str, Any]]) -> List[List[str]]:
+    groups, used = [[]], 0
+    for email in emails:
+        text = _message_text(email)
+        tokens = estimate_tokens(text)
+        if groups[-1] and used + tokens > THREAD_SUMMARY_INPUT_TOKENS:
+            groups.append([])
+            used = 0
+        groups[-1].append(text)
+        used += tokens
+    return [g for g in groups if g]
+
+
+async def asummarize_thread(summary: str, emails: List[Dict[str, Any]]) -> str:
+    """`summary` with `emails` (oldest first) folded in."""
+    for messages in _groups(emails):
+        summary = (await llm.ainvoke(_prompt(summary, messages))).content.strip()
+    return summary
@@ -1,25 +1,55 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from contextlib import asynccontextmanager
 import json
 from dotenv import load_dotenv
 import uvicorn
 
-from agents.agent_helper import ask_agent
-from agents.parllel_runner import process_all_emails
-from agents.reply_draft import generate_reply_draft
+from agents.agent_helper import aask_agent
+from agents.reply_draft import agenerate_reply_draft
 from models.GenerateReplyRequest import GenerateReplyRequest
 from models.AskBody import AskBody
 from models.ManualEmailInput import ManualEmailInput
+from agents.llm_client import get_cache_stats
+from agents.model_router import get_route_stats
+from agents.pre_classifier import pre_classifier
+from rag.db import connect as mongo_connect, connect_async as mongo_connect_async, close as mongo_close, get_pool_stats
 from rag.indexer import build_index
-from rag.service import rag_answer
-from rag.embedding import embed_query
+from rag.service import arag_answer
+from rag.answer_cache import ANSWER_CACHE_DISABLED, get_answer_cache
+from rag.embedding import aembed_query
 from rag.extract_idx import find as find_ids
-from rag.db_client import get_prompts as db_get_prompts, save_prompts as db_save_prompts, get_emails as db_get_emails
-from services.email_service import process_and_store_email, find_email_by_id, prepare_email_context
+from rag.db_client import save_prompts as db_save_prompts, ensure_indexes
+from rag.db_client import aget_prompts as db_aget_prompts, aget_emails as db_aget_emails
+from rag.db_client import build_email_filter, aquery_emails, aiter_emails, encode_cursor, decode_cursor
+from services.email_service import aprocess_and_store_email, afind_email_by_id, prepare_email_context
+from services.ingest_service import FORMATS, EmptyUpload, detect_format, bulk_ingest
+from services.thread_service import aget_thread, athread_summary, summary_doc
+from services.stream_service import SSE_HEADERS, stream_rag_answer, stream_agent_reply, stream_reply_draft
+from services.job_service import enqueue_process_all, get_job_status, cancel_job, resume_job, resume_unfinished_jobs
 
 load_dotenv()
 
-app = FastAPI(title="Email Management API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mongo_connect()
+    mongo_connect_async()
+    try:
+        ensure_indexes()
+    except Exception as e:
+        print(f"Warning: Failed to create DB indexes: {str(e)}")
+    try:
+        resume_unfinished_jobs()
+    except Exception as e:
+        print(f"Warning: Failed to resume background jobs: {str(e)}")
+    yield
+    mongo_close()
+
+
+app = FastAPI(title="Email Management API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,37 +62,77 @@ app.add_middleware(
 # ==================== PROMPT ROUTES ====================
 
 @app.get("/prompts")
-def get_prompts():
-    return db_get_prompts()
+async def get_prompts():
+    return await db_aget_prompts()
 
 
 @app.post("/prompts")
 def update_prompts(data: dict):
     try:
         db_save_prompts(data)
-        result = process_all_emails()
-        return {"status": "success", "processing_result": result}
+        job_id = enqueue_process_all(reason="prompts_updated")
+        return {"status": "success", "job_id": job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update prompts: {str(e)}")
 
 
 # ==================== EMAIL ROUTES ====================
 
+MAX_PAGE_SIZE = 500
+
+
 @app.get("/emails")
-def get_all_emails():
-    return db_get_emails()
+async def get_all_emails(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    sender: Optional[str] = None,
+    folder: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = "json",
+):
+    """
+    Without query params this returns every email as a list (what the inbox UI expects).
+    With `limit` it returns one page, newest first: {"items": [...], "next_cursor": ...};
+    pass next_cursor back as `cursor` for the following page. `format=ndjson` streams
+    every matching email, one JSON document per line.
+    """
+    filters = (category, sender, folder, since, until, fields, cursor)
+    if limit is None and format != "ndjson" and not any(filters):
+        return await db_aget_emails()
+
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    query = build_email_filter(category, sender, folder, since, until, after)
+
+    if format == "ndjson":
+        async def lines():
+            async for doc in aiter_emails(query, field_list):
+                yield json.dumps(doc, default=str) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    page_size = max(1, min(limit or 50, MAX_PAGE_SIZE))
+    # fetch one extra to know whether another page exists
+    items = await aquery_emails(query, field_list, page_size + 1)
+    next_cursor = encode_cursor(items[page_size - 1]) if len(items) > page_size else None
+    return {"items": items[:page_size], "next_cursor": next_cursor}
 
 
 @app.post("/process-all-emails")
-def process_all():
-    return process_all_emails()
+def process_all(force: bool = False):
+    return {"status": "queued", "job_id": enqueue_process_all(force=force)}
 
 
 @app.post("/add-email")
-def add_email_manually(email_input: ManualEmailInput):
+async def add_email_manually(email_input: ManualEmailInput):
     try:
-        prompts = db_get_prompts()
-        email_data = process_and_store_email(email_input.dict(), prompts)
+        prompts = await db_aget_prompts()
+        email_data = await aprocess_and_store_email(email_input.dict(), prompts)
         return {
             "status": "success",
             "message": "Email added and processed successfully",
@@ -72,62 +142,189 @@ def add_email_manually(email_input: ManualEmailInput):
         raise HTTPException(status_code=500, detail=f"Failed to process email: {str(e)}")
 
 
-@app.post("/process-email")
-def process_email(payload: dict):
+@app.post("/emails/bulk")
+async def add_emails_bulk(request: Request, format: Optional[str] = None):
+    """
+    Raw NDJSON (one ManualEmailInput per line), mbox or .eml body. Returns per-email
+    results and per-stage throughput; emails that fail do not fail the batch.
+    """
+    fmt = detect_format(format, request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    prompts = await db_aget_prompts()
+    try:
+        return await bulk_ingest(request.stream(), fmt, prompts)
+    except EmptyUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _agent_request(payload: dict):
     email_id = payload.get("id")
     prmopt = payload.get("prmopt")
+    # one conversation per (session, email); each client sends its own session id
+    session_id = payload.get("session_id")
 
-    if not email_id or not prmopt:
-        raise HTTPException(status_code=400, detail="id and prmopt are required")
+    if not email_id or not prmopt or not session_id:
+        raise HTTPException(status_code=400, detail="id, prmopt and session_id are required")
 
     try:
-        email = find_email_by_id(email_id)
-        subject, body, timestamp = prepare_email_context(email)
-        body = body.split("\n\nTimestamp:")[0] + f"\n\nTimestamp: {timestamp}"
-        
-        final_prompt = f"User instruction: {prmopt}. Strictly follow this instruction."
-        return ask_agent(subject, body, final_prompt, timestamp, email_id)
+        email = await afind_email_by_id(email_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    subject, body, timestamp = prepare_email_context(email)
+    body = body.split("\n\nTimestamp:")[0] + f"\n\nTimestamp: {timestamp}"
+    thread_summary = await athread_summary(email.get("thread_id"), refresh=False)
 
+    final_prompt = f"User instruction: {prmopt}. Strictly follow this instruction."
+    return subject, body, final_prompt, timestamp, email_id, session_id, thread_summary
 
-@app.post("/generate-reply")
-def generate_reply(request: GenerateReplyRequest):
+
+@app.post("/process-email")
+async def process_email(payload: dict):
+    return await aask_agent(*await _agent_request(payload))
+
+
+@app.post("/process-email/stream")
+async def process_email_stream(payload: dict):
+    """SSE: `token` events, then `done` with the full answer (or `error`)."""
+    args = await _agent_request(payload)
+    return StreamingResponse(stream_agent_reply(*args), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def _reply_request(request: GenerateReplyRequest):
     try:
-        email = find_email_by_id(request.id)
-        subject, body, _ = prepare_email_context(email)
-        
-        reply_prompt = request.prompt if request.prompt else "reply_prompt"
-        result = generate_reply_draft(subject=subject, body=body, prompt=reply_prompt)
-        
-        return json.loads(result)
+        email = await afind_email_by_id(request.id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
-    except json.JSONDecodeError:
+    subject, body, _ = prepare_email_context(email)
+
+    reply_prompt = request.prompt if request.prompt else "reply_prompt"
+    return subject, body, reply_prompt
+
+
+@app.post("/generate-reply")
+async def generate_reply(request: GenerateReplyRequest):
+    subject, body, reply_prompt = await _reply_request(request)
+    result = await agenerate_reply_draft(subject=subject, body=body, prompt=reply_prompt)
+    if result is None:
         return {"error": "Model returned invalid JSON"}
+    return result
+
+
+@app.post("/generate-reply/stream")
+async def generate_reply_stream(request: GenerateReplyRequest):
+    """SSE: `token` and partial `draft` events, then `done` with the validated draft (or `error`)."""
+    subject, body, reply_prompt = await _reply_request(request)
+    return StreamingResponse(
+        stream_reply_draft(subject, body, reply_prompt), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@app.get("/threads/{thread_id}")
+async def get_thread(thread_id: str):
+    """The thread's messages, oldest first, and its rolling summary."""
+    thread = await aget_thread(thread_id)
+    if thread is None:
+        raise HTTPException(status_code=404, detail=f"Thread {thread_id} not found")
+    return thread
+
+
+# ==================== JOB ROUTES ====================
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    try:
+        return get_job_status(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/jobs/{job_id}/cancel")
+def job_cancel(job_id: str):
+    try:
+        return cancel_job(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/jobs/{job_id}/resume")
+def job_resume(job_id: str):
+    try:
+        return resume_job(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 # ==================== RAG ROUTES ====================
 
 @app.get("/init")
 def rag_init():
-    return {"indexed": build_index()}
+    return build_index()
 
 
 @app.post("/embed")
-def rag_embed(body: AskBody):
-    return {"vector": embed_query(body.prompt)}
+async def rag_embed(body: AskBody):
+    return {"vector": await aembed_query(body.prompt)}
+
+
+def _ask_filter(body: AskBody) -> dict:
+    return build_email_filter(category=body.category, sender=body.sender, since=body.since, until=body.until,
+                              thread_id=body.thread_id)
+
+
+async def _ask_pinned(body: AskBody) -> list:
+    # a thread question starts from the thread's summary; retrieval adds detail from its emails
+    summary = await athread_summary(body.thread_id) if body.thread_id else ""
+    return [summary_doc(body.thread_id, summary)] if summary else []
 
 
 @app.post("/ask")
-def rag_ask(body: AskBody):
-    reply, docs = rag_answer(body.prompt, body.k)
+async def rag_ask(body: AskBody):
+    reply, docs, cached, context = await arag_answer(
+        body.prompt, body.k, _ask_filter(body), body.use_cache, await _ask_pinned(body)
+    )
     extract_ids = find_ids(reply)
-    return {"answer": reply, "chunks": docs, "extracted_ids": extract_ids}
+    return {"answer": reply, "chunks": docs, "extracted_ids": extract_ids, "cached": cached, "context": context}
+
+
+@app.post("/ask/stream")
+async def rag_ask_stream(body: AskBody):
+    """SSE: `chunks` with the retrieved context, `token` events, then `done` with answer and extracted_ids."""
+    return StreamingResponse(
+        stream_rag_answer(body.prompt, body.k, _ask_filter(body), body.use_cache, await _ask_pinned(body)),
+        media_type="text/event-stream", headers=SSE_HEADERS
+    )
 
 
 # ==================== HEALTH CHECK ====================
 
+@app.get("/llm-cache")
+def llm_cache_stats():
+    return get_cache_stats()
+
+
+@app.get("/answer-cache")
+def answer_cache_stats():
+    if ANSWER_CACHE_DISABLED:
+        return {"enabled": False}
+    return get_answer_cache().get_stats()
+
+
+@app.get("/llm-metrics")
+def llm_route_metrics():
+    return get_route_stats()
+
+
+@app.get("/preclassifier")
+def preclassifier_stats():
+    return pre_classifier.get_stats()
+
+
+@app.get("/diagnostics/db")
+def db_diagnostics():
+    return get_pool_stats()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -0,0 +1,200 @@
+"""
+Old chunker (a new 800-char RecursiveCharacterTextSplitter per email over the
+full flattened text) vs rag.chunking.chunk_email (shared token-sized splitter,
+quoted history and signatures stripped, chunks already in the thread skipped).
+
+Reports chunks per email, chunks embedded (one embedding input each) and the
+recall@k of lexical and hybrid retrieval over each chunk set. With --stub the
+vectors are hash noise, so only the lexical rows say much. Queries:
+  own      the longest sentence an email adds to its thread  -> that email
+  quoted   the longest sentence of the thread's first email  -> that email
+           (replies quoting it compete with it under the old chunker)
+
+    python -m benchmarks.chunking_pipeline --stub
+    python -m benchmarks.chunking_pipeline --threads 100 --k 1,4
+
+Emails come from mock_emails.json when present, otherwise --threads synthetic
+threads whose replies quote the previous message Gmail or Outlook style.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.retrieval_recall import index_docs, recall, search
+
+SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def synthetic_threads(n: int):
+    rng = random.Random(11)
+    people = [("Priya Raman", "priya@acme.io"), ("Tom Becker", "tom.becker@globex.com"),
+              ("Ana Souza", "ana@initech.com"), ("Li Wei", "li.wei@acme.io"), ("Marco Rossi", "marco@umbrella.it")]
+    openers = [
+        "The Q3 budget review moved to Thursday and we need the revised marketing forecast before then.",
+        "Invoice INV-{n} for 4,800 EUR is now fifteen days overdue and finance asked for a payment date.",
+        "The API outage on Tuesday lasted 42 minutes because the TLS certificate for the gateway expired.",
+        "We would like to schedule the onboarding session for the new analytics dashboard next week.",
+        "Globex reports duplicate charges on three accounts and wants a call with billing tomorrow.",
+    ]
+    replies = [
+        "Thursday at 3pm works for me, I will bring the spreadsheet with the updated numbers for {topic}.",
+        "Can you confirm whether legal has signed off on {topic} before I forward it to the client?",
+        "I looked into {topic} this morning and the root cause is a misconfigured retry policy in the worker.",
+        "Adding Li to this thread since she owns {topic} on the platform side now.",
+        "Let's push {topic} by a week, the team is blocked on the security review until Monday.",
+    ]
+    topics = ["the forecast", "ticket {n}", "the rollout plan", "the renewal for account {n}", "the vendor contract"]
+    disclaimer = ("This message and any attachments are confidential and intended solely for the addressee. "
+                  "If you received it in error, please notify the sender and delete it. ") * 2
+
+    emails = []
+    for t in range(n):
+        thread_id = f"thd_{t:06x}"
+        participants = rng.sample(people, 2)
+        history = ""
+        for i in range(rng.randint(2, 6)):
+            name, address = participants[i % 2]
+            number = rng.randint(1000, 9999)
+            text = (rng.choice(openers) if i == 0 else rng.choice(replies).format(topic=rng.choice(topics)))
+            # the reference number makes each email's sentence unique
+            text = text.format(n=number).rstrip(".") + f" (reference {number})."
+            timestamp = f"2024-02-{1 + t % 28:02d}T{9 + i:02d}:00:00Z"
+            body = f"Hi,\n\n{text}\n\nThanks,\n{name}\n{address}\n\n{disclaimer}"
+            if history:
+                previous = emails[-1]
+                if rng.random() < 0.5:
+                    quoted = "\n".join("> " + line for line in history.splitlines())
+                    body += f"\n\nOn {previous['timestamp']} {previous['sender_name']} <{previous['sender_email']}> wrote:\n{quoted}"
+                else:
+                    body += (f"\n\n{'_' * 32}\nFrom: {previous['sender_name']}\nSent: {previous['timestamp']}\n"
+                             f"To: {address}\nSubject: {previous['subject']}\n\n{history}")
+            emails.append({
+                "id": f"msg_{t:04x}{i:02x}",
+                "thread_id": thread_id,
+                "sender_name": name,
+                "sender_email": address,
+                "subject": ("Re: " if i else "") + f"Thread {t}",
+                "body_text": body,
+                "timestamp": timestamp,
+                "own_text": text,
+            })
+            history = body
+    return emails
+
+
+def load_emails(threads: int):
+    if os.path.exists("mock_emails.json"):
+        with open("mock_emails.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    return synthetic_threads(threads)
+
+
+def old_chunks(email):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from rag.chunking import flatten_email
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
+    return [{"id": f"{email['id']}:{i}", "chunk": c} for i, c in enumerate(splitter.split_text(flatten_email(email)))]
+
+
+def new_chunker():
+    from rag.chunking import chunk_email
+
+    thread_hashes = defaultdict(set)
+    return lambda email: chunk_email(email, thread_hashes[email.get("thread_id") or email["id"]])
+
+
+def longest_sentence(text):
+    sentences = [s.strip() for s in SENTENCE.split(text or "") if len(s.strip()) > 30]
+    return max(sentences, key=len) if sentences else None
+
+
+def build_queries(emails):
+    from rag.chunking import clean_body
+
+    first = {}
+    for email in sorted(emails, key=lambda e: e.get("timestamp") or ""):
+        first.setdefault(email.get("thread_id") or email["id"], email)
+    queries = []
+    for email in emails:
+        sentence = longest_sentence(email.get("own_text") or clean_body(email.get("body_text")))
+        if sentence:
+            queries.append(("own", sentence, {email["id"]}))
+    for email in first.values():
+        sentence = longest_sentence(email.get("own_text") or clean_body(email.get("body_text")))
+        if sentence:
+            queries.append(("quoted", sentence, {email["id"]}))
+    return queries
+
+
+def chunk_all(emails, chunker):
+    from rag.tokens import count_tokens
+
+    start = time.perf_counter()
+    docs = []
+    for email in sorted(emails, key=lambda e: e.get("timestamp") or ""):
+        for chunk in chunker(email):
+            docs.append({"_id": chunk["id"], "email_id": email["id"], "chunk": chunk["chunk"]})
+    ms = 1000 * (time.perf_counter() - start) / max(1, len(emails))
+    tokens = sum(count_tokens(d["chunk"]) for d in docs)
+    return docs, ms, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", default="1,4")
+    parser.add_argument("--threads", type=int, default=60, help="synthetic threads when mock_emails.json is missing")
+    parser.add_argument("--candidates", type=int, default=40, help="results per retriever before fusion")
+    parser.add_argument("--modes", default="lexical,hybrid", help="retrieval modes to measure recall with")
+    parser.add_argument("--stub", action="store_true", help="embed with the local stub server (hash vectors)")
+    args = parser.parse_args()
+
+    if args.stub:
+        from benchmarks.stub_embedding_server import serve
+        server = serve(8903, latency=0.0, batch=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["HF_SPACE_API_URL"] = "http://127.0.0.1:8903/embed"
+        os.environ["EMBED_BACKEND"] = "remote"
+
+    ks = [int(k) for k in args.k.split(",")]
+    modes = args.modes.split(",")
+    emails = [e for e in load_emails(args.threads) if e.get("id")]
+    queries = build_queries(emails)
+    types = sorted({t for t, _, _ in queries})
+    print(f"{len(emails)} emails, {len(queries)} queries\n")
+
+    rows = []
+    baseline = None
+    for name, chunker in (("old", old_chunks), ("email-aware", new_chunker())):
+        docs, ms, tokens = chunk_all(emails, chunker)
+        baseline = baseline or len(docs)
+        with tempfile.TemporaryDirectory() as path:
+            vector_index, lexical_index = index_docs(docs, path, f"{name}: ")
+            recalls = {}
+            for mode in modes:
+                results = [(t, search(q, max(ks), mode, False, vector_index, lexical_index, args.candidates), rel)
+                           for t, q, rel in queries]
+                for k in ks:
+                    for t in types:
+                        values = [recall(d, rel, k) for qt, d, rel in results if qt == t]
+                        recalls[(mode, t, k)] = sum(values) / len(values)
+        rows.append((name, len(docs), tokens, ms, baseline - len(docs), recalls))
+
+    print(f"\n{'chunker':<13}{'chunks':>8}{'/email':>8}{'tokens':>9}{'ms/email':>10}{'embeds saved':>14}")
+    for name, chunks, tokens, ms, saved, _ in rows:
+        print(f"{name:<13}{chunks:>8}{chunks / len(emails):>8.2f}{tokens:>9}{ms:>10.2f}"
+              f"{f'{saved} ({100 * saved / baseline:.0f}%)':>14}")
+    print(f"\n{'chunker':<13}{'mode':<9}" + "".join(f"{f'{t}@{k}':>10}" for k in ks for t in types))
+    for name, _, _, _, _, recalls in rows:
+        for mode in modes:
+            print(f"{name:<13}{mode:<9}" + "".join(f"{recalls[(mode, t, k)]:>10.3f}" for k in ks for t in types))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare chunks/sec of the remote (HF Space) and local (FastEmbed) embedding
+backends on the same chunks, bypassing the embedding cache.
+
+    python -m benchmarks.embedding_backends --chunks 256
+    python -m benchmarks.embedding_backends --backends local --concurrency 8
+    python -m benchmarks.embedding_backends --stub   # remote = local stub server
+
+Chunks come from mock_emails.json when present, otherwise synthetic text.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_chunks(n: int):
+    from rag.chunking import flatten_email, chunk_text
+
+    chunks = []
+    if os.path.exists("mock_emails.json"):
+        with open("mock_emails.json", "r", encoding="utf-8") as f:
+            for email in json.load(f):
+                chunks.extend(c["chunk"] for c in chunk_text(flatten_email(email)))
+    i = 0
+    while len(chunks) < n:
+        chunks.append(f"Synthetic email {i}: please review the quarterly report and reply by Friday. " * 8)
+        i += 1
+    return chunks[:n]
+
+
+def run(backend, chunks, concurrency: int, request_size: int):
+    # warm up: loads the local model / opens the remote connection pool
+    backend.embed(chunks[:2])
+    requests = [chunks[i:i + request_size] for i in range(0, len(chunks), request_size)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(backend.embed, requests))
+    elapsed = time.perf_counter() - start
+    return len(chunks) / elapsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=256)
+    parser.add_argument("--backends", default="remote,local")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel callers")
+    parser.add_argument("--request-size", type=int, default=1, help="chunks per embed call (1 = per-query traffic)")
+    parser.add_argument("--stub", action="store_true", help="point the remote backend at a local stub server")
+    args = parser.parse_args()
+
+    if args.stub:
+        from benchmarks.stub_embedding_server import serve
+        server = serve(8901, latency=0.05, batch=False)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["HF_SPACE_API_URL"] = "http://127.0.0.1:8901/embed"
+
+    from rag import embedding
+    from rag.local_embedding import LocalEmbeddingBackend
+
+    backends = {"remote": embedding.RemoteEmbeddingBackend, "local": LocalEmbeddingBackend}
+    chunks = load_chunks(args.chunks)
+    print(f"{len(chunks)} chunks, concurrency={args.concurrency}, request_size={args.request_size}")
+    for name in args.backends.split(","):
+        rate, elapsed = run(backends[name](), chunks, args.concurrency, args.request_size)
+        print(f"{name:>7}: {rate:8.1f} chunks/sec ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
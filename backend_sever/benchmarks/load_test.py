@@ -0,0 +1,138 @@
+"""
+Concurrent-request throughput of the /ask path, sync vs async, against local stubs.
+
+"sync" runs rag.service.rag_answer on worker threads through the same
+40-thread limiter FastAPI uses for plain `def` routes; "async" awaits
+rag.service.arag_answer on the event loop, the way the routes now run.
+The Groq and embedding APIs are replaced by the stub servers in this
+folder and retrieval uses the local vector index, so no quota, Atlas or
+network is needed.
+
+    python -m benchmarks.load_test --concurrency 200 --requests 400 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+LLM_PORT = 8931
+EMBED_PORT = 8932
+
+
+def configure_env(tmp_dir: str):
+    os.environ.update({
+        "GROQ_API_BASE": f"http://127.0.0.1:{LLM_PORT}",
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "stub"),
+        "HF_SPACE_API_URL": f"http://127.0.0.1:{EMBED_PORT}/embed",
+        "LLM_CACHE_DISABLED": "true",
+        "EMBED_CACHE_DISABLED": "true",
+        # every request should run the full chain
+        "ANSWER_CACHE_DISABLED": "true",
+        "EMBED_MAX_CONCURRENCY": "16",
+        "VECTOR_BACKEND": "local",
+        "RETRIEVAL_MODE": "hybrid",
+        "CACHE_DIR": tmp_dir,
+        "VECTOR_INDEX_DIR": os.path.join(tmp_dir, "vector_index"),
+    })
+
+
+def start_stubs(llm_latency: float, embed_latency: float):
+    from benchmarks.stub_llm_server import serve as serve_llm
+    from benchmarks.stub_embedding_server import serve as serve_embed, fake_embedding
+
+    for server in (serve_llm(LLM_PORT, llm_latency), serve_embed(EMBED_PORT, embed_latency)):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return fake_embedding
+
+
+def seed_index(fake_embedding, n_chunks: int = 2000):
+    from rag import vector_search, lexical_index
+    from rag.config import VECTOR_INDEX_DIR, EMBED_DIM, LEXICAL_INDEX_PATH
+    from rag.local_index import LocalVectorIndex
+    from rag.lexical_index import LexicalIndex
+
+    index = LocalVectorIndex(VECTOR_INDEX_DIR, EMBED_DIM)
+    docs = []
+    for i in range(n_chunks):
+        text = f"Email msg_{i:08x}: please send the report for project {i % 97} by Friday."
+        docs.append({"_id": f"c{i}", "email_id": f"msg_{i:08x}", "chunk": text, "embedding": fake_embedding(text)})
+    index.upsert(docs)
+    vector_search._local_index = index
+    lexical = LexicalIndex(LEXICAL_INDEX_PATH)
+    lexical.upsert(docs)
+    lexical_index._lexical_index = lexical
+
+
+def questions(n: int):
+    topics = ["deadlines", "reports", "meetings", "invoices", "the project update"]
+    return [f"What do I need to do about {random.choice(topics)} #{i}?" for i in range(n)]
+
+
+async def run_sync(prompts, concurrency: int):
+    import anyio
+    from rag.service import rag_answer
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(prompt):
+        async with sem:
+            start = time.perf_counter()
+            await anyio.to_thread.run_sync(rag_answer, prompt, 4)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(p) for p in prompts])
+    return time.perf_counter() - start, latencies
+
+
+async def run_async(prompts, concurrency: int):
+    from rag.service import arag_answer
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(prompt):
+        async with sem:
+            start = time.perf_counter()
+            await arag_answer(prompt, 4)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(p) for p in prompts])
+    return time.perf_counter() - start, latencies
+
+
+def report(name: str, elapsed: float, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{name:>6}: {len(latencies) / elapsed:7.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.0f} ms  p95 {p95 * 1000:7.0f} ms  ({elapsed:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="load_test_")
+    configure_env(tmp_dir)
+    fake_embedding = start_stubs(args.llm_latency, args.embed_latency)
+    seed_index(fake_embedding)
+
+    prompts = questions(args.requests)
+    print(f"{args.requests} /ask requests, concurrency {args.concurrency}, "
+          f"LLM latency {args.llm_latency}s, embedding latency {args.embed_latency}s")
+    report("sync", *asyncio.run(run_sync(prompts, args.concurrency)))
+    report("async", *asyncio.run(run_async(prompts, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+A/B comparison of the two email processing modes on the same emails:
+"parallel" (separate category and action calls) vs "fused" (one JSON call).
+
+Reports tokens and requests per email, latency, how often the fused output
+failed validation, and how often the two modes agree on category and actions.
+The LLM response cache is bypassed so every email is a real call.
+
+    python -m benchmarks.processing_modes --emails 30
+
+Emails come from mock_emails.json when present, otherwise from Mongo.
+Prompts come from prompts.json.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+
+def load_emails(n: int):
+    if os.path.exists("mock_emails.json"):
+        with open("mock_emails.json", "r", encoding="utf-8") as f:
+            return json.load(f)[:n]
+    from rag.db_client import get_emails
+    return get_emails()[:n]
+
+
+def _usage(message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = message.response_metadata.get("token_usage", {})
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def _parse_parallel_result(result):
+    from agents.structured_output import JsonObject, parse_json_output
+
+    category = result["category"].content.strip()
+    action_items, _, _ = parse_json_output(result["actions"].content, JsonObject)
+    return category, action_items if action_items is not None else []
+
+
+def run_parallel(subject, body, prompts):
+    from agents.parllel_runner import parallel_runner, _parallel_input
+
+    start = time.perf_counter()
+    result = parallel_runner.invoke(_parallel_input(subject, body, prompts))
+    latency = time.perf_counter() - start
+    usages = [_usage(result["category"]), _usage(result["actions"])]
+    return {
+        "result": _parse_parallel_result(result),
+        "latency": latency,
+        "prompt_tokens": sum(u[0] for u in usages),
+        "completion_tokens": sum(u[1] for u in usages),
+        "requests": 2,
+        "fallback": False,
+    }
+
+
+def run_fused(subject, body, prompts):
+    from agents.fused_agent import fused_runner, fused_input, parse_fused_result
+
+    start = time.perf_counter()
+    message = fused_runner.invoke(fused_input(subject, body, prompts))
+    latency = time.perf_counter() - start
+    prompt_tokens, completion_tokens = _usage(message)
+    row = {
+        "result": parse_fused_result(message.content.strip()),
+        "latency": latency,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "requests": 1,
+        "fallback": False,
+    }
+    if row["result"] is None:
+        # charge the fallback to the fused mode, as production would
+        fallback = run_parallel(subject, body, prompts)
+        for field in ("latency", "prompt_tokens", "completion_tokens", "requests"):
+            row[field] += fallback[field]
+        row["result"] = fallback["result"]
+        row["fallback"] = True
+    return row
+
+
+def _normalize_actions(actions):
+    if not isinstance(actions, dict):
+        return {}
+    return {str(k).strip().lower(): str(v).strip().lower() for k, v in actions.items()}
+
+
+def summarize(name, rows):
+    latencies = sorted(r["latency"] for r in rows)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    tokens = [r["prompt_tokens"] + r["completion_tokens"] for r in rows]
+    print(f"{name:>8}: {statistics.mean(tokens):7.1f} tokens/email "
+          f"({statistics.mean(r['prompt_tokens'] for r in rows):.1f} in, "
+          f"{statistics.mean(r['completion_tokens'] for r in rows):.1f} out)  "
+          f"{statistics.mean(r['requests'] for r in rows):.2f} requests/email  "
+          f"latency mean {statistics.mean(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms")
+
+
+def agreement(parallel_rows, fused_rows):
+    category = actions = fields = fields_total = 0
+    for p, f in zip(parallel_rows, fused_rows):
+        p_category, p_actions = p["result"]
+        f_category, f_actions = f["result"]
+        category += p_category.strip().lower() == f_category.strip().lower()
+        p_actions, f_actions = _normalize_actions(p_actions), _normalize_actions(f_actions)
+        actions += p_actions == f_actions
+        for key in set(p_actions) | set(f_actions):
+            fields_total += 1
+            fields += p_actions.get(key) == f_actions.get(key)
+    n = len(parallel_rows)
+    print(f"agreement: category {category / n:.1%}, actions exact {actions / n:.1%}, "
+          f"action fields {fields / fields_total if fields_total else 1:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=30)
+    args = parser.parse_args()
+
+    from agents.llm_client import bypass_cache
+    from agents.rate_limiter import limiter, call_with_backoff
+    from agents.parllel_runner import estimate_email_tokens
+
+    with open("prompts.json", "r", encoding="utf-8") as f:
+        prompts = json.load(f)
+    emails = load_emails(args.emails)
+
+    parallel_rows, fused_rows = [], []
+    with bypass_cache():
+        for email in emails:
+            subject = email.get("subject", "")
+            body = email.get("body_text", "") + "\n\nTimestamp: " + email.get("timestamp", "")
+            limiter.acquire(estimate_email_tokens(subject, body, prompts), requests=2)
+            parallel_rows.append(call_with_backoff(run_parallel, subject, body, prompts))
+            limiter.acquire(estimate_email_tokens(subject, body, prompts, fused=True), requests=1)
+            fused_rows.append(call_with_backoff(run_fused, subject, body, prompts))
+
+    print(f"{len(emails)} emails")
+    summarize("parallel", parallel_rows)
+    summarize("fused", fused_rows)
+    fallbacks = sum(r["fallback"] for r in fused_rows)
+    print(f"fused fallbacks: {fallbacks}/{len(fused_rows)}")
+    agreement(parallel_rows, fused_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Offline recall@k of the /ask retrievers (vector, BM25, hybrid RRF, and
+hybrid + cross-encoder rerank) over the mock emails.
+
+Queries are generated from the emails themselves, each with a known set of
+relevant emails:
+  subject  the email's subject line                 -> that email
+  body     its longest body sentence                -> every email containing it
+  sender   "emails from <sender name>"              -> every email from that sender
+  id       "what does <msg id> say?"                -> that email
+
+recall@k = relevant emails among the top-k chunks / min(k, relevant emails).
+Indexes are built in a temp dir with the configured embedding backend, so
+Mongo and Atlas are not touched.
+
+    python -m benchmarks.retrieval_recall --k 1,4,10
+    python -m benchmarks.retrieval_recall --stub --rerank
+
+Emails come from mock_emails.json when present, otherwise from Mongo when
+MONGODB_URI is set, otherwise --synthetic N generated emails.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+MODES = ("vector", "lexical", "hybrid")
+
+
+def load_emails(synthetic: int):
+    if os.path.exists("mock_emails.json"):
+        with open("mock_emails.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    if os.getenv("MONGODB_URI"):
+        try:
+            from rag.db_client import get_emails
+            emails = get_emails()
+            if emails:
+                return emails
+        except Exception as e:
+            print(f"Warning: could not load emails from Mongo: {str(e)}")
+    return synthetic_emails(synthetic)
+
+
+def synthetic_emails(n: int):
+    rng = random.Random(7)
+    senders = [("Priya Raman", "priya@acme.io"), ("Tom Becker", "tom.becker@globex.com"),
+               ("Ana Souza", "ana@initech.com"), ("Li Wei", "li.wei@acme.io"), ("HR Team", "hr@acme.io"),
+               ("GitHub", "noreply@github.com"), ("Marco Rossi", "marco@umbrella.it")]
+    topics = [
+        ("Q3 budget review", "The Q3 budget review moved to Thursday. Please bring the revised forecast for marketing spend."),
+        ("Server outage postmortem", "Yesterday's API outage lasted 42 minutes. The root cause was an expired TLS certificate."),
+        ("Offer letter", "We are happy to extend you an offer for the Senior Engineer role, starting on the first of March."),
+        ("Invoice overdue", "Invoice INV-2231 for 4,800 EUR is now 15 days overdue. Kindly arrange payment this week."),
+        ("Team offsite", "The offsite will be in Lisbon. Book flights by Friday and share dietary restrictions."),
+        ("PR review requested", "Please review pull request 512 which refactors the billing worker retry logic."),
+        ("Security training", "Annual security awareness training is mandatory and due by the end of the month."),
+        ("Customer escalation", "Globex reports duplicate charges on three accounts and wants a call tomorrow."),
+    ]
+    emails = []
+    for i in range(n):
+        name, address = senders[rng.randrange(len(senders))]
+        subject, body = topics[rng.randrange(len(topics))]
+        detail = f"Reference number {rng.randint(1000, 9999)}. " + " ".join(
+            rng.choice(["Thanks.", "Let me know if anything is unclear.", "Regards.", "See the attached notes."])
+            for _ in range(3)
+        )
+        emails.append({
+            "id": f"msg_{i:08x}",
+            "sender_name": name,
+            "sender_email": address,
+            "subject": f"{subject} #{i}",
+            "body_text": f"Hi,\n\n{body} {detail}",
+            "timestamp": f"2024-01-{1 + i % 28:02d}T09:00:00Z",
+        })
+    return emails
+
+
+def build_queries(emails, per_type: int, seed: int = 1):
+    rng = random.Random(seed)
+    by_sender = defaultdict(set)
+    for email in emails:
+        by_sender[email.get("sender_name")].add(email["id"])
+
+    queries = []
+    for email in rng.sample(emails, min(per_type, len(emails))):
+        queries.append(("subject", email.get("subject") or "", {email["id"]}))
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", email.get("body_text") or "") if s.strip()]
+        if sentences:
+            sentence = max(sentences, key=len)
+            queries.append(("body", sentence, {e["id"] for e in emails if sentence in (e.get("body_text") or "")}))
+        queries.append(("id", f"what does {email['id']} say?", {email["id"]}))
+    for name in rng.sample(sorted(n for n in by_sender if n), min(per_type, len(by_sender))):
+        queries.append(("sender", f"emails from {name}", by_sender[name]))
+    return queries
+
+
+def build_indexes(emails, path):
+    from rag.chunking import chunk_email
+
+    docs = []
+    for email in emails:
+        for chunk in chunk_email(email):
+            docs.append({"_id": chunk["id"], "email_id": email["id"], "chunk": chunk["chunk"]})
+    return index_docs(docs, path, f"{len(emails)} emails, ")
+
+
+def index_docs(docs, path, label=""):
+    """Vector and lexical indexes of email_chunks-style docs, built under `path`."""
+    from rag.config import EMBED_DIM
+    from rag.embedding import embed_texts
+    from rag.local_index import LocalVectorIndex
+    from rag.lexical_index import LexicalIndex
+
+    start = time.perf_counter()
+    vectors = embed_texts([d["chunk"] for d in docs])
+    print(f"{label}{len(docs)} chunks embedded in {time.perf_counter() - start:.1f}s")
+    for doc, vector in zip(docs, vectors):
+        doc["embedding"] = vector
+
+    vector_index = LocalVectorIndex(os.path.join(path, "vectors"), EMBED_DIM)
+    lexical_index = LexicalIndex(os.path.join(path, "lexical.sqlite3"))
+    vector_index.upsert(docs)
+    lexical_index.upsert(docs)
+    return vector_index, lexical_index
+
+
+def search(query, k, mode, rerank, vector_index, lexical_index, candidates):
+    # same steps as rag.retriever.retrieve, against the temp indexes
+    from rag.embedding import embed_query
+    from rag.retriever import reciprocal_rank_fusion, _pin_named_emails, _rerank
+
+    vector_docs = vector_index.search(embed_query(query), candidates) if mode != "lexical" else []
+    lexical_docs = lexical_index.search(query, candidates) if mode != "vector" else []
+    fused = _pin_named_emails(query, reciprocal_rank_fusion([lexical_docs, vector_docs]))
+    return _rerank(query, fused, k, rerank)
+
+
+def recall(docs, relevant, k):
+    found = {d["email_id"] for d in docs[:k]}
+    return len(found & relevant) / min(k, len(relevant))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", default="1,4,10")
+    parser.add_argument("--queries", type=int, default=50, help="queries per type")
+    parser.add_argument("--candidates", type=int, default=40, help="results per retriever before fusion")
+    parser.add_argument("--synthetic", type=int, default=200, help="emails to generate when none are found")
+    parser.add_argument("--rerank", action="store_true", help="also run hybrid + cross-encoder rerank")
+    parser.add_argument("--stub", action="store_true", help="embed with the local stub server (hash vectors)")
+    args = parser.parse_args()
+
+    if args.stub:
+        from benchmarks.stub_embedding_server import serve
+        server = serve(8902, latency=0.0, batch=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["HF_SPACE_API_URL"] = "http://127.0.0.1:8902/embed"
+        os.environ["EMBED_BACKEND"] = "remote"
+
+    ks = [int(k) for k in args.k.split(",")]
+    emails = [e for e in load_emails(args.synthetic) if e.get("id")]
+    queries = build_queries(emails, args.queries)
+    modes = [(mode, False) for mode in MODES] + ([("hybrid", True)] if args.rerank else [])
+
+    with tempfile.TemporaryDirectory() as path:
+        vector_index, lexical_index = build_indexes(emails, path)
+        types = sorted({t for t, _, _ in queries})
+        print(f"{len(queries)} queries; recall@k per query type\n")
+        print(f"{'mode':<16}{'k':>4}  " + "".join(f"{t:>9}" for t in types) + f"{'all':>9}{'ms/q':>9}")
+        for mode, rerank in modes:
+            results = []
+            start = time.perf_counter()
+            for query_type, query, relevant in queries:
+                docs = search(query, max(ks), mode, rerank, vector_index, lexical_index, args.candidates)
+                results.append((query_type, docs, relevant))
+            ms = 1000 * (time.perf_counter() - start) / len(queries)
+            name = mode + (" + rerank" if rerank else "")
+            for k in ks:
+                by_type = defaultdict(list)
+                for query_type, docs, relevant in results:
+                    by_type[query_type].append(recall(docs, relevant, k))
+                overall = [r for values in by_type.values() for r in values]
+                row = "".join(f"{sum(by_type[t]) / len(by_type[t]):>9.3f}" for t in types)
+                print(f"{name:<16}{k:>4}  {row}{sum(overall) / len(overall):>9.3f}{ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
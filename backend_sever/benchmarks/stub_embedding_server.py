@@ -0,0 +1,81 @@
+"""
+Local stand-in for the HF Space embedding endpoint.
+
+Accepts {"text": "..."} -> {"embedding": [...]} and
+{"texts": [...]} -> {"embeddings": [[...], ...]}, returning deterministic
+unit vectors derived from the text hash, after an optional fake latency.
+
+    python benchmarks/stub_embedding_server.py --port 8900 --latency 0.05
+    HF_SPACE_API_URL=http://127.0.0.1:8900/embed python app.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBED_DIM = 384
+
+
+def fake_embedding(text: str, dim: int = EMBED_DIM):
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vec = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+
+def make_handler(latency: float, batch: bool):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        requests_served = 0
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            Handler.requests_served += 1
+            time.sleep(latency)
+
+            if "texts" in payload and batch:
+                body = {"embeddings": [fake_embedding(t) for t in payload["texts"]]}
+                status = 200
+            elif "text" in payload:
+                body = {"embedding": fake_embedding(payload["text"])}
+                status = 200
+            else:
+                body = {"detail": "text is required"}
+                status = 422
+
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 8900, latency: float = 0.0, batch: bool = True):
+    return StubServer(("127.0.0.1", port), make_handler(latency, batch))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds of fake latency per request")
+    parser.add_argument("--no-batch", action="store_true", help="reject {'texts': [...]} like the current Space")
+    args = parser.parse_args()
+    print(f"stub embedding server on http://127.0.0.1:{args.port}/embed")
+    serve(args.port, args.latency, not args.no_batch).serve_forever()
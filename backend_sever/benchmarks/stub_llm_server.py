@@ -0,0 +1,101 @@
+"""
+Local stand-in for the Groq chat completions API (OpenAI-compatible).
+
+Every request sleeps for --latency seconds and answers with a canned
+completion, so the API can be load-tested without spending Groq quota.
+"stream": true requests get the same reply as SSE chunks, one word at a
+time, spread over the same latency.
+
+    python benchmarks/stub_llm_server.py --port 8901 --latency 0.5
+    GROQ_API_BASE=http://127.0.0.1:8901 GROQ_API_KEY=stub python app.py
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = 'Informational\n{"task": "", "deadline": ""}\n[msg_00000001]'
+
+
+def completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+
+def completion_chunk(model: str, content: str, finish_reason=None) -> dict:
+    delta = {"role": "assistant", "content": content} if content else {}
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def make_handler(latency: float, reply: str):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if payload.get("stream"):
+                return self.stream(payload.get("model", "stub"))
+            time.sleep(latency)
+            data = json.dumps(completion(payload.get("model", "stub"), reply)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def stream(self, model: str):
+            words = reply.split(" ")
+            tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            # half the latency before the first token, the rest spread across the others
+            time.sleep(latency / 2)
+            for token in tokens:
+                self.wfile.write(f"data: {json.dumps(completion_chunk(model, token))}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(latency / 2 / len(tokens))
+            self.wfile.write(f"data: {json.dumps(completion_chunk(model, '', 'stop'))}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 8901, latency: float = 0.5, reply: str = DEFAULT_REPLY):
+    return StubServer(("127.0.0.1", port), make_handler(latency, reply))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    args = parser.parse_args()
+    print(f"stub LLM server on http://127.0.0.1:{args.port}")
+    serve(args.port, args.latency, args.reply).serve_forever()
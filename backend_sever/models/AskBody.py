@@ -1,6 +1,16 @@
 from pydantic import BaseModel
+from typing import Optional
 
 
 class AskBody(BaseModel):
     prompt: str
     k: int = 4
+    # optional pre-filters on the emails searched
+    category: Optional[str] = None
+    sender: Optional[str] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    # answer about one conversation: its rolling summary plus chunks of its emails
+    thread_id: Optional[str] = None
+    # false skips the semantic answer cache for this request
+    use_cache: bool = True
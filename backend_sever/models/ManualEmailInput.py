@@ -11,3 +11,7 @@ class ManualEmailInput(BaseModel):
     cc: Optional[List[str]] = []
     bcc: Optional[List[str]] = []
     folder: Optional[str] = "Inbox"
+    # threading: an explicit thread, or the email (our id or Message-ID) this one replies to
+    thread_id: Optional[str] = None
+    message_id: Optional[str] = None
+    in_reply_to: Optional[str] = None
@@ -0,0 +1,238 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .config import CACHE_DIR
+from .extract_idx import find as find_ids
+from .file_lock import hold_exclusive
+
+load_dotenv()
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(CACHE_DIR, "answer_cache.sqlite3"))
+# off by default: the cache file is locked by one process (see rag.file_lock)
+ANSWER_CACHE_DISABLED = os.getenv("ANSWER_CACHE_DISABLED", "true").lower() in ("1", "true", "yes")
+# cosine similarity between question embeddings needed to reuse an answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.93"))
+# questions like "deadlines this week" go stale even when no cited email changes
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+# words that change the answer while barely moving the embedding
+_GUARD_WORDS = {
+    "today", "tomorrow", "yesterday", "tonight", "this", "next", "last", "previous", "week", "weeks",
+    "month", "months", "year", "quarter", "monday", "tuesday", "wednesday", "thursday", "friday",
+    "saturday", "sunday", "not", "no", "unread", "overdue",
+}
+_WORD = re.compile(r"\w+")
+
+
+def guard_terms(question: str) -> str:
+    """msg_ ids, numbers and time words of a question; a cached answer is reused only if these match exactly."""
+    words = {w for w in _WORD.findall((question or "").lower()) if w in _GUARD_WORDS or w.isdigit()}
+    return " ".join(sorted(words | set(find_ids(question or ""))))
+
+
+def cache_scope(k: int, email_filter: Optional[dict]) -> str:
+    return json.dumps([k, email_filter or {}], sort_keys=True, default=str)
+
+
+class SemanticAnswerCache:
+    """
+    /ask answers keyed by the question's embedding. A lookup returns the answer
+    of the most similar earlier question with the same scope (k and filters) and
+    guard terms, if it is at least `threshold` similar.
+
+    Each entry remembers the emails it cited or was answered from; re-indexing
+    any of them (see rag.vector_search.index_chunks) drops the entry. Entry
+    vectors are held in memory, so one process only opens a cache file.
+    """
+
+    def __init__(self, path: str, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: int = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._owner = hold_exclusive(path + ".lock", "answer cache")
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT, guard TEXT, question TEXT, vector BLOB,"
+            " answer TEXT, docs TEXT, created_at REAL, last_hit REAL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS answer_emails (answer_id INTEGER, email_id TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answer_emails_email_id ON answer_emails(email_id)")
+        self.conn.commit()
+
+        # id -> (scope, guard, created_at, unit vector); answers stay in SQLite
+        self.entries = {}
+        for entry_id, scope, guard, blob, created_at in self.conn.execute(
+                "SELECT id, scope, guard, vector, created_at FROM answers"):
+            self.entries[entry_id] = (scope, guard, created_at, np.frombuffer(blob, dtype=np.float32))
+        self.stats = defaultdict(int)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _delete(self, ids: List[int]):
+        for entry_id in ids:
+            self.entries.pop(entry_id, None)
+        self.conn.executemany("DELETE FROM answers WHERE id = ?", [(i,) for i in ids])
+        self.conn.executemany("DELETE FROM answer_emails WHERE answer_id = ?", [(i,) for i in ids])
+
+    def lookup(self, vector, scope: str, guard: str) -> Optional[Tuple[str, List[Dict[str, Any]], float]]:
+        """(answer, docs, similarity) of the best cached answer, or None."""
+        q = self._normalize(vector)
+        now = time.time()
+        with self.lock:
+            expired = [i for i, (_, _, created_at, _) in self.entries.items() if self.ttl and now - created_at > self.ttl]
+            if expired:
+                self._delete(expired)
+                self.conn.commit()
+            candidates = [(i, vec) for i, (s, g, _, vec) in self.entries.items() if s == scope and g == guard]
+            if not candidates:
+                self.stats["misses"] += 1
+                return None
+            sims = np.stack([vec for _, vec in candidates]) @ q
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            if similarity < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            entry_id = candidates[best][0]
+            answer, docs = self.conn.execute("SELECT answer, docs FROM answers WHERE id = ?", (entry_id,)).fetchone()
+            self.conn.execute("UPDATE answers SET last_hit = ? WHERE id = ?", (now, entry_id))
+            self.conn.commit()
+            self.stats["hits"] += 1
+            self.stats["hit_similarity_sum"] += similarity
+        return answer, json.loads(docs), similarity
+
+    def put(self, question: str, vector, scope: str, guard: str, answer: str, docs: List[Dict[str, Any]],
+            email_ids: List[str]):
+        vec = self._normalize(vector)
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO answers (scope, guard, question, vector, answer, docs, created_at, last_hit)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, guard, question, array("f", vec.tolist()).tobytes(), answer,
+                 json.dumps(docs, default=str), now, now),
+            )
+            entry_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO answer_emails (answer_id, email_id) VALUES (?, ?)",
+                [(entry_id, email_id) for email_id in set(email_ids)],
+            )
+            self.entries[entry_id] = (scope, guard, now, vec)
+            if len(self.entries) > self.max_entries:
+                # least recently hit entries go first
+                overflow = len(self.entries) - self.max_entries
+                rows = self.conn.execute("SELECT id FROM answers ORDER BY last_hit ASC LIMIT ?", (overflow,)).fetchall()
+                self._delete([row for row, in rows])
+            self.conn.commit()
+            self.stats["stores"] += 1
+
+    def invalidate(self, email_ids) -> int:
+        """Drops every answer that cited or was answered from one of `email_ids`."""
+        email_ids = [e for e in set(email_ids) if e]
+        if not email_ids:
+            return 0
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT answer_id FROM answer_emails WHERE email_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(email_ids),),
+            ).fetchall()
+            ids = [row for row, in rows]
+            if ids:
+                self._delete(ids)
+                self.conn.commit()
+                self.stats["invalidated"] += len(ids)
+        return len(ids)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM answers")
+            self.conn.execute("DELETE FROM answer_emails")
+            self.conn.commit()
+            self.entries.clear()
+
+    def count(self, field: str):
+        with self.lock:
+            self.stats[field] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            entries = len(self.entries)
+        hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+        return {
+            "enabled": not ANSWER_CACHE_DISABLED,
+            "entries": entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "bypassed": stats.get("bypassed", 0),
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "avg_hit_similarity": round(stats.get("hit_similarity_sum", 0.0) / hits, 4) if hits else None,
+            "stores": stats.get("stores", 0),
+            "invalidated": stats.get("invalidated", 0),
+        }
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(ANSWER_CACHE_PATH)
+        return _answer_cache
+
+
+def lookup_answer(prompt: str, vector, k: int, email_filter: Optional[dict] = None):
+    """(answer, docs) cached for an equivalent /ask, or None."""
+    try:
+        hit = get_answer_cache().lookup(vector, cache_scope(k, email_filter), guard_terms(prompt))
+    except Exception as e:
+        print(f"Warning: Answer cache lookup failed: {str(e)}")
+        return None
+    return hit[:2] if hit else None
+
+
+def store_answer(prompt: str, vector, k: int, email_filter: Optional[dict], answer: str, docs: List[Dict[str, Any]]):
+    # answers citing no email ("I don't know") are what a newly indexed email would change
+    cited = find_ids(answer or "")
+    if not cited:
+        return
+    email_ids = cited + [d.get("email_id") for d in docs if d.get("email_id")]
+    try:
+        get_answer_cache().put(prompt, vector, cache_scope(k, email_filter), guard_terms(prompt), answer, docs, email_ids)
+    except Exception as e:
+        print(f"Warning: Failed to cache answer: {str(e)}")
+
+
+def invalidate_answers(email_ids) -> int:
+    if ANSWER_CACHE_DISABLED:
+        return 0
+    try:
+        return get_answer_cache().invalidate(email_ids)
+    except Exception as e:
+        print(f"Warning: Failed to invalidate cached answers: {str(e)}")
+        return 0
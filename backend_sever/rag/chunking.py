@@ -1,8 +1,42 @@
-import json, os, uuid
+import json, os, re, uuid, hashlib
 from rag.db_client import get_emails as db_get_emails
-from typing import List, Dict, Any
+from rag.config import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CONTEXT_TOKENIZER
+from rag.tokens import count_tokens
+from typing import List, Dict, Any, Optional, Set
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+# part of email_content_hash; bump when chunk_email changes so build_index re-chunks unchanged emails
+CHUNKER_VERSION = 3
+CHUNKER_SIGNATURE = f"v{CHUNKER_VERSION}:{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}:{CONTEXT_TOKENIZER}"
+
+# split_text keeps no state, so one splitter serves every call
+_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS, length_function=count_tokens
+)
+
+# "On Mon, 1 Jan 2024 at 09:00, Priya <priya@acme.io> wrote:" (Gmail may wrap it before "wrote:")
+_REPLY_HEADER = re.compile(r"^on\b.*\bwrote:$|^-{2,}\s*original message\s*-{2,}$|^_{10,}$", re.IGNORECASE)
+# a forwarded message is part of the email's content, headers and all
+_FORWARD_MARKER = re.compile(
+    r"^(-{2,}\s*forwarded message\s*-{2,}|begin forwarded message:)$", re.IGNORECASE
+)
+# Outlook puts a rule above the "From: / Sent:" header of the message it replies to
+_SEPARATOR = re.compile(r"^(-{5,}|_{5,})$")
+_MOBILE_FOOTER = re.compile(r"^sent from my \w+", re.IGNORECASE)
+_DISCLAIMER = re.compile(
+    r"^(this (e-?mail|message|communication)\b.*\bconfidential|confidentiality notice|disclaimer:)", re.IGNORECASE
+)
+_SIGN_OFF = re.compile(
+    r"^((best|kind|warm|many)\s+)?(regards|wishes|thanks|thank you|cheers|best|sincerely|talk soon)[,.!]?$", re.IGNORECASE
+)
+# lines after a sign-off that still count as a signature (name, title, phone, links)
+SIGNATURE_MAX_LINES = 6
+_CONTACT = re.compile(r"\S+@\S+\.\w+|https?://|www\.|^[A-Za-z .:]{0,12}\+?\d[\d ()./-]{6,}$", re.IGNORECASE)
+# "Priya Raman", "Head of Platform | Acme Inc."
+_NAME = re.compile(r"^[A-Z][\w.'&-]*(\s+([A-Z][\w.'&-]*|of|and|at|for|the|de|van|von|[|,&/-]))*[,.]?$")
+_SPACE = re.compile(r"\s+")
+
+
 def load_emails(path="mock_emails.json"):
     # Prefer DB-backed emails; fall back to file if DB empty
     try:
@@ -25,6 +59,103 @@ def flatten_email(email):
         f"{email.get('body_text')}"
     )
 
-def chunk_text(text):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-    return [{"id": str(uuid.uuid4()), "chunk": c} for c in splitter.split_text(text)]
\ No newline at end of file
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def email_content_hash(email):
+    """Hash stored with an email's chunks; changes with its content or the chunker."""
+    return content_hash(f"{CHUNKER_SIGNATURE}\n{flatten_email(email)}")
+
+
+def chunk_hash(chunk):
+    return content_hash(_SPACE.sub(" ", chunk).strip().lower())
+
+
+def _quote_start(lines, i):
+    """Index where quoted history starts if line i opens it, else None."""
+    line = lines[i].strip()
+    if _REPLY_HEADER.match(line):
+        return i
+    if line.lower().endswith("wrote:") and i > 0 and lines[i - 1].strip().lower().startswith("on "):
+        return i - 1
+    # Outlook: a rule, then "From: ..." followed by "Sent:" or "Date:"
+    if line.lower().startswith("from:") and any(
+            l.strip().lower().startswith(("sent:", "date:")) for l in lines[i + 1:i + 3]):
+        above = [j for j in range(i) if lines[j].strip()]
+        if above and _SEPARATOR.match(lines[above[-1]].strip()):
+            return above[-1]
+    return None
+
+
+def _signature_line(line):
+    return bool(_CONTACT.search(line) or _NAME.match(line))
+
+
+def clean_body(body):
+    """
+    The email's own text: quoted replies ("> ..." lines and everything after a
+    reply header), the signature and a confidentiality footer are dropped.
+    A forwarded message is kept as is. Returns `body` unchanged if nothing would
+    be left.
+    """
+    lines = (body or "").splitlines()
+    forwarded = []
+    for i in range(len(lines)):
+        if _FORWARD_MARKER.match(lines[i].strip()):
+            lines, forwarded = lines[:i], lines[i:]
+            break
+        start = _quote_start(lines, i)
+        if start is not None:
+            lines = lines[:start]
+            break
+    lines = [l for l in lines if not l.lstrip().startswith(">") and not _MOBILE_FOOTER.match(l.strip())]
+    if "--" in (l.rstrip() for l in lines):
+        lines = lines[:[l.rstrip() for l in lines].index("--")]
+    for i, line in enumerate(lines):
+        if _DISCLAIMER.match(line.strip()):
+            lines = lines[:i]
+            break
+
+    # a sign-off near the end followed only by name, title and contact lines
+    non_empty = [i for i, l in enumerate(lines) if l.strip()]
+    for i in reversed(non_empty[-SIGNATURE_MAX_LINES - 1:]):
+        if _SIGN_OFF.match(lines[i].strip()):
+            tail = [l.strip() for l in lines[i + 1:] if l.strip()]
+            if all(len(l) <= 60 and _signature_line(l) for l in tail):
+                lines = lines[:i + 1]
+            break
+
+    cleaned = re.sub(r"\n{3,}", "\n\n", "\n".join(lines + forwarded)).strip()
+    return cleaned or body
+
+
+def chunk_id(email_id, index, chunk):
+    # stable across runs, so re-indexing replaces chunks instead of duplicating them
+    return f"{email_id}:{index}:{content_hash(chunk)[:12]}"
+
+
+def chunk_text(text, email_id=None):
+    pieces = _splitter.split_text(text)
+    if email_id is None:
+        return [{"id": str(uuid.uuid4()), "chunk": c} for c in pieces]
+    return [{"id": chunk_id(email_id, i, c), "chunk": c} for i, c in enumerate(pieces)]
+
+
+def chunk_email(email, seen: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Chunks of an email with its body cleaned by clean_body. Chunks whose
+    chunk_hash is in `seen` (hashes already stored for the thread) are skipped;
+    `seen` gains the hashes of the chunks returned. Indexes in the chunk ids
+    stay positional, so skipped chunks leave gaps.
+    """
+    seen = set() if seen is None else seen
+    text = flatten_email(dict(email, body_text=clean_body(email.get("body_text") or "")))
+    chunks = []
+    for i, piece in enumerate(_splitter.split_text(text)):
+        digest = chunk_hash(piece)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        chunks.append({"id": chunk_id(email.get("id"), i, piece), "chunk": piece, "chunk_hash": digest})
+    return chunks
@@ -2,7 +2,7 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-MONGO_URI = os.getenv("MONGODB_URI", "")
+MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("MONGODB_DB", "rag_db")
 COLLECTION_NAME = os.getenv("MONGODB_COLLECTION", "email_chunks")
 
@@ -10,4 +10,40 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "BAAI/bge-small-en-v1.5")
 EMBED_DIM = 384
 CACHE_DIR = os.getenv("CACHE_DIR", "/tmp")
-HF_EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
\ No newline at end of file
+HF_EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+
+# "remote" calls HF_SPACE_API_URL, "local" runs EMBED_MODEL_NAME in-process via FastEmbed (ONNX Runtime)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "remote")
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0")) or None
+EMBED_LOCAL_BATCH_SIZE = int(os.getenv("EMBED_LOCAL_BATCH_SIZE", "64"))
+EMBED_LOCAL_MAX_WAIT_MS = int(os.getenv("EMBED_LOCAL_MAX_WAIT_MS", "5"))
+
+# "atlas" uses the $vectorSearch index on COLLECTION_NAME, "local" an in-process NumPy index mirrored from it.
+# The local index, the lexical index and the answer cache keep state in memory and lock their
+# files, so they are opt-in: run a single worker (uvicorn --workers 1) when any of them is used
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "atlas")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(CACHE_DIR, "vector_index"))
+VECTOR_INDEX_HNSW = os.getenv("VECTOR_INDEX_HNSW", "false").lower() in ("1", "true", "yes")
+VECTOR_INDEX_HNSW_MIN_SIZE = int(os.getenv("VECTOR_INDEX_HNSW_MIN_SIZE", "10000"))
+# $vectorSearch numCandidates per result requested (Atlas suggests 10-20x the limit)
+VECTOR_NUM_CANDIDATES_FACTOR = int(os.getenv("VECTOR_NUM_CANDIDATES_FACTOR", "10"))
+
+# /ask retrieval: "vector" uses Mongo only; "hybrid" fuses it with a local BM25 index, "lexical" uses BM25 alone
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(CACHE_DIR, "lexical_index.sqlite3"))
+# results taken from each retriever before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "40"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# optional cross-encoder pass over the fused top RERANK_CANDIDATES (FastEmbed, like EMBED_BACKEND=local)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "Xenova/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+
+# prompt tokens the packed /ask context may use (rag.context)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# tokenizer.json path or Hugging Face repo of the answer model's tokenizer; empty estimates tokens from length
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "")
+
+# chunk size and overlap in tokens, counted like the /ask context
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "25"))
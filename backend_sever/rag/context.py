@@ -0,0 +1,107 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from .config import CONTEXT_TOKEN_BUDGET
+from .tokens import count_tokens
+
+# neighbouring chunks share up to CHUNK_OVERLAP_TOKENS; shorter matches are coincidence
+MIN_OVERLAP = 20
+MAX_OVERLAP = 400
+GAP = "\n...\n"
+BLOCK_SEPARATOR = "\n\n"
+
+_SPACE = re.compile(r"\s+")
+
+
+def _position(doc: Dict[str, Any]) -> Optional[int]:
+    # chunk ids are "<email id>:<index>:<hash>" (rag.chunking.chunk_id)
+    parts = str(doc.get("id") or "").split(":")
+    return int(parts[1]) if len(parts) == 3 and parts[1].isdigit() else None
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that starts `right`."""
+    for size in range(min(MAX_OVERLAP, len(left), len(right)), MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge(chunks: List[Dict[str, Any]]) -> str:
+    """One email's chunks in document order; neighbours are joined without their shared overlap."""
+    chunks = sorted(chunks, key=lambda d: (_position(d) is None, _position(d) or 0))
+    text = chunks[0]["chunk"]
+    for prev, doc in zip(chunks, chunks[1:]):
+        adjacent = _position(prev) is not None and _position(doc) == _position(prev) + 1
+        overlap = _overlap(text, doc["chunk"]) if adjacent else 0
+        if overlap:
+            text += doc["chunk"][overlap:]
+        else:
+            text += ("\n" if adjacent else GAP) + doc["chunk"]
+    return text
+
+
+def _block(email_id, chunks: List[Dict[str, Any]]) -> str:
+    return f"[{chunks[0].get('label') or f'Email {email_id}'}]\n{_merge(chunks)}"
+
+
+def pack_context(docs: List[Dict[str, Any]], budget: int = CONTEXT_TOKEN_BUDGET) -> Dict[str, Any]:
+    """
+    Context for answer_question from ranked chunks: exact and contained duplicates
+    are dropped, chunks are taken in score order while the rendered context stays
+    within `budget` tokens, then each email's chunks are merged into one block
+    headed by its id. "text" is the context; the other keys are stats.
+    """
+    groups, block_tokens, kept_texts = {}, {}, []
+    separator = count_tokens(BLOCK_SEPARATOR)
+    duplicates = over_budget = 0
+    total = naive_tokens = used_tokens = duplicate_tokens = over_budget_tokens = 0
+    for doc in docs:
+        chunk = doc.get("chunk") or ""
+        chunk_tokens = count_tokens(chunk) if chunk else 0
+        naive_tokens += chunk_tokens
+        normalized = _SPACE.sub(" ", chunk).strip().lower()
+        if not normalized or any(normalized in kept for kept in kept_texts):
+            duplicates += 1
+            duplicate_tokens += chunk_tokens
+            continue
+        # only this email's block changes, so only it is rendered and counted again
+        email_id = doc.get("email_id")
+        chunks = groups.get(email_id, []) + [doc]
+        tokens = count_tokens(_block(email_id, chunks))
+        if email_id in groups:
+            candidate = total - block_tokens[email_id] + tokens
+        else:
+            candidate = total + tokens + (separator if groups else 0)
+        if candidate > budget:
+            over_budget += 1
+            over_budget_tokens += chunk_tokens
+            continue
+        groups[email_id] = chunks
+        block_tokens[email_id] = tokens
+        kept_texts.append(normalized)
+        used_tokens += chunk_tokens
+        total = candidate
+
+    # the running total can be off by a token where blocks meet; report the exact count
+    text = BLOCK_SEPARATOR.join(_block(email_id, chunks) for email_id, chunks in groups.items())
+    tokens = count_tokens(text) if text else 0
+    return {
+        "text": text,
+        "email_ids": list(groups),
+        "chunks": len(docs),
+        "chunks_used": sum(len(chunks) for chunks in groups.values()),
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+        "budget": budget,
+        "tokens": tokens,
+        "naive_tokens": naive_tokens,
+        # dropped duplicates and merged overlaps, less the email headers added
+        "tokens_saved": duplicate_tokens + used_tokens - tokens,
+        # chunks left out to fit the budget; not a saving
+        "over_budget_tokens": over_budget_tokens,
+    }
+
+
+def context_stats(context: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in context.items() if key != "text"}
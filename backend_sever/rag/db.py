@@ -1,7 +1,178 @@
-from pymongo import MongoClient
+import os
+import time
+import threading
+from typing import Optional
+from pymongo import MongoClient, monitoring
 from pymongo.collection import Collection
+from motor.motor_asyncio import AsyncIOMotorClient
 from .config import MONGO_URI, DB_NAME, COLLECTION_NAME
 
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client[DB_NAME]
-collection: Collection = db[COLLECTION_NAME]
+# Pool / timeout tuning; the defaults suit a single API process with a handful of worker threads
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+# e.g. "majority" or "1"; unset keeps the server default
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "")
+MONGO_WRITE_TIMEOUT_MS = int(os.getenv("MONGO_WRITE_TIMEOUT_MS", "10000"))
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Counts pool checkouts and how long callers waited for a connection (sync and Motor pools combined)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.pool_clears = 0
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = time.perf_counter() - getattr(self.local, "started", time.perf_counter())
+        with self.lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.failed_checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self.lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.open_connections -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "failed_checkouts": self.failed_checkouts,
+                "avg_wait_ms": round(1000 * self.total_wait / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 3),
+                "pool_clears": self.pool_clears,
+            }
+
+
+pool_stats = PoolStats()
+_client: Optional[MongoClient] = None
+# Motor client for the async request path; background jobs and the indexer keep using _client
+_async_client: Optional[AsyncIOMotorClient] = None
+_lock = threading.Lock()
+
+
+def _client_options() -> dict:
+    options = dict(
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        event_listeners=[pool_stats],
+    )
+    if MONGO_WRITE_CONCERN:
+        options["w"] = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+        options["wTimeoutMS"] = MONGO_WRITE_TIMEOUT_MS
+    return options
+
+
+def connect() -> MongoClient:
+    """Open the process-wide client; called from the app lifespan, or lazily on first use."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = MongoClient(MONGO_URI, **_client_options())
+        return _client
+
+
+def connect_async() -> AsyncIOMotorClient:
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncIOMotorClient(MONGO_URI, **_client_options())
+        return _async_client
+
+
+def close():
+    global _client, _async_client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        if _async_client is not None:
+            _async_client.close()
+            _async_client = None
+
+
+def get_db():
+    return connect()[DB_NAME]
+
+
+def get_collection(name: str) -> Collection:
+    return get_db()[name]
+
+
+def get_chunks_collection() -> Collection:
+    return get_collection(COLLECTION_NAME)
+
+
+def get_async_collection(name: str):
+    return connect_async()[DB_NAME][name]
+
+
+def get_async_chunks_collection():
+    return get_async_collection(COLLECTION_NAME)
+
+
+def get_pool_stats():
+    stats = pool_stats.snapshot()
+    stats.update({
+        "connected": _client is not None,
+        "async_connected": _async_client is not None,
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "write_concern": MONGO_WRITE_CONCERN or "server default",
+    })
+    return stats
@@ -1,20 +1,71 @@
 import os
 import json
+import base64
+import asyncio
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import UpdateOne, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from .db import get_collection, get_async_collection, get_chunks_collection
 
 load_dotenv()
 
-MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
-_client = MongoClient(MONGO_URI)
-_db = _client["rag_db"]
+# chat sessions untouched for this long are dropped by Mongo's TTL monitor
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+
+
+def _prompts_col():
+    return get_collection("prompts")
+
+
+def _emails_col():
+    return get_collection("mock_emails")
+
+
+def _jobs_col():
+    return get_collection("jobs")
+
+
+def _sessions_col():
+    return get_collection("chat_sessions")
+
+
+def _athreads_col():
+    return get_async_collection("threads")
 
-_prompts_col = _db["prompts"]
-_emails_col = _db["mock_emails"]
+
+def _aprompts_col():
+    return get_async_collection("prompts")
+
+
+def _aemails_col():
+    return get_async_collection("mock_emails")
+
+
+def ensure_indexes():
+    """Create the indexes the data-access functions rely on; safe to call on every startup."""
+    try:
+        _emails_col().create_index([("id", ASCENDING)], unique=True, name="id_unique")
+    except OperationFailure as e:
+        # existing duplicate ids: keep lookups fast even though uniqueness can't be enforced yet
+        print(f"Warning: could not create unique index on mock_emails.id: {str(e)}")
+        _emails_col().create_index([("id", ASCENDING)], name="id")
+    _emails_col().create_index([("thread_id", ASCENDING)], name="thread_id")
+    _emails_col().create_index([("category", ASCENDING)], name="category")
+    _emails_col().create_index([("timestamp", DESCENDING)], name="timestamp")
+    _emails_col().create_index([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id")
+    _emails_col().create_index([("sender_email", ASCENDING)], name="sender_email")
+    # thread resolution: In-Reply-To headers and "Re:" subjects of new emails
+    _emails_col().create_index([("message_id", ASCENDING)], name="message_id", sparse=True)
+    _emails_col().create_index([("subject_key", ASCENDING), ("timestamp", DESCENDING)], name="subject_key_timestamp")
+    # athread_chunk_hashes, which skips text a thread already has embedded
+    get_chunks_collection().create_index([("thread_id", ASCENDING)], name="thread_id")
+    _jobs_col().create_index([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at")
+    _sessions_col().create_index([("updated_at", ASCENDING)], name="updated_at_ttl", expireAfterSeconds=SESSION_TTL)
 
 
 def get_prompts():
-    doc = _prompts_col.find_one({"_id": "prompts"})
+    doc = _prompts_col().find_one({"_id": "prompts"})
     if doc and "data" in doc:
         return doc["data"]
 
@@ -29,12 +80,12 @@ def get_prompts():
 
 
 def save_prompts(data: dict):
-    _prompts_col.update_one({"_id": "prompts"}, {"$set": {"data": data}}, upsert=True)
+    _prompts_col().update_one({"_id": "prompts"}, {"$set": {"data": data}}, upsert=True)
     return True
 
 
 def get_emails():
-    docs = list(_emails_col.find({}, {"_id": 0}))
+    docs = list(_emails_col().find({}, {"_id": 0}))
     if docs:
         return docs
 
@@ -44,20 +95,274 @@ def get_emails():
             items = json.load(f)
         if items:
             # replace any existing docs
-            _emails_col.delete_many({})
+            _emails_col().delete_many({})
             # Ensure inserted docs have no _id conflicts
-            _emails_col.insert_many(items)
-            return list(_emails_col.find({}, {"_id": 0}))
+            _emails_col().insert_many(items)
+            return list(_emails_col().find({}, {"_id": 0}))
 
     return []
 
 
+def get_email(email_id: str):
+    doc = _emails_col().find_one({"id": email_id}, {"_id": 0})
+    if doc is None and _emails_col().estimated_document_count() == 0:
+        # first access on an empty DB: seed from mock_emails.json like get_emails does
+        get_emails()
+        doc = _emails_col().find_one({"id": email_id}, {"_id": 0})
+    return doc
+
+
+# ---- async (Motor) variants used by the request path ----
+
+async def aget_prompts():
+    doc = await _aprompts_col().find_one({"_id": "prompts"})
+    if doc and "data" in doc:
+        return doc["data"]
+    # first run: the sync path seeds from prompts.json
+    return await asyncio.to_thread(get_prompts)
+
+
+async def aget_emails():
+    docs = await _aemails_col().find({}, {"_id": 0}).to_list(length=None)
+    if docs:
+        return docs
+    return await asyncio.to_thread(get_emails)
+
+
+async def aget_email(email_id: str):
+    doc = await _aemails_col().find_one({"id": email_id}, {"_id": 0})
+    if doc is None and await _aemails_col().estimated_document_count() == 0:
+        return await asyncio.to_thread(get_email, email_id)
+    return doc
+
+
+async def aupdate_email(email_id: str, update_fields: dict):
+    await _aemails_col().update_one({"id": email_id}, {"$set": update_fields}, upsert=True)
+
+
+async def abulk_update_emails(updates: list):
+    """Async bulk_update_emails."""
+    ops = [UpdateOne({"id": email_id}, {"$set": fields}, upsert=True) for email_id, fields in updates if email_id]
+    if not ops:
+        return 0
+    result = await _aemails_col().bulk_write(ops, ordered=False)
+    return result.modified_count + result.upserted_count
+
+
+def get_email_ids():
+    if _emails_col().estimated_document_count() == 0:
+        get_emails()
+    return [doc["id"] for doc in _emails_col().find({"id": {"$exists": True}}, {"_id": 0, "id": 1})]
+
+
+def get_emails_by_ids(email_ids: list):
+    return list(_emails_col().find({"id": {"$in": list(email_ids)}}, {"_id": 0}))
+
+
+def query_email_ids(query: dict) -> list:
+    return _emails_col().distinct("id", query)
+
+
+async def aquery_email_ids(query: dict) -> list:
+    return await _aemails_col().distinct("id", query)
+
+
+def get_labelled_emails(categorization_hash: str):
+    """Emails the LLM categorized under the given categorization prompt."""
+    query = {
+        "processing_hashes.categorization": categorization_hash,
+        "category": {"$nin": [None, ""]},
+        "category_source": {"$ne": "local"},
+    }
+    return list(_emails_col().find(query, {"_id": 0, "id": 1, "subject": 1, "body_text": 1, "category": 1}))
+
+
+def encode_cursor(email: dict) -> str:
+    raw = json.dumps([email.get("timestamp"), email.get("id")]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    timestamp, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return timestamp, email_id
+
+
+def build_email_filter(category=None, sender=None, folder=None, since=None, until=None, after=None,
+                       thread_id=None) -> dict:
+    """Mongo filter for the list/export routes; `after` is a decoded (timestamp, id) cursor."""
+    clauses = []
+    if thread_id:
+        clauses.append({"thread_id": thread_id})
+    if category:
+        clauses.append({"category": category})
+    if sender:
+        clauses.append({"sender_email": sender})
+    if folder:
+        clauses.append({"folder": folder})
+    if since or until:
+        timestamp = {}
+        if since:
+            timestamp["$gte"] = since
+        if until:
+            timestamp["$lte"] = until
+        clauses.append({"timestamp": timestamp})
+    if after:
+        ts, email_id = after
+        clauses.append({"$or": [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "id": {"$lt": email_id}}]})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _projection(fields=None) -> dict:
+    if not fields:
+        return {"_id": 0}
+    # id and timestamp are needed to build the next cursor
+    return {"_id": 0, **{f: 1 for f in set(fields) | {"id", "timestamp"}}}
+
+
+async def aquery_emails(query: dict, fields=None, limit: int = 50) -> list:
+    cursor = _aemails_col().find(query, _projection(fields)).sort([("timestamp", DESCENDING), ("id", DESCENDING)])
+    return await cursor.to_list(length=limit)
+
+
+async def aiter_emails(query: dict, fields=None, batch_size: int = 500):
+    cursor = _aemails_col().find(query, _projection(fields)).sort([("timestamp", DESCENDING), ("id", DESCENDING)])
+    async for doc in cursor.batch_size(batch_size):
+        yield doc
+
+
 def update_email(email_id: str, update_fields: dict):
-    _emails_col.update_one({"id": email_id}, {"$set": update_fields}, upsert=True)
+    _emails_col().update_one({"id": email_id}, {"$set": update_fields}, upsert=True)
+
+
+def bulk_update_emails(updates: list):
+    """updates: list of (email_id, update_fields) pairs, written in one round-trip."""
+    ops = [UpdateOne({"id": email_id}, {"$set": fields}, upsert=True) for email_id, fields in updates if email_id]
+    if not ops:
+        return 0
+    result = _emails_col().bulk_write(ops, ordered=False)
+    return result.modified_count + result.upserted_count
 
 
 def replace_all_emails(emails_list: list):
-    _emails_col.delete_many({})
+    _emails_col().delete_many({})
     if emails_list:
-        _emails_col.insert_many(emails_list)
+        _emails_col().insert_many(emails_list)
     return True
+
+
+# ==================== JOBS ====================
+
+def create_job(job: dict):
+    _jobs_col().insert_one(job)
+    return job["_id"]
+
+
+def get_job(job_id: str):
+    return _jobs_col().find_one({"_id": job_id})
+
+
+def update_job(job_id: str, update_fields: dict):
+    _jobs_col().update_one({"_id": job_id}, {"$set": update_fields})
+
+
+def claim_job(job_id: str, owner: str, now: float, stale_after: float):
+    """Atomically mark a job as running for `owner`; returns None if another live worker holds it."""
+    return _jobs_col().find_one_and_update(
+        {
+            "_id": job_id,
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "heartbeat": {"$lt": now - stale_after}},
+            ],
+        },
+        {"$set": {"status": "running", "owner": owner, "heartbeat": now, "run_started_at": now}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def record_job_progress(job_id: str, done_ids: list, failed: list, now: float):
+    finished_ids = list(done_ids) + [f["id"] for f in failed]
+    _jobs_col().update_one(
+        {"_id": job_id},
+        {
+            "$inc": {"processed": len(done_ids), "failed_count": len(failed)},
+            "$pull": {"pending_ids": {"$in": finished_ids}},
+            "$push": {"failed": {"$each": failed}},
+            "$set": {"heartbeat": now},
+        },
+    )
+
+
+def get_unfinished_jobs():
+    return list(_jobs_col().find({"status": {"$in": ["queued", "running"]}}, {"_id": 1}).sort("created_at", 1))
+
+
+def get_session(key: str):
+    return _sessions_col().find_one({"_id": key})
+
+
+def append_session_turns(key: str, session_id: str, email_id: str, turns: list, now):
+    # $push keeps turns written concurrently by other workers
+    _sessions_col().update_one(
+        {"_id": key},
+        {
+            "$push": {"turns": {"$each": turns}},
+            "$inc": {"version": 1},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"session_id": session_id, "email_id": email_id, "summary": ""},
+        },
+        upsert=True,
+    )
+
+
+def compact_session(key: str, version: int, summary: str, turns: list, now) -> bool:
+    """Replace summary and turns only if nobody appended since `version` was read."""
+    result = _sessions_col().update_one(
+        {"_id": key, "version": version},
+        {"$set": {"summary": summary, "turns": turns, "updated_at": now}, "$inc": {"version": 1}},
+    )
+    return result.modified_count == 1
+
+
+# ==================== THREADS ====================
+
+async def aget_thread_emails(thread_id: str) -> list:
+    """The thread's emails, oldest first."""
+    cursor = _aemails_col().find({"thread_id": thread_id}, {"_id": 0}).sort([("timestamp", ASCENDING), ("id", ASCENDING)])
+    return await cursor.to_list(length=None)
+
+
+async def afind_email_ref(ref: str, fields=("id", "thread_id")):
+    """Email whose id or Message-ID header is `ref`."""
+    return await _aemails_col().find_one({"$or": [{"id": ref}, {"message_id": ref}]}, _projection(fields))
+
+
+async def afind_reply_parents(subject_key: str, participants: list, limit: int = 20) -> list:
+    """Latest emails with this subject_key that share a sender or recipient with `participants`, newest first."""
+    query = {
+        "subject_key": subject_key,
+        "$or": [{"sender_email": {"$in": participants}}, {"to": {"$in": participants}}, {"cc": {"$in": participants}}],
+    }
+    fields = ("id", "thread_id", "sender_email", "to", "cc")
+    cursor = _aemails_col().find(query, _projection(fields)).sort([("timestamp", DESCENDING)]).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+async def aget_thread_state(thread_id: str) -> dict:
+    return await _athreads_col().find_one({"_id": thread_id}) or {}
+
+
+async def asave_thread_summary(thread_id: str, version: int, summary: str, summarized_ids: list, now) -> bool:
+    """Store the rolling summary only if nobody else updated it since `version` was read."""
+    fields = {"summary": summary, "summarized_ids": summarized_ids, "updated_at": now}
+    if version == 0:
+        try:
+            await _athreads_col().insert_one({"_id": thread_id, "version": 1, **fields})
+            return True
+        except DuplicateKeyError:
+            return False
+    result = await _athreads_col().update_one({"_id": thread_id, "version": version},
+                                              {"$set": fields, "$inc": {"version": 1}})
+    return result.modified_count == 1
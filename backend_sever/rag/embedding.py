@@ -1,43 +1,313 @@
-from typing import List
+from typing import List, Optional
 import os
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from .config import CACHE_DIR, EMBED_MODEL_NAME, EMBED_BACKEND
+
 load_dotenv()
 
 # Allow overriding via env; default to the provided Space URL
 HF_SPACE_API_URL = os.getenv("HF_SPACE_API_URL", "https://rahul258789-embedding-service.hf.space/embed")
 HF_SPACE_TIMEOUT = int(os.getenv("HF_SPACE_TIMEOUT", "30"))
+# texts per request when the endpoint accepts {"texts": [...]}; 1 disables batching
+HF_SPACE_BATCH_SIZE = int(os.getenv("HF_SPACE_BATCH_SIZE", "32"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(CACHE_DIR, "embedding_cache.sqlite3"))
+EMBED_CACHE_DISABLED = os.getenv("EMBED_CACHE_DISABLED", "false").lower() in ("1", "true", "yes")
+
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=EMBED_MAX_CONCURRENCY)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+_pool = ThreadPoolExecutor(max_workers=EMBED_MAX_CONCURRENCY, thread_name_prefix="embed")
+
+# async client for the request path; recreated if used from a different event loop
+_async_http: Optional[httpx.AsyncClient] = None
+_async_http_loop = None
+# httpx's pool rescans every queued request on each release, so queue here instead
+_async_slots: Optional[asyncio.Semaphore] = None
+
+# None until the first batch call tells us whether the endpoint accepts lists
+_batch_supported: Optional[bool] = None if HF_SPACE_BATCH_SIZE > 1 else False
+
+
+class EmbeddingCache:
+    """float32 vectors in SQLite, keyed by sha256(model name + text)."""
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> dict:
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: dict):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vec).tobytes()) for key, vec in items.items()],
+            )
+            self.conn.commit()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+_backend = None
+
+
+def _get_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(EMBED_CACHE_PATH)
+        return _cache
+
+
+def _parse_embedding(data) -> List[float]:
+    # Support both {"embedding": [...] } and {"data": {...}} shapes
+    if isinstance(data, dict) and "embedding" in data:
+        return data["embedding"]
+    # Some spaces return {"data": {"embedding": [...]}}
+    if isinstance(data, dict) and "data" in data and isinstance(data["data"], dict) and "embedding" in data["data"]:
+        return data["data"]["embedding"]
+    # Some endpoints may return a list directly
+    if isinstance(data, list) and len(data) > 0 and isinstance(data[0], (list, float)):
+        return data[0]
+    raise ValueError(f"Unexpected embedding response shape: {data}")
 
 
 def _call_space(text: str) -> List[float]:
     payload = {"text": text}
     try:
-        resp = requests.post(HF_SPACE_API_URL, json=payload, timeout=HF_SPACE_TIMEOUT)
+        resp = _session.post(HF_SPACE_API_URL, json=payload, timeout=HF_SPACE_TIMEOUT)
+        resp.raise_for_status()
+        return _parse_embedding(resp.json())
+    except Exception as e:
+        raise RuntimeError(f"Failed to get embedding from HF Space: {e}")
+
+
+def _parse_batch(resp, texts: List[str]) -> Optional[List[List[float]]]:
+    if resp.status_code in (400, 404, 405, 415, 422):
+        return None
+    try:
         resp.raise_for_status()
         data = resp.json()
-        # Support both {"embedding": [...] } and {"data": {...}} shapes
-        if isinstance(data, dict) and "embedding" in data:
-            return data["embedding"]
-        # Some spaces return {"data": {"embedding": [...]}}
-        if isinstance(data, dict) and "data" in data and isinstance(data["data"], dict) and "embedding" in data["data"]:
-            return data["data"]["embedding"]
-        # Some endpoints may return a list directly
-        if isinstance(data, list) and len(data) > 0 and isinstance(data[0], (list, float)):
-            return data[0]
-        raise ValueError(f"Unexpected embedding response shape: {data}")
     except Exception as e:
         raise RuntimeError(f"Failed to get embedding from HF Space: {e}")
+    if isinstance(data, dict) and isinstance(data.get("embeddings"), list):
+        vectors = data["embeddings"]
+    elif isinstance(data, list) and len(data) == len(texts) and all(isinstance(v, list) for v in data):
+        vectors = data
+    else:
+        return None
+    return vectors if len(vectors) == len(texts) else None
+
+
+def _call_space_batch(texts: List[str]) -> Optional[List[List[float]]]:
+    """Returns None when the endpoint does not understand {"texts": [...]}."""
+    try:
+        resp = _session.post(HF_SPACE_API_URL, json={"texts": texts}, timeout=HF_SPACE_TIMEOUT)
+    except Exception as e:
+        raise RuntimeError(f"Failed to get embedding from HF Space: {e}")
+    return _parse_batch(resp, texts)
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    global _batch_supported
+    if _batch_supported is not False and len(texts) > 1:
+        vectors = _call_space_batch(texts)
+        if vectors is not None:
+            _batch_supported = True
+            return [list(v) for v in vectors]
+        _batch_supported = False
+    return [list(_call_space(t)) for t in texts]
+
+
+def _embed_uncached(texts: List[str]) -> List[List[float]]:
+    if not texts:
+        return []
+    results = []
+    if _batch_supported is None and len(texts) > 1:
+        # probe with a small batch so a non-batching endpoint still gets fanned out below
+        results.extend(_embed_batch(texts[:2]))
+        texts = texts[2:]
+    size = max(1, HF_SPACE_BATCH_SIZE) if _batch_supported else 1
+    batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+    for vectors in _pool.map(_embed_batch, batches):
+        results.extend(vectors)
+    return results
+
+
+def _get_async_http() -> httpx.AsyncClient:
+    global _async_http, _async_http_loop, _async_slots
+    loop = asyncio.get_running_loop()
+    if _async_http is None or _async_http_loop is not loop:
+        _async_http = httpx.AsyncClient(
+            timeout=httpx.Timeout(HF_SPACE_TIMEOUT, pool=None),
+            limits=httpx.Limits(max_connections=EMBED_MAX_CONCURRENCY, max_keepalive_connections=EMBED_MAX_CONCURRENCY),
+        )
+        _async_slots = asyncio.Semaphore(EMBED_MAX_CONCURRENCY)
+        _async_http_loop = loop
+    return _async_http
+
+
+async def _apost(payload: dict) -> httpx.Response:
+    client = _get_async_http()
+    async with _async_slots:
+        return await client.post(HF_SPACE_API_URL, json=payload)
+
+
+async def _acall_space(text: str) -> List[float]:
+    try:
+        resp = await _apost({"text": text})
+        resp.raise_for_status()
+        return _parse_embedding(resp.json())
+    except Exception as e:
+        raise RuntimeError(f"Failed to get embedding from HF Space: {e}")
+
+
+async def _acall_space_batch(texts: List[str]) -> Optional[List[List[float]]]:
+    try:
+        resp = await _apost({"texts": texts})
+    except Exception as e:
+        raise RuntimeError(f"Failed to get embedding from HF Space: {e}")
+    return _parse_batch(resp, texts)
+
+
+async def _aembed_batch(texts: List[str]) -> List[List[float]]:
+    global _batch_supported
+    if _batch_supported is not False and len(texts) > 1:
+        vectors = await _acall_space_batch(texts)
+        if vectors is not None:
+            _batch_supported = True
+            return [list(v) for v in vectors]
+        _batch_supported = False
+    return [list(await _acall_space(t)) for t in texts]
+
+
+async def _aembed_uncached(texts: List[str]) -> List[List[float]]:
+    if not texts:
+        return []
+    results = []
+    if _batch_supported is None and len(texts) > 1:
+        results.extend(await _aembed_batch(texts[:2]))
+        texts = texts[2:]
+    size = max(1, HF_SPACE_BATCH_SIZE) if _batch_supported else 1
+    batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+    # _apost caps how many of these are in flight at once
+    for vectors in await asyncio.gather(*[_aembed_batch(b) for b in batches]):
+        results.extend(vectors)
+    return results
+
+
+class RemoteEmbeddingBackend:
+    """Calls the HF Space (or any endpoint with the same request/response shape)."""
+
+    name = "remote"
+    model_name = EMBED_MODEL_NAME
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return _embed_uncached(list(texts))
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await _aembed_uncached(list(texts))
+
+
+def get_backend():
+    global _backend
+    with _cache_lock:
+        if _backend is None:
+            if EMBED_BACKEND == "local":
+                from .local_embedding import LocalEmbeddingBackend
+                _backend = LocalEmbeddingBackend()
+            elif EMBED_BACKEND == "remote":
+                _backend = RemoteEmbeddingBackend()
+            else:
+                raise ValueError(f"Unknown EMBED_BACKEND: {EMBED_BACKEND}")
+        return _backend
+
+
+def _cache_keys(backend, texts: List[str]) -> List[str]:
+    # backends may differ numerically for the same model, so keep their vectors apart
+    model_key = f"{backend.name}:{backend.model_name}"
+    return [EmbeddingCache.make_key(model_key, t) for t in texts]
+
+
+def _missing(keys: List[str], texts: List[str], found: dict) -> dict:
+    # embed each distinct missing text once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    return missing
 
 
 def embed_texts(texts: List[str]) -> List[List[float]]:
-    embeddings = []
-    for t in texts:
-        emb = _call_space(t)
-        embeddings.append(list(emb))
-    return embeddings
+    backend = get_backend()
+    if EMBED_CACHE_DISABLED:
+        return backend.embed(list(texts))
+
+    cache = _get_cache()
+    keys = _cache_keys(backend, texts)
+    found = cache.get_many(list(set(keys)))
+    missing = _missing(keys, texts, found)
+    if missing:
+        vectors = backend.embed(list(missing.values()))
+        fresh = dict(zip(missing.keys(), vectors))
+        cache.put_many(fresh)
+        found.update(fresh)
+
+    return [list(found[key]) for key in keys]
 
 
 def embed_query(text: str) -> List[float]:
-    emb = _call_space(text)
-    return list(emb)
+    return embed_texts([text])[0]
+
+
+async def aembed_texts(texts: List[str]) -> List[List[float]]:
+    backend = get_backend()
+    if EMBED_CACHE_DISABLED:
+        return await backend.aembed(list(texts))
+
+    cache = _get_cache()
+    keys = _cache_keys(backend, texts)
+    found = await asyncio.to_thread(cache.get_many, list(set(keys)))
+    missing = _missing(keys, texts, found)
+    if missing:
+        vectors = await backend.aembed(list(missing.values()))
+        fresh = dict(zip(missing.keys(), vectors))
+        await asyncio.to_thread(cache.put_many, fresh)
+        found.update(fresh)
+
+    return [list(found[key]) for key in keys]
+
+
+async def aembed_query(text: str) -> List[float]:
+    return (await aembed_texts([text]))[0]
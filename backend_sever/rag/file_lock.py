@@ -0,0 +1,32 @@
+"""Single-process guard for the on-disk indexes that keep part of their state in memory"""
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class IndexInUse(RuntimeError):
+    pass
+
+
+def hold_exclusive(path: str, what: str):
+    """
+    Exclusive lock on `path`, held until the returned file is closed. A second
+    process (another uvicorn worker) opening the same index fails here instead
+    of silently diverging from the first one's in-memory state.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    handle = open(path, "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        raise IndexInUse(f"{what} is open in another process (lock {path}); it needs a single worker")
+    return handle
@@ -1,23 +1,14 @@
-from langchain_groq import ChatGroq
+from agents.llm_client import get_llm
 
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0,
-)
+llm = get_llm("rag_answer", temperature=0)
 
-def answer_question(prompt: str, docs):
-    """
-    Generates an answer using only the provided docs.
-    If answer is not found, the model must respond "I don't know".
-    Also at the end, include list of email IDs used in: [msg_id1, msg_id2]
-    """
-    context = "\n\n".join([d["chunk"] for d in docs])
-
-    final_prompt = f"""
+def build_answer_prompt(prompt: str, context):
+    """context: rag.context.pack_context output"""
+    return f"""
 You are an AI that answers strictly from the given context.
 
-CONTEXT:
-{context}
+CONTEXT (emails {", ".join(context["email_ids"]) or "none"}):
+{context["text"]}
 
 QUESTION:
 {prompt}
@@ -30,5 +21,25 @@ RESPONSE RULES:
 ANSWER:
 """
 
-    result = llm.invoke(final_prompt)
+
+def answer_question(prompt: str, context):
+    """
+    Generates an answer using only the packed context.
+    If answer is not found, the model must respond "I don't know".
+    Also at the end, include list of email IDs used in: [msg_id1, msg_id2]
+    """
+    result = llm.invoke(build_answer_prompt(prompt, context))
+    return result.content
+
+
+async def aanswer_question(prompt: str, context):
+    result = await llm.ainvoke(build_answer_prompt(prompt, context))
     return result.content
+
+
+async def astream_answer(prompt: str, context):
+    """Same answer as aanswer_question, yielded token by token."""
+    async for chunk in llm.astream(build_answer_prompt(prompt, context)):
+        if chunk.content:
+            yield chunk.content
+
@@ -1,20 +1,98 @@
+import os
+from pymongo import ReplaceOne, DeleteMany
 from .embedding import embed_texts
-from .chunking import flatten_email, chunk_text, load_emails
-from .db import collection
+from .chunking import chunk_email, load_emails, email_content_hash
+from .db import get_chunks_collection
+from .vector_search import index_chunks, remove_chunks
+
+# emails embedded and written together: one embed_texts call and one bulk_write each
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "50"))
+
+
+def _existing_chunks():
+    """email_id -> {"hash": email_hash of its chunks, "ids": chunk _ids, "chunk_hashes": their chunk_hash}"""
+    existing = {}
+    for doc in get_chunks_collection().find({}, {"_id": 1, "email_id": 1, "email_hash": 1, "chunk_hash": 1}):
+        entry = existing.setdefault(doc.get("email_id"), {"hashes": set(), "ids": set(), "chunk_hashes": set()})
+        entry["hashes"].add(doc.get("email_hash"))
+        entry["ids"].add(doc["_id"])
+        entry["chunk_hashes"].add(doc.get("chunk_hash"))
+    return {
+        email_id: {"hash": next(iter(e["hashes"])) if len(e["hashes"]) == 1 else None, "ids": e["ids"],
+                   "chunk_hashes": e["chunk_hashes"] - {None}}
+        for email_id, e in existing.items()
+    }
+
+
+def _write_batch(batch):
+    """batch: list of (email_id, thread_id, email_hash, chunks, stale_ids) for emails that changed."""
+    chunks_flat = [c for _, _, _, chunks, _ in batch for c in chunks]
+    vectors = embed_texts([c["chunk"] for c in chunks_flat])
+
+    ops = []
+    docs = []
+    stale = []
+    offset = 0
+    for email_id, thread_id, email_hash, chunks, stale_ids in batch:
+        for chunk, vec in zip(chunks, vectors[offset:offset + len(chunks)]):
+            doc = {"_id": chunk["id"], "email_id": email_id, "thread_id": thread_id, "email_hash": email_hash,
+                   "chunk": chunk["chunk"], "chunk_hash": chunk["chunk_hash"], "embedding": vec}
+            ops.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+            docs.append(doc)
+        offset += len(chunks)
+        stale.extend(stale_ids)
+    if stale:
+        ops.append(DeleteMany({"_id": {"$in": stale}}))
+    if ops:
+        get_chunks_collection().bulk_write(ops, ordered=False)
+    index_chunks(docs)
+    if stale:
+        remove_chunks(chunk_ids=[str(i) for i in stale])
 
-def upsert(email_id, chunks, vectors):
-    for chunk, vec in zip(chunks, vectors):
-        collection.replace_one(
-            {"_id": chunk["id"]},
-            {"_id": chunk["id"], "email_id": email_id, "chunk": chunk["chunk"], "embedding": vec},
-            upsert=True,
-        )
 
 def build_index(path="mock_emails.json"):
-    emails = load_emails(path)
+    """
+    Incremental, idempotent re-index of every email into email_chunks.
+
+    Emails whose content hash matches the stored chunks are skipped;
+    changed emails get their chunks replaced (stale chunk ids are deleted);
+    chunks of emails that no longer exist are removed. Emails are chunked
+    oldest first, and a chunk already stored for an earlier email of the
+    thread is not stored again.
+    """
+    emails = sorted(load_emails(path), key=lambda e: e.get("timestamp") or "")
+    existing = _existing_chunks()
+    stats = {"indexed": len(emails), "added": 0, "updated": 0, "skipped": 0, "removed_emails": 0, "removed_chunks": 0}
+
+    thread_hashes = {}
+    batch = []
     for email in emails:
-        text = flatten_email(email)
-        chunks = chunk_text(text)
-        vectors = embed_texts([c["chunk"] for c in chunks])
-        upsert(email["id"], chunks, vectors)
-    return len(emails)
+        email_id = email.get("id")
+        email_hash = email_content_hash(email)
+        seen = thread_hashes.setdefault(email.get("thread_id") or email_id, set())
+        previous = existing.pop(email_id, None)
+        if previous and previous["hash"] == email_hash:
+            seen.update(previous["chunk_hashes"])
+            stats["skipped"] += 1
+            continue
+
+        chunks = chunk_email(email, seen)
+        stale_ids = list(previous["ids"] - {c["id"] for c in chunks}) if previous else []
+        stats["updated" if previous else "added"] += 1
+        batch.append((email_id, email.get("thread_id"), email_hash, chunks, stale_ids))
+        if len(batch) >= INDEX_BATCH_SIZE:
+            _write_batch(batch)
+            batch = []
+    if batch:
+        _write_batch(batch)
+
+    # chunks whose email is gone (or legacy chunks without an email_id)
+    orphan_ids = [i for entry in existing.values() for i in entry["ids"]]
+    if orphan_ids:
+        for i in range(0, len(orphan_ids), 1000):
+            get_chunks_collection().delete_many({"_id": {"$in": orphan_ids[i:i + 1000]}})
+        remove_chunks(chunk_ids=[str(i) for i in orphan_ids])
+    stats["removed_emails"] = len(existing)
+    stats["removed_chunks"] = len(orphan_ids)
+
+    return stats
@@ -0,0 +1,122 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Dict, Any, Iterable, Optional
+
+from .config import LEXICAL_INDEX_PATH
+from .db import get_chunks_collection
+from .file_lock import hold_exclusive
+
+_TERM = re.compile(r"\w+")
+MAX_QUERY_TERMS = 64
+
+_lexical_index = None
+_lexical_lock = threading.Lock()
+
+
+class LexicalIndex:
+    """
+    BM25 keyword search over email_chunks, mirrored into a SQLite FTS5 table
+    (an inverted index with bm25() ranking built into SQLite).
+
+    Complements vector search on exact tokens: sender names, addresses and
+    msg_ ids, which "_" is kept inside of as a token character. Like the local
+    vector index it mirrors, it is opened by one process only.
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._owner = hold_exclusive(path + ".lock", "lexical index")
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+            "id UNINDEXED, email_id UNINDEXED, chunk, tokenize = \"unicode61 tokenchars '_'\")"
+        )
+        self.db.commit()
+
+    @property
+    def count(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+    def upsert(self, docs: Iterable[Dict[str, Any]]):
+        """docs: email_chunks documents with _id, email_id and chunk."""
+        docs = list(docs)
+        if not docs:
+            return
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM chunks WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps([str(d["_id"]) for d in docs]),),
+            )
+            self.db.executemany(
+                "INSERT INTO chunks (id, email_id, chunk) VALUES (?, ?, ?)",
+                [(str(d["_id"]), d.get("email_id"), d.get("chunk") or "") for d in docs],
+            )
+            self.db.commit()
+
+    def delete(self, chunk_ids: Optional[List[str]] = None, email_ids: Optional[List[str]] = None):
+        with self.lock:
+            removed = 0
+            if chunk_ids:
+                removed += self.db.execute(
+                    "DELETE FROM chunks WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps([str(c) for c in chunk_ids]),),
+                ).rowcount
+            if email_ids:
+                removed += self.db.execute(
+                    "DELETE FROM chunks WHERE email_id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(list(email_ids)),),
+                ).rowcount
+            self.db.commit()
+            return removed
+
+    @staticmethod
+    def match_query(text: str) -> Optional[str]:
+        """FTS5 query matching any term of `text`; BM25 ranks chunks with more (and rarer) terms first."""
+        terms = list(dict.fromkeys(t.lower() for t in _TERM.findall(text or "")))[:MAX_QUERY_TERMS]
+        if not terms:
+            return None
+        return " OR ".join(f'"{t}"' for t in terms)
+
+    def search(self, query: str, k: int, email_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Top `k` chunks by BM25; `email_ids` restricts the search to those emails."""
+        match = self.match_query(query)
+        if match is None or k <= 0 or email_ids == []:
+            return []
+        sql = "SELECT id, email_id, chunk, bm25(chunks) FROM chunks WHERE chunks MATCH ?"
+        params = [match]
+        if email_ids is not None:
+            sql += " AND email_id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(email_ids)))
+        sql += " ORDER BY bm25(chunks) LIMIT ?"
+        params.append(k)
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        # bm25() is negative, lower is better
+        return [{"id": i, "chunk": chunk, "email_id": email_id, "score": -float(score)}
+                for i, email_id, chunk, score in rows]
+
+
+def rebuild_lexical_index(index, batch_size: int = 1000):
+    """Load every chunk already stored in email_chunks into the lexical index."""
+    batch = []
+    for doc in get_chunks_collection().find({}, {"_id": 1, "email_id": 1, "chunk": 1}):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            index.upsert(batch)
+            batch = []
+    index.upsert(batch)
+
+
+def get_lexical_index():
+    global _lexical_index
+    with _lexical_lock:
+        if _lexical_index is None:
+            _lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+            if _lexical_index.count == 0:
+                rebuild_lexical_index(_lexical_index)
+        return _lexical_index
@@ -0,0 +1,105 @@
+import asyncio
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from .config import (
+    CACHE_DIR,
+    EMBED_MODEL_NAME,
+    EMBED_THREADS,
+    EMBED_LOCAL_BATCH_SIZE,
+    EMBED_LOCAL_MAX_WAIT_MS,
+)
+
+
+class _Request:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.vectors: Optional[List[List[float]]] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class LocalEmbeddingBackend:
+    """
+    Runs the embedding model in-process with FastEmbed (ONNX Runtime, CPU).
+
+    The model is loaded on first use. Concurrent callers are coalesced by a
+    single batching thread: it waits up to max_wait_ms for more requests and
+    runs them through the model together, up to batch_size texts at a time.
+    """
+
+    name = "local"
+
+    def __init__(self, model_name: str = EMBED_MODEL_NAME, threads: Optional[int] = EMBED_THREADS,
+                 batch_size: int = EMBED_LOCAL_BATCH_SIZE, max_wait_ms: int = EMBED_LOCAL_MAX_WAIT_MS):
+        self.model_name = model_name
+        self.threads = threads
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._model = None
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from fastembed import TextEmbedding
+                except ImportError:
+                    raise RuntimeError("EMBED_BACKEND=local requires the fastembed package (pip install fastembed)")
+                self._model = TextEmbedding(model_name=self.model_name, cache_dir=CACHE_DIR, threads=self.threads)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._batch_loop, name="local-embed", daemon=True)
+                self._thread.start()
+        return self._model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        self._load()
+        request = _Request(list(texts))
+        self._queue.put(request)
+        request.done.wait()
+        if request.error:
+            raise RuntimeError(f"Local embedding failed: {request.error}")
+        return request.vectors
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        # the batching thread does the work; just don't block the event loop while waiting
+        return await asyncio.to_thread(self.embed, texts)
+
+    def _collect(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect()
+            texts = [t for request in batch for t in request.texts]
+            try:
+                vectors = [v.tolist() for v in self._model.embed(texts, batch_size=self.batch_size)]
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            offset = 0
+            for request in batch:
+                request.vectors = vectors[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+                request.done.set()
@@ -0,0 +1,211 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Any, Iterable, Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .file_lock import hold_exclusive
+
+
+class LocalVectorIndex:
+    """
+    In-process replacement for Atlas $vectorSearch over email_chunks.
+
+    Vectors are L2-normalised float32 rows of a memory-mapped .npy file, so
+    cosine similarity is a single matrix-vector product. Chunk metadata
+    (id, email_id, text) lives in a SQLite table keyed by the matrix row.
+    Deleted rows are zeroed and reused by later inserts.
+
+    With use_hnsw=True and hnswlib installed, searches switch to an HNSW
+    graph once the index holds at least hnsw_min_size vectors.
+
+    Row assignments and the free list live in memory, so only one process may
+    open a directory; a second one gets IndexInUse.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, path: str, dim: int, use_hnsw: bool = False, hnsw_min_size: int = 10000):
+        self.dim = dim
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._owner = hold_exclusive(os.path.join(path, "index.lock"), "local vector index")
+        self.vec_path = os.path.join(path, "vectors.npy")
+
+        self.meta = sqlite3.connect(os.path.join(path, "meta.sqlite3"), check_same_thread=False)
+        self.meta.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE, email_id TEXT, chunk TEXT)"
+        )
+        self.meta.execute("CREATE INDEX IF NOT EXISTS chunks_email_id ON chunks(email_id)")
+        self.meta.commit()
+
+        if os.path.exists(self.vec_path):
+            self.vectors = np.load(self.vec_path, mmap_mode="r+")
+        else:
+            self.vectors = open_memmap(self.vec_path, mode="w+", dtype=np.float32, shape=(self.INITIAL_CAPACITY, dim))
+
+        rows = self.meta.execute("SELECT row, id FROM chunks").fetchall()
+        self.row_of = {chunk_id: row for row, chunk_id in rows}
+        self.live = np.zeros(len(self.vectors), dtype=bool)
+        for row, _ in rows:
+            self.live[row] = True
+        self.size = max((row for row, _ in rows), default=-1) + 1
+        self.free = [r for r in range(self.size) if not self.live[r]]
+
+        self.use_hnsw = use_hnsw
+        self.hnsw_min_size = hnsw_min_size
+        self._hnsw = None
+
+    @property
+    def count(self) -> int:
+        return int(self.live[:self.size].sum())
+
+    @staticmethod
+    def _normalize(mat: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return mat / norms
+
+    def _grow(self, min_capacity: int):
+        capacity = len(self.vectors)
+        if min_capacity <= capacity:
+            return
+        new_capacity = max(capacity * 2, min_capacity)
+        tmp_path = self.vec_path + ".tmp"
+        grown = open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, self.dim))
+        grown[:capacity] = self.vectors
+        grown.flush()
+        del grown
+        del self.vectors
+        os.replace(tmp_path, self.vec_path)
+        self.vectors = np.load(self.vec_path, mmap_mode="r+")
+        self.live = np.concatenate([self.live, np.zeros(new_capacity - capacity, dtype=bool)])
+        if self._hnsw is not None:
+            self._hnsw.resize_index(new_capacity)
+
+    def upsert(self, docs: Iterable[Dict[str, Any]]):
+        """docs: email_chunks documents with _id, email_id, chunk and embedding."""
+        docs = list(docs)
+        if not docs:
+            return
+        with self.lock:
+            rows = []
+            for doc in docs:
+                chunk_id = str(doc["_id"])
+                row = self.row_of.get(chunk_id)
+                if row is None:
+                    row = self.free.pop() if self.free else self.size
+                    self.row_of[chunk_id] = row
+                    self.size = max(self.size, row + 1)
+                rows.append(row)
+            self._grow(self.size)
+
+            mat = self._normalize(np.asarray([d["embedding"] for d in docs], dtype=np.float32))
+            self.vectors[rows] = mat
+            self.vectors.flush()
+            self.live[rows] = True
+
+            self.meta.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, email_id, chunk) VALUES (?, ?, ?, ?)",
+                [(row, str(d["_id"]), d.get("email_id"), d.get("chunk")) for row, d in zip(rows, docs)],
+            )
+            self.meta.commit()
+
+            if self._hnsw is not None:
+                self._hnsw.add_items(mat, rows, replace_deleted=True)
+
+    def delete(self, chunk_ids: Optional[List[str]] = None, email_ids: Optional[List[str]] = None):
+        with self.lock:
+            found = []
+            if chunk_ids:
+                ids = [str(c) for c in chunk_ids]
+                found += self._select("SELECT row, id FROM chunks WHERE id IN ({})", ids)
+            if email_ids:
+                found += self._select("SELECT row, id FROM chunks WHERE email_id IN ({})", list(email_ids))
+            if not found:
+                return 0
+
+            rows = sorted({row for row, _ in found})
+            self.meta.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self.meta.commit()
+            self.vectors[rows] = 0.0
+            self.vectors.flush()
+            self.live[rows] = False
+            self.free.extend(rows)
+            for _, chunk_id in found:
+                self.row_of.pop(chunk_id, None)
+            if self._hnsw is not None:
+                for row in rows:
+                    self._hnsw.mark_deleted(row)
+            return len(rows)
+
+    def _select(self, sql: str, values: list) -> list:
+        out = []
+        for i in range(0, len(values), 500):
+            part = values[i:i + 500]
+            out += self.meta.execute(sql.format(",".join("?" * len(part))), part).fetchall()
+        return out
+
+    def _hnsw_index(self):
+        if not self.use_hnsw or self.count < self.hnsw_min_size:
+            return None
+        if self._hnsw is None:
+            try:
+                import hnswlib
+            except ImportError:
+                self.use_hnsw = False
+                return None
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(max_elements=len(self.vectors), ef_construction=200, M=16, allow_replace_deleted=True)
+            rows = np.nonzero(self.live[:self.size])[0]
+            index.add_items(np.asarray(self.vectors[rows]), rows)
+            self._hnsw = index
+        return self._hnsw
+
+    def _rows_of_emails(self, email_ids: List[str]) -> np.ndarray:
+        rows = self.meta.execute(
+            "SELECT row FROM chunks WHERE email_id IN (SELECT value FROM json_each(?))", (json.dumps(list(email_ids)),)
+        ).fetchall()
+        return np.asarray(sorted(row for row, in rows), dtype=np.int64)
+
+    def search(self, query_vec, k: int, email_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Top `k` chunks by cosine similarity; `email_ids` restricts the search to those emails."""
+        q = self._normalize(np.asarray(query_vec, dtype=np.float32))
+        with self.lock:
+            k = min(k, self.count)
+            if k <= 0:
+                return []
+            index = self._hnsw_index() if email_ids is None else None
+            if email_ids is not None:
+                # pre-filtered: score only the chunks of the allowed emails
+                candidates = self._rows_of_emails(email_ids)
+                if len(candidates) == 0:
+                    return []
+                k = min(k, len(candidates))
+                sims = np.asarray(self.vectors[candidates]) @ q
+                top = np.argpartition(-sims, k - 1)[:k]
+                top = top[np.argsort(-sims[top])]
+                rows = candidates[top].tolist()
+                scores = sims[top].tolist()
+            elif index is not None:
+                index.set_ef(max(64, 2 * k))
+                labels, distances = index.knn_query(q, k=k)
+                rows = labels[0].tolist()
+                scores = (1.0 - distances[0]).tolist()
+            else:
+                sims = np.asarray(self.vectors[:self.size]) @ q
+                sims[~self.live[:self.size]] = -np.inf
+                top = np.argpartition(-sims, k - 1)[:k]
+                top = top[np.argsort(-sims[top])]
+                rows = top.tolist()
+                scores = sims[top].tolist()
+
+            meta = {row: (chunk_id, email_id, chunk) for row, chunk_id, email_id, chunk in
+                    self._select("SELECT row, id, email_id, chunk FROM chunks WHERE row IN ({})", rows)}
+        return [
+            {"id": meta[row][0], "chunk": meta[row][2], "email_id": meta[row][1], "score": float(score)}
+            for row, score in zip(rows, scores) if row in meta
+        ]
@@ -0,0 +1,55 @@
+import threading
+from typing import List, Dict, Any
+
+from .config import CACHE_DIR, EMBED_THREADS, RERANK_MODEL
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk) pairs with a local cross-encoder through FastEmbed
+    (ONNX Runtime, CPU). The model is loaded on first use.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, threads=EMBED_THREADS):
+        self.model_name = model_name
+        self.threads = threads
+        self._model = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            # a model that failed to load is not retried on every query
+            if self._error is not None:
+                raise RuntimeError(self._error)
+            if self._model is None:
+                try:
+                    from fastembed.rerank.cross_encoder import TextCrossEncoder
+                    self._model = TextCrossEncoder(model_name=self.model_name, cache_dir=CACHE_DIR, threads=self.threads)
+                except ImportError:
+                    self._error = "RERANK_ENABLED requires the fastembed package (pip install fastembed)"
+                    raise RuntimeError(self._error)
+                except Exception as e:
+                    self._error = f"could not load {self.model_name}: {str(e)}"
+                    raise
+        return self._model
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """Top `k` of `docs` by cross-encoder score, which replaces their "score"."""
+        if not docs:
+            return []
+        model = self._load()
+        scores = list(model.rerank(query, [d["chunk"] for d in docs]))
+        ranked = sorted(zip(scores, range(len(docs))), key=lambda item: -item[0])[:k]
+        return [dict(docs[i], score=float(score)) for score, i in ranked]
+
+
+def get_reranker() -> CrossEncoderReranker:
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker()
+        return _reranker
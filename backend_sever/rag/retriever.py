@@ -0,0 +1,90 @@
+import asyncio
+
+from .config import RETRIEVAL_MODE, RETRIEVAL_CANDIDATES, RRF_K, RERANK_ENABLED, RERANK_CANDIDATES
+from .embedding import embed_query, aembed_query
+from .vector_search import vector_search, avector_search
+from .lexical_index import get_lexical_index
+from .reranker import get_reranker
+from .db_client import query_email_ids, aquery_email_ids
+from .extract_idx import find as find_ids
+
+
+_last_rerank_error = None
+
+
+def reciprocal_rank_fusion(result_lists, k: int = RRF_K):
+    """
+    Merges ranked chunk lists; each chunk scores sum(1 / (k + rank)) over the
+    lists it appears in. Ties keep the order of `result_lists`.
+    """
+    scores, docs = {}, {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = doc.get("id") or (doc.get("email_id"), doc.get("chunk"))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=lambda key: -scores[key])
+    return [dict(docs[key], score=scores[key]) for key in ranked]
+
+
+def _lexical_search(prompt, k, email_ids=None):
+    # the first call may rebuild the index from Mongo, so async callers run all of it in a thread
+    return get_lexical_index().search(prompt, k, email_ids)
+
+
+def _pin_named_emails(prompt, fused):
+    """Chunks of emails the prompt names by msg_ id go first; a lookup by id should never miss."""
+    named = set(find_ids(prompt))
+    if not named:
+        return fused
+    return [d for d in fused if d.get("email_id") in named] + [d for d in fused if d.get("email_id") not in named]
+
+
+def _rerank(prompt, fused, k, rerank):
+    if not rerank:
+        return fused[:k]
+    try:
+        return get_reranker().rerank(prompt, fused[:max(RERANK_CANDIDATES, k)], k)
+    except Exception as e:
+        global _last_rerank_error
+        if str(e) != _last_rerank_error:
+            _last_rerank_error = str(e)
+            print(f"Warning: reranking failed, using fused order: {str(e)}")
+        return fused[:k]
+
+
+def retrieve(prompt, k, email_filter=None, mode=RETRIEVAL_MODE, rerank=RERANK_ENABLED, query_vec=None):
+    """
+    Top `k` chunks for `prompt`. `email_filter` is a mock_emails query (see
+    build_email_filter); it is resolved to email ids and pushed into both searches.
+    `query_vec` is the prompt's embedding, if the caller already has it.
+    """
+    email_ids = query_email_ids(email_filter) if email_filter else None
+    candidates = max(RETRIEVAL_CANDIDATES, k)
+    vector_docs = []
+    if mode != "lexical":
+        vector_docs = vector_search(query_vec or embed_query(prompt), candidates, email_ids)
+    lexical_docs = _lexical_search(prompt, candidates, email_ids) if mode != "vector" else []
+    fused = _pin_named_emails(prompt, reciprocal_rank_fusion([lexical_docs, vector_docs]))
+    return _rerank(prompt, fused, k, rerank)
+
+
+async def aretrieve(prompt, k, email_filter=None, mode=RETRIEVAL_MODE, rerank=RERANK_ENABLED, query_vec=None):
+    email_ids = await aquery_email_ids(email_filter) if email_filter else None
+    candidates = max(RETRIEVAL_CANDIDATES, k)
+
+    async def vector():
+        if mode == "lexical":
+            return []
+        return await avector_search(query_vec or await aembed_query(prompt), candidates, email_ids)
+
+    async def lexical():
+        if mode == "vector":
+            return []
+        return await asyncio.to_thread(_lexical_search, prompt, candidates, email_ids)
+
+    vector_docs, lexical_docs = await asyncio.gather(vector(), lexical())
+    fused = _pin_named_emails(prompt, reciprocal_rank_fusion([lexical_docs, vector_docs]))
+    if not rerank:
+        return fused[:k]
+    return await asyncio.to_thread(_rerank, prompt, fused, k, rerank)
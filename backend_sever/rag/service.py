@@ -1,9 +1,57 @@
-from .embedding import embed_query
-from .vector_search import vector_search
-from .groq_llm import answer_question
-
-def rag_answer(prompt, k):
-    q = embed_query(prompt + " what action / task / issue?")
-    docs = vector_search(q, k)
-    reply = answer_question(prompt, docs)
-    return reply, docs
+import asyncio
+
+from .answer_cache import ANSWER_CACHE_DISABLED, get_answer_cache, lookup_answer, store_answer
+from .context import context_stats, pack_context
+from .embedding import embed_query, aembed_query
+from .retriever import retrieve, aretrieve
+from .groq_llm import answer_question, aanswer_question
+
+
+def answer_cache_enabled(use_cache: bool) -> bool:
+    if ANSWER_CACHE_DISABLED:
+        return False
+    if not use_cache:
+        get_answer_cache().count("bypassed")
+    return use_cache
+
+
+def rag_answer(prompt, k, email_filter=None, use_cache=True, pinned=None):
+    """
+    (answer, docs, cached, context); context holds the packing stats (None for a
+    cached answer). `use_cache=False` skips the semantic answer cache lookup.
+    `pinned` docs (a thread summary) go ahead of the retrieved ones.
+    The routes use arag_answer; this blocking version is the sync baseline of
+    benchmarks/load_test.py.
+    """
+    if not answer_cache_enabled(use_cache):
+        docs = (pinned or []) + retrieve(prompt, k, email_filter)
+        context = pack_context(docs)
+        return answer_question(prompt, context), docs, False, context_stats(context)
+
+    query_vec = embed_query(prompt)
+    hit = lookup_answer(prompt, query_vec, k, email_filter)
+    if hit:
+        return hit[0], hit[1], True, None
+    docs = (pinned or []) + retrieve(prompt, k, email_filter, query_vec=query_vec)
+    context = pack_context(docs)
+    reply = answer_question(prompt, context)
+    store_answer(prompt, query_vec, k, email_filter, reply, docs)
+    return reply, docs, False, context_stats(context)
+
+
+async def arag_answer(prompt, k, email_filter=None, use_cache=True, pinned=None):
+    if not answer_cache_enabled(use_cache):
+        docs = (pinned or []) + await aretrieve(prompt, k, email_filter)
+        context = pack_context(docs)
+        return await aanswer_question(prompt, context), docs, False, context_stats(context)
+
+    query_vec = await aembed_query(prompt)
+    # the cache searches its vectors and writes SQLite: both stay off the event loop
+    hit = await asyncio.to_thread(lookup_answer, prompt, query_vec, k, email_filter)
+    if hit:
+        return hit[0], hit[1], True, None
+    docs = (pinned or []) + await aretrieve(prompt, k, email_filter, query_vec=query_vec)
+    context = pack_context(docs)
+    reply = await aanswer_question(prompt, context)
+    await asyncio.to_thread(store_answer, prompt, query_vec, k, email_filter, reply, docs)
+    return reply, docs, False, context_stats(context)
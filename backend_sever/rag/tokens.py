@@ -0,0 +1,36 @@
+import os
+import threading
+
+from .config import CONTEXT_TOKENIZER
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token is close enough for llama tokenizers on English mail
+    return max(1, len(text) // 4)
+
+
+def _get_tokenizer():
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None and CONTEXT_TOKENIZER:
+            try:
+                from tokenizers import Tokenizer
+                if os.path.exists(CONTEXT_TOKENIZER):
+                    _tokenizer = Tokenizer.from_file(CONTEXT_TOKENIZER)
+                else:
+                    _tokenizer = Tokenizer.from_pretrained(CONTEXT_TOKENIZER)
+            except Exception as e:
+                print(f"Warning: could not load tokenizer {CONTEXT_TOKENIZER}, estimating tokens: {str(e)}")
+                _tokenizer = False
+        return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """Exact with CONTEXT_TOKENIZER, estimated otherwise."""
+    tokenizer = _get_tokenizer()
+    if tokenizer:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return estimate_tokens(text)
@@ -1,17 +1,109 @@
-from .db import collection
-from .config import EMBED_DIM
-
-def vector_search(query_vec, k):
-    pipeline = [
-        {
-            "$vectorSearch": {
-                "index": "vector_index",
-                "path": "embedding",
-                "queryVector": query_vec,
-                "numCandidates": 200,
-                "limit": k
-            }
-        },
-        {"$project": {"chunk": 1, "email_id": 1, "_id": 0}}
+import asyncio
+import threading
+from .db import get_chunks_collection, get_async_chunks_collection
+from .config import (
+    EMBED_DIM,
+    VECTOR_BACKEND,
+    VECTOR_INDEX_DIR,
+    VECTOR_INDEX_HNSW,
+    VECTOR_INDEX_HNSW_MIN_SIZE,
+    VECTOR_NUM_CANDIDATES_FACTOR,
+    RETRIEVAL_MODE,
+)
+from .lexical_index import get_lexical_index
+from .answer_cache import invalidate_answers
+
+_local_index = None
+_local_lock = threading.Lock()
+
+
+def get_local_index():
+    global _local_index
+    with _local_lock:
+        if _local_index is None:
+            from .local_index import LocalVectorIndex
+            _local_index = LocalVectorIndex(
+                VECTOR_INDEX_DIR, EMBED_DIM,
+                use_hnsw=VECTOR_INDEX_HNSW, hnsw_min_size=VECTOR_INDEX_HNSW_MIN_SIZE,
+            )
+            if _local_index.count == 0:
+                rebuild_local_index(_local_index)
+        return _local_index
+
+
+def rebuild_local_index(index, batch_size: int = 1000):
+    """Load every chunk already stored in email_chunks into the local index."""
+    batch = []
+    for doc in get_chunks_collection().find({}, {"_id": 1, "email_id": 1, "chunk": 1, "embedding": 1}):
+        if doc.get("embedding"):
+            batch.append(doc)
+        if len(batch) >= batch_size:
+            index.upsert(batch)
+            batch = []
+    index.upsert(batch)
+
+
+def index_chunks(docs):
+    """
+    Mirror chunks just written to email_chunks into the local vector and lexical
+    indexes (each only when it is searched), and drop cached answers that relied
+    on their emails or threads.
+    """
+    if VECTOR_BACKEND == "local":
+        get_local_index().upsert(docs)
+    if RETRIEVAL_MODE != "vector":
+        get_lexical_index().upsert(docs)
+    invalidate_answers({d.get("email_id") for d in docs} | {d.get("thread_id") for d in docs})
+
+
+def remove_chunks(chunk_ids=None, email_ids=None):
+    """Mirror chunk deletions from email_chunks into the local vector and lexical indexes."""
+    if VECTOR_BACKEND == "local":
+        get_local_index().delete(chunk_ids=chunk_ids, email_ids=email_ids)
+    if RETRIEVAL_MODE != "vector":
+        get_lexical_index().delete(chunk_ids=chunk_ids, email_ids=email_ids)
+    if email_ids:
+        invalidate_answers(email_ids)
+    if chunk_ids:
+        # chunk ids are "<email id>:<index>:<hash>"
+        invalidate_answers({str(c).split(":")[0] for c in chunk_ids})
+
+
+def _atlas_pipeline(query_vec, k, email_ids=None):
+    search = {
+        "index": "vector_index",
+        "path": "embedding",
+        "queryVector": query_vec,
+        "numCandidates": max(k * VECTOR_NUM_CANDIDATES_FACTOR, 100),
+        "limit": k
+    }
+    if email_ids is not None:
+        # needs email_id declared as a "filter" field in the Atlas vector index
+        search["filter"] = {"email_id": {"$in": list(email_ids)}}
+    return [
+        {"$vectorSearch": search},
+        {"$project": {"id": "$_id", "chunk": 1, "email_id": 1, "_id": 0, "score": {"$meta": "vectorSearchScore"}}}
     ]
-    return list(collection.aggregate(pipeline))
+
+
+def _atlas_search(query_vec, k, email_ids=None):
+    return list(get_chunks_collection().aggregate(_atlas_pipeline(query_vec, k, email_ids)))
+
+
+def vector_search(query_vec, k, email_ids=None):
+    """`email_ids` (optional) restricts the search to chunks of those emails."""
+    if email_ids == []:
+        return []
+    if VECTOR_BACKEND == "local":
+        return get_local_index().search(query_vec, k, email_ids)
+    return _atlas_search(query_vec, k, email_ids)
+
+
+async def avector_search(query_vec, k, email_ids=None):
+    if email_ids == []:
+        return []
+    if VECTOR_BACKEND == "local":
+        # the first call builds the index from Mongo
+        return await asyncio.to_thread(vector_search, query_vec, k, email_ids)
+    cursor = get_async_chunks_collection().aggregate(_atlas_pipeline(query_vec, k, email_ids))
+    return await cursor.to_list(length=k)
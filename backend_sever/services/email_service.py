@@ -1,15 +1,16 @@
 """Email processing and storage service"""
-import os
+import asyncio
 from datetime import datetime
 import uuid
 from typing import Dict, Any
-from pymongo import MongoClient
 
-from agents.parllel_runner import run_parallel_processing
-from rag.db_client import update_email, get_emails as db_get_emails
-from rag.embedding import embed_texts
-from rag.chunking import flatten_email, chunk_text
-from rag.config import DB_NAME, COLLECTION_NAME
+from agents.parllel_runner import arun_email_agents, compute_processing_hashes, usable_hashes
+from rag.db_client import aupdate_email, aget_email as db_aget_email
+from rag.embedding import aembed_texts
+from rag.chunking import chunk_email, clean_body, email_content_hash
+from rag.db import get_async_chunks_collection
+from rag.vector_search import index_chunks
+from services.thread_service import aresolve_thread_id, athread_summary, refresh_thread_summary_later, subject_key, thread_context
 
 
 def generate_email_ids():
@@ -31,58 +32,90 @@ def create_email_data(email_input: Dict[str, Any], email_id: str, thread_id: str
         "cc": email_input.get("cc", []),
         "bcc": email_input.get("bcc", []),
         "category": category,
-        "actions": action_items if isinstance(action_items, dict) else {"task": "", "deadline": ""}
+        "actions": action_items if isinstance(action_items, dict) else {"task": "", "deadline": ""},
+        "subject_key": subject_key(email_input["subject"]),
+        "message_id": email_input.get("message_id"),
+        "in_reply_to": email_input.get("in_reply_to"),
     }
 
 
-def store_email_embeddings(email_data: Dict[str, Any]) -> None:
+async def athread_chunk_hashes(thread_id: str) -> set:
+    if not thread_id:
+        return set()
+    return set(await get_async_chunks_collection().distinct("chunk_hash", {"thread_id": thread_id})) - {None}
+
+
+def _chunk_email(email_data: Dict[str, Any], seen: set = None):
+    return chunk_email(email_data, seen), email_content_hash(email_data)
+
+
+def _chunk_documents(email_data: Dict[str, Any], chunks, email_hash: str, embeddings):
+    return [
+        {
+            "_id": chunk["id"],
+            "email_id": email_data["id"],
+            "thread_id": email_data.get("thread_id"),
+            "email_hash": email_hash,
+            "chunk": chunk["chunk"],
+            "chunk_hash": chunk["chunk_hash"],
+            "embedding": embedding,
+        }
+        for chunk, embedding in zip(chunks, embeddings)
+    ]
+
+
+async def astore_email_embeddings(email_data: Dict[str, Any]) -> None:
     try:
-        email_content = flatten_email(email_data)
-        chunks = chunk_text(email_content)
-        chunk_texts = [chunk["chunk"] for chunk in chunks]
-        embeddings = embed_texts(chunk_texts)
-        
-        chunk_documents = [
-            {
-                "email_id": email_data["id"],
-                "chunk": chunk["chunk"],
-                "embedding": embedding,
-            }
-            for chunk, embedding in zip(chunks, embeddings)
-        ]
-        
+        chunks, email_hash = _chunk_email(email_data, await athread_chunk_hashes(email_data.get("thread_id")))
+        embeddings = await aembed_texts([chunk["chunk"] for chunk in chunks])
+        chunk_documents = _chunk_documents(email_data, chunks, email_hash, embeddings)
+
         if chunk_documents:
-            mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
-            client = MongoClient(mongo_uri)
-            db = client[DB_NAME]
-            chunks_collection = db[COLLECTION_NAME]
-            chunks_collection.insert_many(chunk_documents)
-            
+            await get_async_chunks_collection().insert_many(chunk_documents)
+            await asyncio.to_thread(index_chunks, chunk_documents)
+
     except Exception as e:
         print(f"Warning: Failed to generate/store embeddings: {str(e)}")
 
 
-def process_and_store_email(email_input: Dict[str, Any], prompts: Dict[str, Any]) -> Dict[str, Any]:
-    email_id, thread_id = generate_email_ids()
-    timestamp = datetime.utcnow().isoformat() + "Z"
-    
-    enhanced_body = email_input["body_text"] + f"\n\nTimestamp: {timestamp}"
-    category, action_items = run_parallel_processing(
+async def aclassify_email(email_input: Dict[str, Any], prompts: Dict[str, Any], timestamp: str = None,
+                          thread_id: str = None) -> Dict[str, Any]:
+    """
+    Runs the agents on a new email and returns the document to store (not yet written).
+    The agents see only what the email adds to its thread, plus the thread's stored
+    summary. Pass `thread_id` when the caller already resolved it (bulk ingest).
+    """
+    email_id, _ = generate_email_ids()
+    thread_id = thread_id or await aresolve_thread_id(email_input)
+    timestamp = timestamp or datetime.utcnow().isoformat() + "Z"
+
+    summary = await athread_summary(thread_id, refresh=False)
+    enhanced_body = clean_body(email_input["body_text"]) + thread_context(summary) + f"\n\nTimestamp: {timestamp}"
+    fields = await arun_email_agents(
         subject=email_input["subject"],
         body=enhanced_body,
-        prompts=prompts
+        prompts=prompts,
+        email_id=email_id,
+        classifier_body=email_input["body_text"]
     )
-    
-    email_data = create_email_data(email_input, email_id, thread_id, timestamp, category, action_items)
-    update_email(email_id, email_data)
-    store_email_embeddings(email_data)
-    
+
+    email_data = create_email_data(email_input, email_id, thread_id, timestamp, fields["category"], fields["actions"])
+    email_data["category_source"] = fields["category_source"]
+    email_data["processing_hashes"] = usable_hashes(compute_processing_hashes(email_data, prompts), fields)
+    return email_data
+
+
+async def aprocess_and_store_email(email_input: Dict[str, Any], prompts: Dict[str, Any]) -> Dict[str, Any]:
+    email_data = await aclassify_email(email_input, prompts)
+    await aupdate_email(email_data["id"], email_data)
+    await astore_email_embeddings(email_data)
+    refresh_thread_summary_later(email_data["thread_id"])
+
     return email_data
 
 
-def find_email_by_id(email_id: str) -> Dict[str, Any]:
-    emails = db_get_emails()
-    email = next((e for e in emails if e.get("id") == email_id), None)
+async def afind_email_by_id(email_id: str) -> Dict[str, Any]:
+    email = await db_aget_email(email_id)
     if not email:
         raise ValueError(f"Email with id {email_id} not found")
     return email
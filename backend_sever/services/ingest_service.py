@@ -0,0 +1,407 @@
+"""Bulk email ingest: parse, classify, chunk, embed and write as concurrent stages"""
+import asyncio
+import html
+import json
+import os
+import re
+import time
+from datetime import timezone
+from email import policy
+from email.parser import BytesParser
+from email.utils import getaddresses, parseaddr, parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from models.ManualEmailInput import ManualEmailInput
+from agents.parllel_runner import PROCESSING_MODE, estimate_email_tokens
+from agents.rate_limiter import limiter, acall_with_backoff
+from services.email_service import aclassify_email, athread_chunk_hashes, _chunk_email, _chunk_documents
+from services.thread_service import aresolve_thread_id, refresh_thread_summary_later
+from rag.db_client import abulk_update_emails
+from rag.embedding import aembed_texts
+from rag.db import get_async_chunks_collection
+from rag.vector_search import index_chunks
+
+# items waiting between two stages; a full queue makes the stage before it wait
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+# emails classified at once (each may make two LLM calls, see PROCESSING_MODE)
+INGEST_LLM_WORKERS = int(os.getenv("INGEST_LLM_WORKERS", "4"))
+# chunks from consecutive emails sent in one embedding call
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+# emails per bulk write
+INGEST_WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "50"))
+
+FORMATS = ("ndjson", "mbox", "eml")
+CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/mbox": "mbox",
+    "message/rfc822": "eml",
+}
+
+_DONE = object()
+_TAGS = re.compile(r"<[^>]+>")
+_ESCAPED_FROM = re.compile(rb"^>(>*From )")
+
+
+class EmptyUpload(ValueError):
+    pass
+
+
+def detect_format(fmt: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """Explicit ?format= wins, then the Content-Type, else "auto" (sniffed); None for an unknown format."""
+    if fmt:
+        return fmt if fmt in FORMATS else None
+    mime = (content_type or "").split(";")[0].strip().lower()
+    return CONTENT_TYPES.get(mime, "auto")
+
+
+def _sniff(head: bytes) -> str:
+    head = head.lstrip()
+    if head.startswith(b"{"):
+        return "ndjson"
+    if head.startswith(b"From "):
+        return "mbox"
+    return "eml"
+
+
+def _addresses(msg, name: str) -> List[str]:
+    return [addr for _, addr in getaddresses([str(v) for v in msg.get_all(name, [])]) if addr]
+
+
+def email_input_from_message(raw: bytes) -> Tuple[Dict[str, Any], Optional[str]]:
+    """(ManualEmailInput fields, ISO timestamp from the Date header or None) for one RFC 822 message."""
+    msg = BytesParser(policy=policy.default).parsebytes(raw)
+    sender_name, sender_email = parseaddr(str(msg.get("From", "")))
+    part = msg.get_body(preferencelist=("plain", "html"))
+    text = part.get_content() if part is not None else ""
+    if part is not None and part.get_content_type() == "text/html":
+        text = html.unescape(_TAGS.sub(" ", text))
+
+    timestamp = None
+    try:
+        sent = parsedate_to_datetime(str(msg["Date"])) if msg["Date"] else None
+        if sent is not None:
+            sent = sent.astimezone(timezone.utc) if sent.tzinfo else sent
+            timestamp = sent.replace(tzinfo=None).isoformat() + "Z"
+    except (TypeError, ValueError):
+        pass
+
+    # In-Reply-To, or the last of References when a client only sets that
+    references = str(msg.get("In-Reply-To") or msg.get("References") or "").split()
+    return {
+        "sender_name": sender_name or sender_email,
+        "sender_email": sender_email,
+        "subject": str(msg.get("Subject", "")),
+        "body_text": text.strip(),
+        "to": _addresses(msg, "To"),
+        "cc": _addresses(msg, "Cc"),
+        "bcc": _addresses(msg, "Bcc"),
+        "message_id": str(msg.get("Message-ID") or "").strip() or None,
+        "in_reply_to": references[-1] if references else None,
+    }, timestamp
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending
+
+
+async def _mbox_messages(lines: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    message = []
+    async for line in lines:
+        if line.startswith(b"From "):
+            if message:
+                yield b"".join(message)
+            message = []
+            continue
+        # mboxrd: ">From " at the start of a body line was escaped on export
+        message.append(_ESCAPED_FROM.sub(rb"\1", line))
+    if message:
+        yield b"".join(message)
+
+
+async def _raw_items(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[str, bytes]]:
+    """(format, raw item) per email; "auto" is resolved from the first non-empty chunk."""
+    chunks = chunks.__aiter__()
+    head = b""
+    async for head in chunks:
+        if head.strip():
+            break
+    if fmt == "auto":
+        fmt = _sniff(head)
+
+    async def stream():
+        yield head
+        async for chunk in chunks:
+            yield chunk
+
+    if fmt == "eml":
+        yield fmt, b"".join([c async for c in stream()])
+        return
+    lines = _lines(stream())
+    if fmt == "mbox":
+        async for raw in _mbox_messages(lines):
+            yield fmt, raw
+        return
+    async for line in lines:
+        if line.strip():
+            yield fmt, line
+
+
+async def skip_blank(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """`chunks` from the first non-blank one on; raises EmptyUpload when the body has none."""
+    chunks = chunks.__aiter__()
+    async for head in chunks:
+        if head.strip():
+            break
+    else:
+        raise EmptyUpload("request body has no emails")
+
+    async def stream():
+        yield head
+        async for chunk in chunks:
+            yield chunk
+
+    return stream()
+
+
+def parse_item(fmt: str, raw: bytes) -> Tuple[Dict[str, Any], Optional[str]]:
+    if fmt == "ndjson":
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("each line must be a JSON object")
+        timestamp = data.pop("timestamp", None)
+    else:
+        data, timestamp = email_input_from_message(raw)
+    return ManualEmailInput(**data).dict(), timestamp
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.first = None
+        self.last = None
+
+    def add(self, started: float, items: int = 1, errors: int = 0):
+        now = time.perf_counter()
+        self.first = started if self.first is None else min(self.first, started)
+        self.last = now
+        self.busy += now - started
+        self.items += items
+        self.errors += errors
+
+    def snapshot(self):
+        active = (self.last - self.first) if self.first is not None else 0.0
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "busy_s": round(self.busy, 3),
+            "active_s": round(active, 3),
+            "items_per_s": round(self.items / active, 2) if active > 0 else None,
+        }
+
+
+class BulkIngest:
+    """
+    One /emails/bulk request. Stages are connected by bounded queues so a slow
+    stage (usually the LLM) holds back parsing instead of buffering the upload,
+    while embedding and writing batch whatever has piled up in front of them.
+    """
+
+    def __init__(self, prompts: dict):
+        self.prompts = prompts
+        self.stats = {name: StageStats(name) for name in ("parse", "classify", "chunk", "embed", "write")}
+        self.results: Dict[int, Dict[str, Any]] = {}
+        self.queues = [asyncio.Queue(maxsize=INGEST_QUEUE_SIZE) for _ in range(4)]
+        # thread_id -> chunk hashes stored or queued for it, so a thread's repeated text is embedded once
+        self.thread_hashes: Dict[str, set] = {}
+        # emails seen in this upload (see aresolve_thread_id), for replies whose parent is not written yet
+        self.threads: Dict[str, Any] = {}
+        # threads that got new emails, summarized once the upload is written
+        self.written_threads = set()
+
+    def _fail(self, index: int, stage: str, error: Exception, email_id: str = None, stored: bool = False):
+        message = " ".join(str(error).split())[:300]
+        result = self.results.setdefault(index, {"index": index, "id": email_id})
+        result.update({"status": "stored" if stored else "failed", "stage": stage, "error": message})
+        if not stored:
+            print(f"Warning: bulk ingest of email {index} failed at {stage}: {message}")
+
+    async def _parse(self, chunks: AsyncIterator[bytes], fmt: str, outbox: asyncio.Queue):
+        index = 0
+        try:
+            async for item_fmt, raw in _raw_items(chunks, fmt):
+                started = time.perf_counter()
+                try:
+                    email_input, timestamp = parse_item(item_fmt, raw)
+                    # here rather than in the concurrent classify workers, so each reply
+                    # sees the threads of every email before it in the upload
+                    thread_id = await aresolve_thread_id(email_input, self.threads)
+                except Exception as e:
+                    self._fail(index, "parse", e)
+                    self.stats["parse"].add(started, errors=1)
+                else:
+                    self.stats["parse"].add(started)
+                    await outbox.put((index, email_input, timestamp, thread_id))
+                index += 1
+        finally:
+            await outbox.put(_DONE)
+
+    async def _classify(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                # let sibling workers see it too
+                await inbox.put(_DONE)
+                return
+            index, email_input, timestamp, thread_id = item
+            started = time.perf_counter()
+            try:
+                # same budget as process_all_emails, charged as if neither agent is answered locally
+                fused = PROCESSING_MODE == "fused"
+                tokens = estimate_email_tokens(email_input["subject"], email_input["body_text"], self.prompts, fused=fused)
+                await asyncio.to_thread(limiter.acquire, tokens, 1 if fused else 2)
+                email_data = await acall_with_backoff(aclassify_email, email_input, self.prompts, timestamp, thread_id)
+            except Exception as e:
+                self._fail(index, "classify", e)
+                self.stats["classify"].add(started, errors=1)
+                continue
+            self.stats["classify"].add(started)
+            await outbox.put((index, email_data))
+
+    async def _chunk(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while (item := await inbox.get()) is not _DONE:
+            index, email_data = item
+            started = time.perf_counter()
+            try:
+                thread_id = email_data.get("thread_id")
+                if thread_id not in self.thread_hashes:
+                    self.thread_hashes[thread_id] = await athread_chunk_hashes(thread_id)
+                chunks, email_hash = _chunk_email(email_data, self.thread_hashes[thread_id])
+            except Exception as e:
+                self._fail(index, "chunk", e, email_data["id"], stored=True)
+                chunks, email_hash = [], None
+                self.stats["chunk"].add(started, errors=1)
+            else:
+                self.stats["chunk"].add(started)
+            await outbox.put((index, email_data, chunks, email_hash))
+        await outbox.put(_DONE)
+
+    @staticmethod
+    async def _batches(inbox: asyncio.Queue, limit: int, size=lambda item: 1) -> AsyncIterator[list]:
+        """Waits for one item, then takes whatever else is already queued up to `limit`."""
+        done = False
+        while not done:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            batch, used = [item], size(item)
+            while used < limit:
+                try:
+                    item = inbox.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+                used += size(item)
+            yield batch
+
+    async def _embed(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        async for batch in self._batches(inbox, INGEST_EMBED_BATCH, size=lambda item: len(item[2])):
+            started = time.perf_counter()
+            texts = [chunk["chunk"] for _, _, chunks, _ in batch for chunk in chunks]
+            try:
+                vectors = await aembed_texts(texts) if texts else []
+            except Exception as e:
+                # like /add-email, the email is still stored without embeddings
+                for index, email_data, _, _ in batch:
+                    self._fail(index, "embed", e, email_data["id"], stored=True)
+                self.stats["embed"].add(started, len(batch), errors=len(batch))
+                vectors = None
+            else:
+                self.stats["embed"].add(started, len(batch))
+            offset = 0
+            for index, email_data, chunks, email_hash in batch:
+                docs = []
+                if vectors is not None:
+                    docs = _chunk_documents(email_data, chunks, email_hash, vectors[offset:offset + len(chunks)])
+                offset += len(chunks)
+                await outbox.put((index, email_data, docs))
+        await outbox.put(_DONE)
+
+    async def _write(self, inbox: asyncio.Queue):
+        async for batch in self._batches(inbox, INGEST_WRITE_BATCH):
+            started = time.perf_counter()
+            try:
+                await abulk_update_emails([(email_data["id"], email_data) for _, email_data, _ in batch])
+            except Exception as e:
+                for index, email_data, _ in batch:
+                    self._fail(index, "write", e, email_data["id"])
+                self.stats["write"].add(started, errors=len(batch))
+                continue
+
+            docs = [doc for _, _, email_docs in batch for doc in email_docs]
+            chunk_error = None
+            if docs:
+                try:
+                    await get_async_chunks_collection().insert_many(docs, ordered=False)
+                    await asyncio.to_thread(index_chunks, docs)
+                except Exception as e:
+                    chunk_error = e
+            for index, email_data, email_docs in batch:
+                self.results.setdefault(index, {"index": index, "id": email_data["id"], "status": "stored"})
+                self.written_threads.add(email_data.get("thread_id"))
+                if chunk_error is not None and email_docs:
+                    self._fail(index, "write", chunk_error, email_data["id"], stored=True)
+            self.stats["write"].add(started, len(batch), errors=len(batch) if chunk_error else 0)
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str = "auto") -> Dict[str, Any]:
+        started = time.perf_counter()
+        parsed, classified, chunked, embedded = self.queues
+        classifiers = [self._classify(parsed, classified) for _ in range(max(INGEST_LLM_WORKERS, 1))]
+
+        async def classify_stage():
+            await asyncio.gather(*classifiers)
+            await classified.put(_DONE)
+
+        await asyncio.gather(
+            self._parse(chunks, fmt, parsed),
+            classify_stage(),
+            self._chunk(classified, chunked),
+            self._embed(chunked, embedded),
+            self._write(embedded),
+        )
+        elapsed = time.perf_counter() - started
+        for thread_id in self.written_threads:
+            refresh_thread_summary_later(thread_id)
+
+        results = [self.results[index] for index in sorted(self.results)]
+        stored = sum(1 for result in results if result["status"] == "stored")
+        return {
+            "status": "success" if stored == len(results) else ("partial" if stored else "failed"),
+            "received": len(results),
+            "stored": stored,
+            "failed": len(results) - stored,
+            "elapsed_s": round(elapsed, 3),
+            "emails_per_s": round(stored / elapsed, 2) if elapsed > 0 else None,
+            "stages": {name: stats.snapshot() for name, stats in self.stats.items()},
+            "results": results,
+        }
+
+
+async def bulk_ingest(chunks: AsyncIterator[bytes], fmt: str, prompts: dict) -> Dict[str, Any]:
+    """Raises EmptyUpload before anything runs when the body is empty or blank."""
+    chunks = await skip_blank(chunks)
+    return await BulkIngest(prompts).run(chunks, fmt)
@@ -0,0 +1,183 @@
+"""Background job queue for long-running inbox processing"""
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from agents.parllel_runner import process_all_emails
+from rag.db_client import (
+    get_email_ids,
+    create_job,
+    get_job as db_get_job,
+    update_job,
+    claim_job,
+    record_job_progress,
+    get_unfinished_jobs,
+)
+
+JOB_WRITE_BATCH = int(os.getenv("JOB_WRITE_BATCH", "10"))
+# a running job whose owner has not written progress for this long is considered dead
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "120"))
+
+FINISHED_STATUSES = {"completed", "failed", "cancelled"}
+
+_WORKER_ID = f"wrk_{uuid.uuid4().hex[:8]}"
+_queue: "queue.Queue[str]" = queue.Queue()
+_cancelled = set()
+_worker_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+
+
+def _utc_now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _ensure_worker() -> None:
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="job-worker", daemon=True)
+            _worker.start()
+
+
+def _worker_loop() -> None:
+    while True:
+        job_id = _queue.get()
+        try:
+            _run_job(job_id)
+        except Exception as e:
+            update_job(job_id, {"status": "failed", "error": str(e), "finished_at": _utc_now()})
+        finally:
+            _queue.task_done()
+
+
+def _is_cancelled(job_id: str) -> bool:
+    return job_id in _cancelled
+
+
+def _run_job(job_id: str) -> None:
+    job = claim_job(job_id, _WORKER_ID, time.time(), JOB_STALE_AFTER)
+    if not job:
+        current = db_get_job(job_id)
+        if current and current.get("status") == "running":
+            # held by another worker (or one that died recently); check again once it could be stale
+            threading.Timer(JOB_STALE_AFTER, _queue.put, args=(job_id,)).start()
+        return
+    if job.get("cancel_requested"):
+        _cancelled.add(job_id)
+
+    def on_progress(done_ids: List[str], failed: List[Dict[str, Any]]):
+        record_job_progress(job_id, done_ids, failed, time.time())
+        # pick up cancellations issued through another worker process
+        latest = db_get_job(job_id)
+        if latest and latest.get("cancel_requested"):
+            _cancelled.add(job_id)
+
+    update_job(job_id, {"run_start_processed": job.get("processed", 0)})
+    process_all_emails(
+        email_ids=job.get("pending_ids", []),
+        on_progress=on_progress,
+        should_cancel=lambda: _is_cancelled(job_id),
+        write_batch_size=JOB_WRITE_BATCH,
+        force=job.get("force", False),
+    )
+
+    status = "cancelled" if _is_cancelled(job_id) else "completed"
+    _cancelled.discard(job_id)
+    update_job(job_id, {"status": status, "finished_at": _utc_now()})
+
+
+def enqueue_process_all(reason: str = "manual", force: bool = False) -> str:
+    email_ids = get_email_ids()
+    job_id = f"job_{uuid.uuid4().hex[:8]}"
+    create_job({
+        "_id": job_id,
+        "type": "process_all_emails",
+        "reason": reason,
+        "force": force,
+        "status": "queued",
+        "total": len(email_ids),
+        "processed": 0,
+        "failed_count": 0,
+        "failed": [],
+        "pending_ids": email_ids,
+        "cancel_requested": False,
+        "created_at": _utc_now(),
+    })
+    _queue.put(job_id)
+    _ensure_worker()
+    return job_id
+
+
+def get_job_status(job_id: str) -> Dict[str, Any]:
+    job = db_get_job(job_id)
+    if not job:
+        raise ValueError(f"Job with id {job_id} not found")
+
+    total = job.get("total", 0)
+    processed = job.get("processed", 0)
+    done = processed + job.get("failed_count", 0)
+    throughput = None
+    eta_seconds = None
+
+    run_started_at = job.get("run_started_at")
+    if run_started_at and job.get("status") == "running":
+        elapsed = max(time.time() - run_started_at, 1e-6)
+        processed_this_run = processed - job.get("run_start_processed", 0)
+        throughput = processed_this_run / elapsed
+        if throughput > 0:
+            eta_seconds = (total - done) / throughput
+
+    return {
+        "job_id": job["_id"],
+        "type": job.get("type"),
+        "status": job.get("status"),
+        "processed": processed,
+        "failed": job.get("failed_count", 0),
+        "total": total,
+        "throughput_per_sec": round(throughput, 3) if throughput is not None else None,
+        "eta_seconds": round(eta_seconds, 1) if eta_seconds is not None else None,
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at"),
+        "errors": job.get("failed", [])[-20:],
+    }
+
+
+def cancel_job(job_id: str) -> Dict[str, Any]:
+    job = db_get_job(job_id)
+    if not job:
+        raise ValueError(f"Job with id {job_id} not found")
+    if job.get("status") in FINISHED_STATUSES:
+        return get_job_status(job_id)
+
+    _cancelled.add(job_id)
+    fields = {"cancel_requested": True}
+    if job.get("status") == "queued":
+        fields.update({"status": "cancelled", "finished_at": _utc_now()})
+    update_job(job_id, fields)
+    return get_job_status(job_id)
+
+
+def resume_job(job_id: str) -> Dict[str, Any]:
+    job = db_get_job(job_id)
+    if not job:
+        raise ValueError(f"Job with id {job_id} not found")
+    if job.get("status") in ("cancelled", "failed") and job.get("pending_ids"):
+        _cancelled.discard(job_id)
+        update_job(job_id, {"status": "queued", "cancel_requested": False, "finished_at": None})
+        _queue.put(job_id)
+        _ensure_worker()
+    return get_job_status(job_id)
+
+
+def resume_unfinished_jobs() -> int:
+    """Re-queue jobs left queued/running by a previous process; called on startup."""
+    jobs = get_unfinished_jobs()
+    for job in jobs:
+        _queue.put(job["_id"])
+    if jobs:
+        _ensure_worker()
+    return len(jobs)
@@ -0,0 +1,104 @@
+"""Server-Sent Events streams for the chat, RAG and reply-draft endpoints"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+from langchain_core.utils.json import parse_json_markdown, parse_partial_json
+
+from agents.structured_output import ReplyDraft, complete_structured
+
+from agents.agent_helper import astream_agent
+from agents.reply_draft import astream_reply_draft
+from rag.service import aretrieve, answer_cache_enabled
+from rag.embedding import aembed_query
+from rag.answer_cache import lookup_answer, store_answer
+from rag.context import context_stats, pack_context
+from rag.groq_llm import astream_answer
+from rag.extract_idx import find as find_ids
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _stream_tokens(tokens: AsyncIterator[str], parts: List[str]) -> AsyncIterator[str]:
+    async for token in tokens:
+        parts.append(token)
+        yield sse("token", {"text": token})
+
+
+async def stream_rag_answer(prompt: str, k: int, email_filter: dict = None, use_cache: bool = True,
+                            pinned: list = None) -> AsyncIterator[str]:
+    """chunks -> token... -> done {answer, extracted_ids, cached, context}; a cached answer arrives as one token"""
+    try:
+        query_vec = await aembed_query(prompt) if answer_cache_enabled(use_cache) else None
+        hit = await asyncio.to_thread(lookup_answer, prompt, query_vec, k, email_filter) if query_vec is not None else None
+        if hit:
+            answer, docs = hit
+            yield sse("chunks", docs)
+            yield sse("token", {"text": answer})
+            yield sse("done", {"answer": answer, "extracted_ids": find_ids(answer), "cached": True, "context": None})
+            return
+
+        docs = (pinned or []) + await aretrieve(prompt, k, email_filter, query_vec=query_vec)
+        yield sse("chunks", docs)
+        context = pack_context(docs)
+        parts = []
+        async for event in _stream_tokens(astream_answer(prompt, context), parts):
+            yield event
+        answer = "".join(parts)
+        if query_vec is not None:
+            await asyncio.to_thread(store_answer, prompt, query_vec, k, email_filter, answer, docs)
+        yield sse("done", {"answer": answer, "extracted_ids": find_ids(answer), "cached": False,
+                          "context": context_stats(context)})
+    except Exception as e:
+        yield sse("error", {"detail": str(e)})
+
+
+async def stream_agent_reply(subject: str, body: str, prompt: str, timestamp: str, email_id: str,
+                             session_id: str, thread_summary: str = "") -> AsyncIterator[str]:
+    """token... -> done {answer}"""
+    try:
+        parts = []
+        tokens = astream_agent(subject, body, prompt, timestamp, email_id, session_id, thread_summary)
+        async for event in _stream_tokens(tokens, parts):
+            yield event
+        yield sse("done", {"answer": "".join(parts).strip()})
+    except Exception as e:
+        yield sse("error", {"detail": str(e)})
+
+
+def _partial_draft(text: str) -> Dict[str, Any]:
+    try:
+        draft = parse_json_markdown(text, parser=parse_partial_json)
+    except Exception:
+        return {}
+    return draft if isinstance(draft, dict) else {}
+
+
+async def stream_reply_draft(subject: str, body: str, prompt: str) -> AsyncIterator[str]:
+    """
+    token... interleaved with draft {subject, body} whenever the partial JSON parses
+    to something new, then done {subject, body} once the complete JSON validates.
+    """
+    try:
+        parts = []
+        last = {}
+        async for event in _stream_tokens(astream_reply_draft(subject, body, prompt), parts):
+            yield event
+            draft = _partial_draft("".join(parts))
+            if draft and draft != last:
+                last = draft
+                yield sse("draft", draft)
+
+        text = "".join(parts).strip()
+        # tokens are already out, so repair locally but do not re-ask
+        result = complete_structured(text, ReplyDraft, "reply_draft")
+        if result is None:
+            yield sse("error", {"detail": "Model returned invalid JSON", "raw": text})
+            return
+        yield sse("done", result)
+    except Exception as e:
+        yield sse("error", {"detail": str(e)})
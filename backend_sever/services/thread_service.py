@@ -0,0 +1,159 @@
+"""Conversation threads: assigning new emails to threads and their rolling summaries"""
+import asyncio
+import os
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from dotenv import load_dotenv
+
+from agents.thread_summary import asummarize_thread
+from rag.db_client import aget_thread_emails, afind_email_ref, afind_reply_parents, aget_thread_state, asave_thread_summary
+
+load_dotenv()
+
+# summaries are kept for threads with at least this many emails; a lone email is its own context
+THREAD_SUMMARY_MIN_MESSAGES = int(os.getenv("THREAD_SUMMARY_MIN_MESSAGES", "2"))
+THREAD_SUMMARY_ENABLED = os.getenv("THREAD_SUMMARY_ENABLED", "true").lower() in ("1", "true", "yes")
+# the mailbox owner's addresses, comma separated; they are on nearly every email, so they never tie a reply to a thread
+MAILBOX_ADDRESSES = {a.strip().lower() for a in os.getenv("MAILBOX_ADDRESSES", "").split(",") if a.strip()}
+
+_REPLY_PREFIX = re.compile(r"^\s*((re|fw|fwd|aw|sv)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+
+# summary refreshes started in the background, kept so they are not garbage collected mid-run
+_pending = set()
+
+
+def new_thread_id() -> str:
+    return f"thd_{uuid.uuid4().hex[:8]}"
+
+
+def subject_key(subject: str) -> str:
+    """Subject without Re:/Fwd: prefixes, lowercased; replies share it with the email they answer."""
+    return " ".join(_REPLY_PREFIX.sub("", subject or "").lower().split())
+
+
+def is_reply(subject: str) -> bool:
+    return bool(_REPLY_PREFIX.match(subject or ""))
+
+
+def _people(email: Dict[str, Any]) -> Set[str]:
+    addresses = [email.get("sender_email")] + list(email.get("to") or []) + list(email.get("cc") or [])
+    return {a.lower() for a in addresses if a}
+
+
+def same_conversation(reply: Dict[str, Any], parent: Dict[str, Any]) -> bool:
+    """
+    Whether a "Re:" email continues `parent` (same subject key): each sender takes
+    part in the other email, and the two share someone besides the mailbox owner.
+    """
+    reply_people, parent_people = _people(reply), _people(parent)
+    return ((reply.get("sender_email") or "").lower() in parent_people
+            and (parent.get("sender_email") or "").lower() in reply_people
+            and bool((reply_people & parent_people) - MAILBOX_ADDRESSES))
+
+
+async def aresolve_thread_id(email_input: Dict[str, Any], known: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Thread of a new email: its explicit thread_id, else the thread of the email
+    its in_reply_to names (our id or a Message-ID), else for a "Re:" subject the
+    thread of the latest email with the same subject that same_conversation
+    accepts, else a new thread.
+
+    `known` holds the emails seen earlier in the same bulk ingest, for replies
+    whose parent is not written yet: Message-ID -> thread, and "subject:<key>"
+    -> [(thread, participants)]. It is updated, so calls sharing it must run
+    one at a time in upload order.
+    """
+    if email_input.get("thread_id"):
+        return email_input["thread_id"]
+    known = {} if known is None else known
+    key = subject_key(email_input.get("subject"))
+    parent_ref = email_input.get("in_reply_to")
+
+    thread_id = None
+    if parent_ref:
+        thread_id = known.get(parent_ref)
+        if thread_id is None:
+            parent = await afind_email_ref(parent_ref)
+            thread_id = parent.get("thread_id") if parent else None
+    if thread_id is None and key and is_reply(email_input.get("subject")):
+        seen = reversed(known.get(f"subject:{key}", []))
+        thread_id = next((t for t, parent in seen if same_conversation(email_input, parent)), None)
+        if thread_id is None:
+            participants = [email_input.get("sender_email")] + list(email_input.get("to") or []) + list(email_input.get("cc") or [])
+            participants = [p for p in participants if p and p.lower() not in MAILBOX_ADDRESSES]
+            parents = await afind_reply_parents(key, participants) if participants else []
+            parent = next((p for p in parents if same_conversation(email_input, p)), None)
+            thread_id = parent.get("thread_id") if parent else None
+    thread_id = thread_id or new_thread_id()
+
+    if email_input.get("message_id"):
+        known[email_input["message_id"]] = thread_id
+    if key:
+        people = {f: email_input.get(f) for f in ("sender_email", "to", "cc")}
+        known.setdefault(f"subject:{key}", []).append((thread_id, people))
+    return thread_id
+
+
+async def athread_summary(thread_id: str, refresh: bool = True) -> str:
+    """
+    Rolling summary of the thread. With `refresh`, emails added since the last
+    summary are folded into it first (one LLM call per few emails); without,
+    the stored summary is returned as is.
+    """
+    if not thread_id or not THREAD_SUMMARY_ENABLED:
+        return ""
+    state = await aget_thread_state(thread_id)
+    summary = state.get("summary", "")
+    if not refresh:
+        return summary
+
+    emails = await aget_thread_emails(thread_id)
+    summarized = set(state.get("summarized_ids") or [])
+    new = [e for e in emails if e.get("id") not in summarized]
+    if len(emails) < THREAD_SUMMARY_MIN_MESSAGES or not new:
+        return summary
+    try:
+        summary = await asummarize_thread(summary, new)
+    except Exception as e:
+        print(f"Warning: Failed to summarize thread {thread_id}: {str(e)}")
+        return state.get("summary", "")
+    # if another request summarized meanwhile, its result is kept and this one is only returned
+    await asave_thread_summary(thread_id, state.get("version", 0), summary,
+                               [e.get("id") for e in emails], datetime.utcnow())
+    return summary
+
+
+def refresh_thread_summary_later(thread_id: str):
+    """Folds a newly stored email into its thread's summary without making the caller wait."""
+    if not THREAD_SUMMARY_ENABLED:
+        return
+    task = asyncio.get_running_loop().create_task(athread_summary(thread_id))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+def thread_context(summary: str) -> str:
+    """Block appended to an email's text for the agents."""
+    return f"\n\nEarlier in this thread (summary):\n{summary}" if summary else ""
+
+
+def summary_doc(thread_id: str, summary: str) -> Dict[str, Any]:
+    """The summary as a retrieved chunk, so /ask can answer about the thread from it."""
+    return {"id": f"{thread_id}:summary", "email_id": thread_id, "chunk": summary,
+            "label": f"Thread {thread_id} summary", "score": None}
+
+
+async def aget_thread(thread_id: str) -> Optional[Dict[str, Any]]:
+    emails = await aget_thread_emails(thread_id)
+    if not emails:
+        return None
+    fields = ("id", "timestamp", "sender_name", "sender_email", "subject", "category")
+    return {
+        "thread_id": thread_id,
+        "subject": emails[0].get("subject"),
+        "messages": [{f: e.get(f) for f in fields} for e in emails],
+        "summary": await athread_summary(thread_id, refresh=False),
+    }
@@ -0,0 +1,91 @@
+from rag.chunking import clean_body
+
+
+def test_keeps_gmail_forward():
+    body = (
+        "FYI, see the note from finance below.\n"
+        "\n"
+        "---------- Forwarded message ---------\n"
+        "From: Tom Becker <tom.becker@globex.com>\n"
+        "Date: Mon, 5 Feb 2024 at 09:12\n"
+        "Subject: Invoice INV-4821\n"
+        "To: Priya Raman <priya@acme.io>\n"
+        "\n"
+        "Invoice INV-4821 is fifteen days overdue, please send a payment date."
+    )
+    cleaned = clean_body(body)
+    assert "FYI, see the note from finance below." in cleaned
+    assert "From: Tom Becker" in cleaned
+    assert "Invoice INV-4821 is fifteen days overdue" in cleaned
+
+
+def test_keeps_short_lines_after_bare_thanks():
+    body = (
+        "Hi team,\n"
+        "\n"
+        "Thanks\n"
+        "Deploy freeze starts Monday 9am\n"
+        "Release notes due Friday\n"
+    )
+    cleaned = clean_body(body)
+    assert "Deploy freeze starts Monday 9am" in cleaned
+    assert "Release notes due Friday" in cleaned
+
+
+def test_strips_sign_off_followed_by_signature():
+    body = (
+        "The rollout moves to Thursday.\n"
+        "\n"
+        "Best regards,\n"
+        "Priya Raman\n"
+        "Head of Platform | Acme Inc.\n"
+        "+1 (555) 010-2030\n"
+        "priya@acme.io\n"
+    )
+    assert clean_body(body) == "The rollout moves to Thursday.\n\nBest regards,"
+
+
+def test_strips_gmail_reply_history():
+    body = (
+        "Thursday works for me.\n"
+        "\n"
+        "On Mon, 5 Feb 2024 at 09:12, Tom Becker <tom.becker@globex.com> wrote:\n"
+        "> Can we meet this week?\n"
+    )
+    assert clean_body(body) == "Thursday works for me."
+
+
+def test_strips_outlook_reply_history_after_rule():
+    body = (
+        "Approved.\n"
+        "\n"
+        "________________________________\n"
+        "From: Tom Becker\n"
+        "Sent: Monday, February 5, 2024 9:12 AM\n"
+        "To: Priya Raman\n"
+        "Subject: Budget\n"
+        "\n"
+        "Please approve the budget.\n"
+    )
+    assert clean_body(body) == "Approved."
+
+
+def test_keeps_from_header_without_reply_separator():
+    body = (
+        "Here is the header of the bounced message:\n"
+        "From: billing@globex.com\n"
+        "Date: Mon, 5 Feb 2024\n"
+        "It never reached the customer."
+    )
+    assert clean_body(body) == body
+
+
+def test_reply_above_forward_drops_the_forward():
+    body = (
+        "Looks good.\n"
+        "\n"
+        "On Tue, 6 Feb 2024 at 10:00, Priya Raman <priya@acme.io> wrote:\n"
+        "> ---------- Forwarded message ---------\n"
+        "> From: Tom Becker <tom.becker@globex.com>\n"
+    )
+    assert clean_body(body) == "Looks good."
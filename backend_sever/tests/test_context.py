@@ -0,0 +1,28 @@
+from rag.context import pack_context
+from rag.tokens import count_tokens
+
+
+def _chunk(email_id, index, text):
+    return {"id": f"{email_id}:{index}:h{index}", "email_id": email_id, "chunk": text}
+
+
+def test_drops_duplicates_and_merges_neighbours():
+    first = "The quarterly budget review moves to Thursday at 10am in room 4, after the board call with Globex."
+    second = first[-40:] + "Bring the updated forecast and the hiring plan."
+    docs = [_chunk("msg_1", 0, first), _chunk("msg_1", 1, second), _chunk("msg_2", 0, first.upper())]
+    context = pack_context(docs, budget=1000)
+    assert context["chunks_used"] == 2
+    assert context["duplicates_dropped"] == 1
+    assert context["text"].count(first[-40:]) == 1
+    assert context["email_ids"] == ["msg_1"]
+    assert context["tokens"] == count_tokens(context["text"])
+    assert context["over_budget_tokens"] == 0
+
+
+def test_budget_drops_are_not_savings():
+    docs = [_chunk(f"msg_{i}", 0, f"Email {i} says something different about topic {i}. " * 10) for i in range(5)]
+    context = pack_context(docs, budget=300)
+    assert context["tokens"] <= 300
+    assert context["over_budget_dropped"] == 5 - context["chunks_used"] > 0
+    assert context["over_budget_tokens"] > 0
+    assert context["tokens_saved"] <= 0
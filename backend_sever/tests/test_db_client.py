@@ -0,0 +1,33 @@
+import pytest
+
+from rag.db_client import build_email_filter, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    email = {"id": "msg_1a2b3c4d", "timestamp": "2024-02-05T09:12:00Z", "subject": "Invoice"}
+    cursor = encode_cursor(email)
+    assert cursor.isascii() and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == ("2024-02-05T09:12:00Z", "msg_1a2b3c4d")
+
+
+def test_invalid_cursor_raises():
+    # the list route turns this into a 400
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_cursor_filter_continues_after_the_last_email():
+    after = decode_cursor(encode_cursor({"id": "msg_2", "timestamp": "2024-02-05T09:12:00Z"}))
+    assert build_email_filter(after=after) == {"$or": [
+        {"timestamp": {"$lt": "2024-02-05T09:12:00Z"}},
+        {"timestamp": "2024-02-05T09:12:00Z", "id": {"$lt": "msg_2"}},
+    ]}
+
+
+def test_filters_combine():
+    assert build_email_filter() == {}
+    assert build_email_filter(category="Urgent") == {"category": "Urgent"}
+    assert build_email_filter(category="Urgent", since="2024-01-01") == {"$and": [
+        {"category": "Urgent"},
+        {"timestamp": {"$gte": "2024-01-01"}},
+    ]}
@@ -0,0 +1,96 @@
+import pytest
+
+from agents import rate_limiter
+from agents.rate_limiter import TokenBucket, RateLimiter, call_with_backoff, is_rate_limit_error
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_refills_continuously(clock):
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(60) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock[0] += 30
+    assert bucket.wait_time(30) == 0.0
+    assert bucket.wait_time(31) == pytest.approx(1.0)
+
+
+def test_bucket_caps_requests_at_capacity(clock):
+    bucket = TokenBucket(10)
+    # a request larger than the bucket waits for a full bucket instead of forever
+    assert bucket.wait_time(50) == 0.0
+    bucket.take(50)
+    assert bucket.tokens == 0.0
+    clock[0] += 1000
+    assert bucket.wait_time(1) == 0.0
+    assert bucket.tokens == 10.0
+
+
+def test_limiter_waits_for_the_token_budget(clock, monkeypatch):
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(rate_limiter.time, "sleep", sleep)
+    limiter = RateLimiter(rpm=30, tpm=600)
+    limiter.acquire(600)
+    limiter.acquire(100)
+    assert sleeps == [pytest.approx(10.0)]
+
+
+def test_backoff_retries_rate_limits(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RateLimited("slow down")
+        return "ok"
+
+    assert call_with_backoff(flaky, retries=5) == "ok"
+    assert len(calls) == 3
+
+
+def test_backoff_gives_up_after_retries(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def always_limited():
+        calls.append(1)
+        raise RateLimited("slow down")
+
+    with pytest.raises(RateLimited):
+        call_with_backoff(always_limited, retries=2)
+    assert len(calls) == 3
+
+
+def test_backoff_raises_other_errors_at_once(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda seconds: pytest.fail("should not back off"))
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        call_with_backoff(broken)
+    assert len(calls) == 1
+
+
+def test_detects_rate_limit_errors():
+    assert is_rate_limit_error(RateLimited())
+    assert is_rate_limit_error(Exception("Error code: 429 - rate_limit_exceeded"))
+    assert not is_rate_limit_error(Exception("Error code: 400 - invalid_request"))
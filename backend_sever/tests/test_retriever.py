@@ -0,0 +1,26 @@
+import pytest
+
+from rag.retriever import reciprocal_rank_fusion
+
+
+def _doc(chunk_id):
+    return {"id": chunk_id, "email_id": chunk_id.split(":")[0], "chunk": chunk_id}
+
+
+def test_fusion_rewards_chunks_in_both_lists():
+    vector = [_doc("a:0:x"), _doc("b:0:x"), _doc("c:0:x")]
+    lexical = [_doc("c:0:x"), _doc("d:0:x")]
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+    assert [d["id"] for d in fused] == ["c:0:x", "a:0:x", "b:0:x", "d:0:x"]
+    assert fused[0]["score"] == pytest.approx(1 / 63 + 1 / 61)
+
+
+def test_fusion_ties_keep_list_order():
+    fused = reciprocal_rank_fusion([[_doc("a:0:x")], [_doc("b:0:x")]])
+    assert [d["id"] for d in fused] == ["a:0:x", "b:0:x"]
+
+
+def test_fusion_does_not_modify_inputs():
+    doc = _doc("a:0:x")
+    reciprocal_rank_fusion([[doc]])
+    assert "score" not in doc
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+from agents.model_router import metrics, route_model
+from agents.structured_output import JsonObject, ReplyDraft, complete_structured, failed_generation, parse_json_output
+
+
+def test_parses_plain_json():
+    value, error, repaired = parse_json_output('{"subject": "Re: Invoice", "body": "Paid."}', ReplyDraft)
+    assert value == {"subject": "Re: Invoice", "body": "Paid."}
+    assert error is None
+    assert not repaired
+
+
+def test_repairs_code_fence():
+    text = 'Here you go:\n```json\n{"task": "send report", "deadline": "Friday"}\n```'
+    value, error, repaired = parse_json_output(text, JsonObject)
+    assert value == {"task": "send report", "deadline": "Friday"}
+    assert error is None
+    assert repaired
+
+
+def test_repairs_surrounding_prose():
+    value, _, repaired = parse_json_output('Sure! {"subject": "Hi", "body": "Thanks"} Let me know.', ReplyDraft)
+    assert value == {"subject": "Hi", "body": "Thanks"}
+    assert repaired
+
+
+def test_rejects_text_without_json():
+    assert parse_json_output("I could not find any action items.", JsonObject) == (None, "reply is not valid JSON", False)
+
+
+def test_reports_schema_errors():
+    value, error, _ = parse_json_output('{"subject": "Hi"}', ReplyDraft)
+    assert value is None
+    assert "body" in error
+
+
+def test_failed_generation_only_for_json_validate_failed():
+    rejected = SimpleNamespace(status_code=400, body={"error": {"code": "json_validate_failed",
+                                                                "failed_generation": '{"task": '}})
+    assert failed_generation(rejected) == '{"task": '
+    assert failed_generation(SimpleNamespace(status_code=400, body={"error": {"code": "invalid_request"}})) is None
+    assert failed_generation(SimpleNamespace(status_code=429, body=None)) is None
+
+
+def test_reasks_once_with_the_error():
+    prompts = []
+
+    class Reask:
+        def invoke(self, prompt):
+            prompts.append(prompt)
+            return SimpleNamespace(content='{"subject": "Re: Hi", "body": "Done."}')
+
+    value = complete_structured("not json", ReplyDraft, "test_reask", "Draft a reply.", Reask())
+    assert value == {"subject": "Re: Hi", "body": "Done."}
+    assert len(prompts) == 1
+    assert prompts[0].startswith("Draft a reply.") and "not json" in prompts[0]
+    route = metrics.routes[("test_reask", route_model("test_reask"))]
+    assert route["reasks"] == 1 and route["invalid"] == 0